@@ -0,0 +1,134 @@
+"""
+Memory benchmark of the in-memory snapshot representation.
+
+Loads the same catalog twice, once from the original courses.json layout into the original dict backed Course/Cert
+objects that create a new Cert per (course, cert) pair and once with kuali_driver.read_snapshot(), and compares the
+memory each keeps alive. The private memory of a mapped binary snapshot (see mmap_store) is reported as well, its
+pages are shared by every worker through the page cache.
+
+Usage:
+    python benchmarks/bench_memory.py                       # synthetic snapshot of 900 experiences
+    python benchmarks/bench_memory.py --experiences 2000
+    python benchmarks/bench_memory.py --snapshot SNHU-Shortcut/courses.json
+"""
+import os
+import sys
+import gc
+import json
+import argparse
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import kuali_driver as kd
+from mmap_store import write_mmap_snapshot, MmapCourseIndex
+from synthetic import make_catalog, make_records
+
+
+class LegacyCourse:
+    # The Course class as it was before __slots__ and the shared CertTable
+    def __init__(self, title, crdts, catalog):
+        self.title = title
+        self.credits = crdts
+        self.catalog = catalog
+        self.Certifications = []
+
+    def add_certification(self, crt):
+        self.Certifications.append(crt)
+
+
+class LegacyCert:
+    def __init__(self, title, courses, provider, pid):
+        self.title = title
+        self.courses = courses
+        self.provider = provider
+        self.pid = pid
+
+
+def legacy_read_snapshot(json_path):
+    with open(json_path, 'r') as f:
+        data = json.load(f)
+    courses = {}
+    for course_code, course_data in data.items():
+        course = LegacyCourse(course_data['title'], course_data['credits'], course_data['catalog'])
+        for cert_data in course_data['Certifications']:
+            course.add_certification(LegacyCert(cert_data['title'], None, cert_data['provider'], cert_data['pid']))
+        courses[course_code] = course
+    return courses
+
+
+def write_legacy_snapshot(json_path, courses):
+    # The original courses.json layout, every certification repeated under each of its courses
+    data = {}
+    for course_code, course in courses.items():
+        data[course_code] = {
+            'title': course.title,
+            'credits': course.credits,
+            'catalog': course.catalog,
+            'Certifications': [{'title': cert.title, 'provider': cert.provider, 'pid': cert.pid}
+                               for cert in course.Certifications]
+        }
+    with open(json_path, 'w') as f:
+        json.dump(data, f)
+
+
+def retained_size(loader, json_path):
+    """
+    Returns the number of bytes still allocated after loader(json_path) returned, i.e. the size of the loaded courses.
+    """
+    gc.collect()
+    tracemalloc.start()
+    courses = loader(json_path)
+    gc.collect()
+    size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size, peak, courses
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--snapshot', help='Path of an existing courses.json to measure')
+    parser.add_argument('--experiences', type=int, default=900, help='Experiences in the synthetic snapshot')
+    args = parser.parse_args()
+
+    if args.snapshot:
+        courses, certs = kd.read_snapshot(args.snapshot)
+    else:
+        catalog = make_catalog(args.experiences)
+        courses, certs = kd.build_snapshot(catalog['catalog'], make_records(catalog))
+    work_dir = tempfile.mkdtemp()
+    legacy_path = os.path.join(work_dir, 'legacy.json')
+    json_path = os.path.join(work_dir, 'courses.json')
+    write_legacy_snapshot(legacy_path, courses)
+    kd.write_snapshot(json_path, courses, certs)
+    mmap_path = os.path.join(work_dir, 'courses.bin')
+    write_mmap_snapshot(mmap_path, courses, certs)
+    del courses, certs
+
+    legacy_size, legacy_peak, legacy = retained_size(legacy_read_snapshot, legacy_path)
+    compact_size, compact_peak, (compact, _) = retained_size(kd.read_snapshot, json_path)
+    mmap_size, mmap_peak, mapped = retained_size(lambda path: MmapCourseIndex(path, kd._snapshot_stamp(path)),
+                                                 mmap_path)
+
+    links = sum(len(course.Certifications) for course in legacy.values())
+    certs = len({cert.pid for course in legacy.values() for cert in course.Certifications})
+    print(f"Snapshot: {os.path.getsize(legacy_path) / 1024:.0f} KiB before, {os.path.getsize(json_path) / 1024:.0f} KiB "
+          f"after")
+    print(f"Courses: {len(legacy)}  Certifications: {certs}  Course-cert links: {links}")
+    print(f"{'':10}{'retained':>14}{'peak':>14}")
+    print(f"{'before':10}{legacy_size / 1024:>11.0f} KiB{legacy_peak / 1024:>11.0f} KiB")
+    print(f"{'after':10}{compact_size / 1024:>11.0f} KiB{compact_peak / 1024:>11.0f} KiB")
+    print(f"{'mmap':10}{mmap_size / 1024:>11.0f} KiB{mmap_peak / 1024:>11.0f} KiB"
+          f"   + {os.path.getsize(mmap_path) / 1024:.0f} KiB shared courses.bin")
+    print(f"Retained size reduced by {100 * (1 - compact_size / legacy_size):.1f}%")
+
+    # Both representations must expose the same data
+    for course_code, course in legacy.items():
+        assert [(c.title, c.provider, c.pid) for c in course.Certifications] == \
+               [(c.title, c.provider, c.pid) for c in compact[course_code].Certifications] == \
+               [(c.title, c.provider, c.pid) for c in mapped.courses[course_code].Certifications]
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+Micro-benchmark of the rulesAchievementCriteria parsing stage.
+
+Compares the original inline parsing, which evaluates every XPath expression from its string twice per statement,
+with kuali_crawler.parse_rules() and its precompiled expressions, and with parse_batch() on a process pool.
+
+Payloads are read from a directory of recorded experience responses, one JSON file per experience such as the
+experience/<catalog> directory of kuali_stub.py fixtures or the experience_cache/<catalog> directory of a refresh.
+Without a directory a synthetic catalog is generated.
+
+Usage:
+    python benchmarks/bench_parse.py
+    python benchmarks/bench_parse.py --payloads SNHU-Shortcut/experience_cache/<catalog> --processes 4
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lxml import html
+from kuali_crawler import parse_rules, parse_batch
+from synthetic import make_catalog
+
+
+def legacy_parse_rules(rules_html):
+    # The parsing loop as it was written in get_courses()
+    rules = []
+    course_html = html.fromstring(rules_html)
+    for statement in course_html.xpath("//li[contains(@data-test, 'ruleView-')]"):
+        course_code = statement.xpath(".//a/text()")[0] if statement.xpath(".//a/text()") else None
+        credit_count = statement.xpath(".//span[1]/text()")[0] if statement.xpath(".//span[1]/text()") else None
+        if not course_code and not credit_count:
+            continue
+        rules.append((course_code, credit_count))
+    return rules
+
+
+def load_payloads(directory):
+    payloads = []
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith('.json'):
+            continue
+        with open(os.path.join(directory, name), 'r') as f:
+            data = json.load(f)
+        # Experience cache entries keep the response under 'raw'
+        data = data.get('raw', data)
+        if data.get('rulesAchievementCriteria'):
+            payloads.append(data['rulesAchievementCriteria'])
+    return payloads
+
+
+def measure(name, function, payloads, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(payloads)
+        best = min(best, time.perf_counter() - start)
+    print(f"{name:32}{best * 1000:>10.1f} ms{len(payloads) / best:>12.0f} experiences/s")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--payloads', help='Directory of recorded experience responses')
+    parser.add_argument('--experiences', type=int, default=900, help='Experiences in the synthetic catalog')
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 2, help='Processes of the pooled run')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per variant, the best run is reported')
+    args = parser.parse_args()
+
+    if args.payloads:
+        payloads = load_payloads(args.payloads)
+    else:
+        catalog = make_catalog(args.experiences)
+        payloads = [detail['rulesAchievementCriteria'] for detail in catalog['details'].values()]
+    print(f"{len(payloads)} payloads, best of {args.repeat} runs")
+
+    legacy = measure('legacy inline xpath', lambda p: [legacy_parse_rules(h) for h in p], payloads, args.repeat)
+    compiled = measure('compiled xpath', lambda p: [parse_rules(h) for h in p], payloads, args.repeat)
+    pooled = measure(f'compiled xpath, {args.processes} processes',
+                     lambda p: parse_batch(p, args.processes), payloads, args.repeat)
+
+    # Every variant must produce the same rules
+    assert legacy == compiled == pooled
+
+
+if __name__ == '__main__':
+    main()
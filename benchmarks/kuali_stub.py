@@ -0,0 +1,244 @@
+"""
+Record/replay stand-in for the Kuali catalog API.
+
+record      Captures the catalog list, the experience list of the active catalog and every experience detail from the
+            live API (or KUALI_API_URL) into a fixtures directory.
+synthesize  Writes a synthetic catalog (see synthetic.py) into a fixtures directory with the same layout.
+serve       Serves a fixtures directory on the same paths as the Kuali API, with optional latency and error injection
+            and optional ETag validators.
+
+Fixtures layout:
+    <fixtures>/catalogs.json
+    <fixtures>/experiences/<catalog>.json
+    <fixtures>/experience/<catalog>/<pid>.json
+
+Usage:
+    python benchmarks/kuali_stub.py record benchmarks/fixtures/live
+    python benchmarks/kuali_stub.py synthesize benchmarks/fixtures/synthetic --experiences 900
+    python benchmarks/kuali_stub.py serve benchmarks/fixtures/live --port 8765 --latency 80 --error-rate 0.02
+    python benchmarks/kuali_stub.py serve benchmarks/fixtures/live --etags
+    KUALI_API_URL=http://127.0.0.1:8765/api/v1 python cron_update.py
+"""
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import hashlib
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+API_PREFIX = '/api/v1'
+
+
+def _write_json(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(data, f)
+
+
+def record(fixtures, workers=None):
+    """
+    Record the active catalog of the Kuali API into a fixtures directory.
+
+    :param fixtures: The fixtures directory
+    :param workers: The number of experiences fetched in parallel
+    :return: The number of experiences recorded
+    """
+    from kuali_crawler import KualiCrawler
+    with KualiCrawler(workers) as crawler:
+        catalogs = crawler.fetch_json('/catalog/public/catalogs/')
+        _write_json(os.path.join(fixtures, 'catalogs.json'), catalogs)
+        catalog = crawler.get_catalog()
+        experiences = crawler.get_experiences(catalog)
+        _write_json(os.path.join(fixtures, 'experiences', catalog + '.json'), experiences)
+        pids = [crt['pid'] for crt in experiences if crt['title']]
+        for pid, experience in zip(pids, crawler.map_experiences(catalog, pids)):
+            _write_json(os.path.join(fixtures, 'experience', catalog, pid + '.json'), experience)
+    return len(pids)
+
+
+def synthesize(fixtures, experiences=900, seed=0):
+    """
+    Write a synthetic catalog into a fixtures directory.
+
+    :return: The number of experiences written
+    """
+    from synthetic import make_catalog
+    catalog = make_catalog(experiences, seed)
+    _write_json(os.path.join(fixtures, 'catalogs.json'), catalog['catalogs'])
+    _write_json(os.path.join(fixtures, 'experiences', catalog['catalog'] + '.json'), catalog['experiences'])
+    for pid, detail in catalog['details'].items():
+        _write_json(os.path.join(fixtures, 'experience', catalog['catalog'], pid + '.json'), detail)
+    return len(catalog['details'])
+
+
+class StubServer:
+    """
+    This class serves a fixtures directory on the paths of the Kuali API. Every response is delayed by latency
+    milliseconds plus up to jitter milliseconds, and a share of the experience requests given by error_rate fails with
+    a 503 so the retries of the crawler are exercised. Fixture files are read once and kept in memory.
+
+    With etags set every response carries an ETag of its body, and a request whose If-None-Match matches it is answered
+    with a 304 so the conditional requests of the crawler are exercised.
+
+    The server runs on a background thread, use it as a context manager or call start() and stop().
+    """
+    def __init__(self, fixtures, host='127.0.0.1', port=0, latency=0, jitter=0, error_rate=0.0, seed=0, etags=False):
+        self.fixtures = fixtures
+        self.latency = latency / 1000
+        self.jitter = jitter / 1000
+        self.error_rate = error_rate
+        self.etags = etags
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.errors = 0
+        self.not_modified = 0
+        self._bodies = {}
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}{API_PREFIX}"
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name='kuali-stub', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def serve_forever(self):
+        self.httpd.serve_forever()
+
+    def _fixture_path(self, path):
+        if not path.startswith(API_PREFIX + '/catalog/'):
+            return None
+        parts = [part for part in path[len(API_PREFIX) + 1:].split('/') if part]
+        if parts == ['catalog', 'public', 'catalogs']:
+            return os.path.join(self.fixtures, 'catalogs.json')
+        if len(parts) == 3 and parts[1] == 'experiences':
+            return os.path.join(self.fixtures, 'experiences', parts[2] + '.json')
+        if len(parts) == 4 and parts[1] == 'experience':
+            return os.path.join(self.fixtures, 'experience', parts[2], parts[3] + '.json')
+        return None
+
+    def body(self, path):
+        """
+        Returns the encoded fixture served for a request path, or None if there is none.
+        """
+        with self._lock:
+            if path not in self._bodies:
+                fixture = self._fixture_path(path.split('?', 1)[0])
+                if fixture is None or not os.path.isfile(fixture):
+                    self._bodies[path] = None
+                else:
+                    with open(fixture, 'rb') as f:
+                        self._bodies[path] = f.read()
+            return self._bodies[path]
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                with stub._lock:
+                    stub.requests += 1
+                    delay = stub.latency + stub.random.random() * stub.jitter
+                    fail = '/catalog/experience/' in self.path and stub.random.random() < stub.error_rate
+                    if fail:
+                        stub.errors += 1
+                if delay:
+                    time.sleep(delay)
+
+                body = None if fail else stub.body(self.path)
+                etag = None
+                if fail:
+                    self.send_response(503)
+                    body = b'{"error": "injected failure"}'
+                elif body is None:
+                    self.send_response(404)
+                    body = b'{"error": "no fixture"}'
+                elif stub.etags:
+                    etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+                    if self.headers.get('If-None-Match') == etag:
+                        with stub._lock:
+                            stub.not_modified += 1
+                        body = b''
+                        self.send_response(304)
+                    else:
+                        self.send_response(200)
+                else:
+                    self.send_response(200)
+                if etag:
+                    self.send_header('ETag', etag)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    record_parser = commands.add_parser('record', help='Record the live Kuali API into fixtures')
+    record_parser.add_argument('fixtures')
+    record_parser.add_argument('--workers', type=int, default=None)
+
+    synthesize_parser = commands.add_parser('synthesize', help='Write a synthetic catalog into fixtures')
+    synthesize_parser.add_argument('fixtures')
+    synthesize_parser.add_argument('--experiences', type=int, default=900)
+    synthesize_parser.add_argument('--seed', type=int, default=0)
+
+    serve_parser = commands.add_parser('serve', help='Serve fixtures on the paths of the Kuali API')
+    serve_parser.add_argument('fixtures')
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--port', type=int, default=8765)
+    serve_parser.add_argument('--latency', type=float, default=0, help='Delay of every response in milliseconds')
+    serve_parser.add_argument('--jitter', type=float, default=0, help='Random extra delay in milliseconds')
+    serve_parser.add_argument('--error-rate', type=float, default=0.0,
+                              help='Share of experience requests answered with a 503')
+    serve_parser.add_argument('--etags', action='store_true',
+                              help='Send ETags and answer matching If-None-Match requests with a 304')
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        print(f"Recorded {record(args.fixtures, args.workers)} experiences into {args.fixtures}")
+    elif args.command == 'synthesize':
+        print(f"Wrote {synthesize(args.fixtures, args.experiences, args.seed)} experiences into {args.fixtures}")
+    else:
+        stub = StubServer(args.fixtures, args.host, args.port, args.latency, args.jitter, args.error_rate,
+                          etags=args.etags)
+        print(f"Serving {args.fixtures} on {stub.url}")
+        try:
+            stub.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
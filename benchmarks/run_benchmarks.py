@@ -0,0 +1,190 @@
+"""
+Offline benchmark suite for SNHU Shortcut.
+
+Runs every benchmark against a kuali_stub.StubServer, so no request reaches snhu.kuali.co and runs are reproducible:
+
+crawl_full          get_courses() without an experience cache
+crawl_incremental   get_courses() with a warm experience cache
+load_cold           get_course_index() parsing courses.json into a new index
+load_warm           get_course_index() answered from the index in memory
+lookup_exact        CourseIndex.get() of known course codes
+lookup_partial      CourseIndex.search() of partial course codes
+render_exact        dash_app.update_output() of an exact course code with empty render caches (skipped without Dash)
+render_partial      dash_app.update_output() of a partial course code with empty render caches (skipped without Dash)
+render_exact_hit    render_exact answered from dash_app.render_cache (skipped without Dash)
+render_partial_hit  render_partial answered from dash_app.render_cache (skipped without Dash)
+
+Results are written to benchmarks/results/<date>-<commit>.json. Pass an earlier result file to --compare to print
+the change of every benchmark against it.
+
+Usage:
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --fixtures benchmarks/fixtures/live --latency 80 --error-rate 0.01
+    python benchmarks/run_benchmarks.py --compare benchmarks/results/<earlier>.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+sys.path.insert(0, REPO_DIR)
+
+import kuali_crawler
+import kuali_driver as kd
+from kuali_stub import StubServer, synthesize
+
+EXACT_QUERIES = 20
+PARTIAL_QUERIES = ['ELE', 'IT2', 'GEN1', 'MAT', '1', 'CS3']
+
+
+def timed(function, repeat, number=1):
+    """
+    Run function number times per round for repeat rounds and return the per call timings in milliseconds.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        times.append((time.perf_counter() - start) / number)
+    return {'median_ms': statistics.median(times) * 1000, 'min_ms': min(times) * 1000, 'runs': repeat * number}
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def import_dash_app():
+    # dash_app loads its assets relative to the repository, import it from there
+    cwd = os.getcwd()
+    os.chdir(REPO_DIR)
+    try:
+        import dash_app
+        return dash_app
+    except ImportError:
+        return None
+    finally:
+        os.chdir(cwd)
+
+
+def run(args):
+    dash_app = import_dash_app()
+    fixtures = args.fixtures
+    if not fixtures:
+        fixtures = os.path.join(tempfile.mkdtemp(), 'fixtures')
+        synthesize(fixtures, args.experiences)
+
+    results = {}
+    work_dir = tempfile.mkdtemp()
+    os.chdir(work_dir)
+    with StubServer(fixtures, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate) as stub:
+        kuali_crawler.API_URL = stub.url
+        cache_dir = os.path.join(kd.get_data_path(), 'experience_cache')
+
+        results['crawl_full'] = timed(lambda: kd.get_courses(args.workers), args.crawl_repeat)
+        kd.get_courses(args.workers, cache_dir)
+        results['crawl_incremental'] = timed(lambda: kd.get_courses(args.workers, cache_dir), args.crawl_repeat)
+        results['crawl_full']['requests'] = stub.requests
+        results['crawl_full']['injected_errors'] = stub.errors
+
+        # Write the snapshot the serving benchmarks load
+        kd.load_courses(force=True, workers=args.workers)
+
+    def load_cold():
+        kd._course_index = None
+        kd.get_course_index()
+
+    results['load_cold'] = timed(load_cold, args.repeat)
+    index = kd.get_course_index()
+    results['load_warm'] = timed(kd.get_course_index, args.repeat, 1000)
+
+    codes = [code for code in index.courses if isinstance(code, str)][:EXACT_QUERIES]
+    results['lookup_exact'] = timed(lambda: [index.get(code) for code in codes], args.repeat, 100)
+    results['lookup_exact']['queries'] = len(codes)
+    results['lookup_partial'] = timed(lambda: [index.search(query) for query in PARTIAL_QUERIES], args.repeat, 100)
+    results['lookup_partial']['queries'] = len(PARTIAL_QUERIES)
+
+    if dash_app is not None:
+        # update_output logs every call, keep the access log out of the report
+        dash_app.access_log.disabled = True
+
+        def render(course_id):
+            # Empty the caches first, so every call renders the result instead of returning a cached one
+            dash_app.render_cache.clear()
+            dash_app.partial_rows_cache.clear()
+            dash_app.update_output(1, 0, '/', course_id)
+
+        with dash_app.app.server.test_request_context('/'):
+            results['render_exact'] = timed(lambda: render(codes[0]), args.repeat, 20)
+            results['render_partial'] = timed(lambda: render('ELE'), args.repeat, 20)
+            results['render_exact_hit'] = timed(lambda: dash_app.update_output(1, 0, '/', codes[0]), args.repeat, 20)
+            results['render_partial_hit'] = timed(lambda: dash_app.update_output(1, 0, '/', 'ELE'), args.repeat, 20)
+
+    return {
+        'commit': git_commit(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'fixtures': args.fixtures or f"synthetic:{args.experiences}",
+        'settings': {'latency': args.latency, 'jitter': args.jitter, 'error_rate': args.error_rate,
+                     'workers': args.workers},
+        'courses': len(index),
+        'results': results
+    }
+
+
+def report(run_result, baseline=None):
+    print(f"commit {run_result['commit']}, {run_result['courses']} courses, fixtures {run_result['fixtures']}")
+    print(f"{'benchmark':20}{'median':>12}{'min':>12}{'baseline':>12}{'change':>10}")
+    for name, result in run_result['results'].items():
+        line = f"{name:20}{result['median_ms']:>9.3f} ms{result['min_ms']:>9.3f} ms"
+        previous = baseline['results'].get(name) if baseline else None
+        if previous:
+            change = (result['median_ms'] / previous['median_ms'] - 1) * 100
+            line += f"{previous['median_ms']:>9.3f} ms{change:>+9.1f}%"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--fixtures', help='Fixtures directory, a synthetic catalog is generated when not given')
+    parser.add_argument('--experiences', type=int, default=900, help='Experiences in the synthetic catalog')
+    parser.add_argument('--latency', type=float, default=20, help='Stub response delay in milliseconds')
+    parser.add_argument('--jitter', type=float, default=10, help='Stub random extra delay in milliseconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of stub experience requests failing')
+    parser.add_argument('--workers', type=int, default=None, help='Crawl workers')
+    parser.add_argument('--repeat', type=int, default=5, help='Rounds of the serving benchmarks')
+    parser.add_argument('--crawl-repeat', type=int, default=1, help='Rounds of the crawl benchmarks')
+    parser.add_argument('--compare', help='Earlier result file to compare against')
+    parser.add_argument('--output', default=os.path.join(BENCHMARKS_DIR, 'results'), help='Results directory')
+    parser.add_argument('--no-save', action='store_true', help="Don't write the result file")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+
+    run_result = run(args)
+    report(run_result, baseline)
+
+    if not args.no_save:
+        os.makedirs(args.output, exist_ok=True)
+        path = os.path.join(args.output, f"{time.strftime('%Y%m%d-%H%M%S')}-{run_result['commit']}.json")
+        with open(path, 'w') as f:
+            json.dump(run_result, f, indent=2)
+        print(f"Results written to {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Synthetic Kuali catalog shaped like the SNHU catalog, used by the benchmarks when no recorded data is available.
+
+The generator is seeded so every run produces the same catalog. Experiences have the same fields the crawler reads
+(pid, title, groupFilter2 and rulesAchievementCriteria) and the rules HTML follows the markup Kuali renders.
+"""
+import random
+
+DEPARTMENTS = ['ACC', 'BUS', 'CJ', 'COM', 'CS', 'CYB', 'DAT', 'ECO', 'ENG', 'FIN', 'GEN', 'HCM', 'HIS', 'HRM', 'IT',
+               'MAT', 'MKT', 'OL', 'PHL', 'PSY', 'QSO', 'SCI', 'SOC', 'SPA']
+TOPICS = ['Security', 'Networking', 'Cloud Practitioner', 'Project Management', 'Data Analytics', 'Linux Essentials',
+          'Accounting Fundamentals', 'Python Programming', 'Customer Service', 'Leadership', 'Supply Chain',
+          'Digital Marketing', 'Human Resources', 'Database Administration', 'Penetration Testing', 'Web Development']
+VENDORS = ['CompTIA', 'Cisco', 'Amazon Web Services', 'Microsoft', 'Google', 'Oracle', 'ISC2', 'EC-Council',
+           'Project Management Institute', 'Salesforce', 'Red Hat', 'VMware', 'ACE', 'NCCRS', 'Sophia Learning',
+           'Study.com', 'Straighterline', 'Saylor Academy']
+
+
+def make_catalog(experiences=900, seed=0, catalog_id='synthetic-catalog'):
+    """
+    Generate a catalog with the given number of experiences.
+
+    :param experiences: The number of experiences in the catalog
+    :param seed: Seed of the random generator
+    :param catalog_id: The _id of the current catalog
+    :return: A dictionary with the catalogs list, the experience summaries and the experience details by pid
+    """
+    rng = random.Random(seed)
+    codes = sorted({f"{dept}{rng.randint(1, 5)}{rng.randint(0, 9)}{rng.randint(0, 9)}"
+                    for dept in DEPARTMENTS for _ in range(60)})
+    codes += [f"{dept}{level}ELE" for dept in DEPARTMENTS for level in range(1, 5)]
+    providers = [f"{vendor} " if rng.random() < 0.3 else vendor for vendor in VENDORS]
+    providers += [f"{rng.choice(VENDORS)} Partner {i}" for i in range(120)]
+
+    summaries = []
+    details = {}
+    for i in range(experiences):
+        pid = f"{rng.getrandbits(40):010x}"
+        title = f"{rng.choice(VENDORS)} {rng.choice(TOPICS)} {rng.choice(['', 'Associate ', 'Professional '])}" \
+                f"({rng.choice('ABCDEFGHJK')}{rng.randint(0, 9)}-{rng.randint(100, 999)})"
+        # A few experiences are unpublished and have no title, the crawler skips those
+        summaries.append({'pid': pid, 'title': title if rng.random() > 0.02 else '', 'id': f"{i:06d}"})
+
+        statements = []
+        for position, code in enumerate(rng.sample(codes, min(len(codes), rng.choice([1, 1, 2, 2, 3, 4, 6, 9])))):
+            statements.append(
+                f'<li data-test="ruleView-A.{position + 1}"><div>Complete <a href="#/courses/view/{code}">{code}</a>'
+                f' - <span>{rng.choice(["3", "3", "3", "1", "4"])}</span> credits</div></li>')
+        if rng.random() < 0.1:
+            statements.append('<li data-test="ruleView-B"><div>Submit a copy of the certificate</div></li>')
+        details[pid] = {
+            'pid': pid,
+            'title': title,
+            'groupFilter2': {'name': rng.choice(providers), 'id': f"{rng.getrandbits(32):08x}"},
+            'rulesAchievementCriteria': '<div><ul data-test="ruleView">' + ''.join(statements) + '</ul></div>'
+        }
+
+    catalogs = [
+        {'_id': 'previous-catalog', 'title': 'Previous', 'startDate': '2000-01-01', 'endDate': '2020-01-01'},
+        {'_id': catalog_id, 'title': 'Current', 'startDate': '2020-01-01', 'endDate': '2099-12-31'}
+    ]
+    return {'catalog': catalog_id, 'catalogs': catalogs, 'experiences': summaries, 'details': details}
+
+
+def make_records(catalog):
+    """
+    Parse a generated catalog into the experience records KualiCrawler.crawl_experiences() returns.
+    """
+    from kuali_crawler import parse_rules
+    records = []
+    for summary in catalog['experiences']:
+        if summary['title']:
+            detail = catalog['details'][summary['pid']]
+            records.append({
+                'title': summary['title'],
+                'provider': detail['groupFilter2']['name'],
+                'pid': summary['pid'],
+                'rules': parse_rules(detail['rulesAchievementCriteria'])
+            })
+    return records
@@ -1,17 +1,54 @@
-from kuali_driver import load_courses
+from kuali_driver import load_courses, precrawl_upcoming, last_crawl_report
+from kuali_crawler import last_crawl_stats
+import argparse
 import time
 
-def update_chron():
+def update_chron(workers=None, full=False):
     """
     Update the JSON file with the latest data from the Kuali API.
     This script is ideal to be run as a cron job to keep the data fresh
-    and updated regularly.
+    and updated regularly. The timings of the refresh are written to crawl_report.json next to courses.json, set
+    KUALI_CRAWL_PROFILE=1 to also write a cProfile dump to crawl_profile.prof.
+
+    :param workers: Number of experiences fetched from the Kuali API in parallel. Defaults to the
+                    KUALI_CRAWL_WORKERS environment variable or kuali_crawler.DEFAULT_WORKERS.
+    :param full: True to re-fetch every experience instead of only the ones that changed since the last run.
     """
     try:
-        load_courses(force=True)
-        print(f"[INFO - {time.strftime('%Y-%m-%d %H:%M:%S')}] Kuali courses updated successfully from chron job.")
+        load_courses(force=True, workers=workers, full=full)
+        print(f"[INFO - {time.strftime('%Y-%m-%d %H:%M:%S')}] Kuali courses updated successfully from chron job. "
+              f"{last_crawl_stats}")
+        # The full report with the slowest experiences is in crawl_report.json next to courses.json
+        requests = last_crawl_report['requests']
+        print(f"[INFO - {time.strftime('%Y-%m-%d %H:%M:%S')}] Refresh took {last_crawl_report['duration']}s "
+              f"{last_crawl_report['stages']}, {requests['count']} requests, {requests['bytes']} bytes, "
+              f"{requests['retries']} retries, latency {requests['latency_ms']}")
+        # What changed since the previous version, served by /api/changes
+        changes = last_crawl_report.get('changes')
+        if changes:
+            print(f"[INFO - {time.strftime('%Y-%m-%d %H:%M:%S')}] Snapshot version {last_crawl_report['version']}: "
+                  f"{changes['added']} course certifications added, {changes['removed']} removed, "
+                  f"{changes['added_courses']} courses added, {changes['removed_courses']} removed, "
+                  f"{changes['renamed_certs']} certifications and {changes['renamed_providers']} providers renamed, "
+                  f"{changes['changed_providers']} certifications moved to another provider")
     except Exception as e:
         print(f"[ERROR - {time.strftime('%Y-%m-%d %H:%M:%S')}] An error occurred while updating Kuali courses:\n{e}")
 
+    # Crawl and stage the next catalog ahead of its start date so the rollover only swaps in the staged snapshot
+    try:
+        catalog = precrawl_upcoming(workers=workers)
+        if catalog:
+            print(f"[INFO - {time.strftime('%Y-%m-%d %H:%M:%S')}] Upcoming catalog {catalog} pre-crawled and staged. "
+                  f"{last_crawl_stats}")
+    except Exception as e:
+        print(f"[ERROR - {time.strftime('%Y-%m-%d %H:%M:%S')}] An error occurred while pre-crawling the upcoming "
+              f"catalog:\n{e}")
+
 if __name__ == "__main__":
-    update_chron()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Refresh courses.json from the Kuali API.")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Number of experiences fetched from the Kuali API in parallel.")
+    parser.add_argument("--full", action="store_true",
+                        help="Re-fetch every experience instead of only the ones that changed.")
+    args = parser.parse_args()
+    update_chron(workers=args.workers, full=args.full)
\ No newline at end of file
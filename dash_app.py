@@ -1,11 +1,26 @@
 from dash import html, Dash, dcc, dash_table, Input, Output, State, exceptions, callback_context
+from collections import OrderedDict
+from urllib.parse import quote, unquote
+from operator import itemgetter
 from dotenv import load_dotenv
 import kuali_driver as kd
+import metrics
+import threading
 import base64
+import hmac
 import flask
+import gzip
+import json
+import math
 import time
+import csv
+import io
 import os
-import re
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 #########################
 # Dashboard Layout / View
@@ -201,9 +216,144 @@ app.layout = html.Div(
     ]
 )
 
-def alphanum_key(s):
-    # Split string into list of strings and integers
-    return [int(text) if text.isdigit() else text.lower() for text in re.split('([0-9]+)', s)]
+# The partial match table is only created by update_output, so callbacks are validated against the layout together
+# with the table that its paging callback targets
+app.validation_layout = html.Div([
+    app.layout,
+    dcc.Store(id="partial_query"),
+    dash_table.DataTable(id="partial_table")
+])
+
+class RenderCache:
+    """
+    LRU cache of rendered results, keyed by the sanitized course ID (or any other request key) and the version of the
+    snapshot they were rendered from. The whole cache is dropped as soon as a different snapshot version is
+    requested, so results of an old snapshot are never served after a refresh.
+    """
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, course_id, version):
+        with self._lock:
+            if version != self.version:
+                self._entries.clear()
+                self.version = version
+            rendered = self._entries.get(course_id)
+            if rendered is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._entries.move_to_end(course_id)
+            return rendered
+
+    def put(self, course_id, version, rendered):
+        with self._lock:
+            if version != self.version:
+                return
+            self._entries[course_id] = rendered
+            self._entries.move_to_end(course_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._entries), 'maxsize': self.maxsize, 'version': self.version, 'hits': self.hits,
+                    'misses': self.misses, 'evictions': self.evictions}
+
+
+# Rendered results of the most requested course IDs
+render_cache = RenderCache(int(os.getenv("RENDER_CACHE_SIZE", "512")))
+
+# Rows per page of the partial match table
+PARTIAL_PAGE_SIZE = int(os.getenv("PARTIAL_PAGE_SIZE", "25"))
+
+# Rows of the partial match tables being paged through, per course ID and sort order
+partial_rows_cache = RenderCache(int(os.getenv("PARTIAL_ROWS_CACHE_SIZE", "128")))
+
+# Encoded API response bodies of the most requested course IDs
+api_cache = RenderCache(int(os.getenv("API_CACHE_SIZE", "1024")))
+
+# Cache-Control max-age of API responses in seconds. When unset, a response may be cached until the snapshot it was
+# built from is due for a refresh.
+API_MAX_AGE = os.getenv("API_MAX_AGE")
+
+# Cache-Control max-age of API responses built from a recorded snapshot version, which never changes once recorded
+VERSION_MAX_AGE = 365 * 86400
+
+# API responses smaller than this many bytes are sent uncompressed
+API_COMPRESS_MIN_SIZE = int(os.getenv("API_COMPRESS_MIN_SIZE", "512"))
+
+# Most course IDs a single batch request may look up
+API_BATCH_LIMIT = int(os.getenv("API_BATCH_LIMIT", "200"))
+
+# Courses written per chunk of a streamed export
+EXPORT_CHUNK_ROWS = 200
+
+# Bearer token required to pin or roll back the served snapshot version. Without it those endpoints are disabled.
+ADMIN_TOKEN = os.getenv("SNHU_SHORTCUT_ADMIN_TOKEN")
+
+# Request counters and stage latency histograms of this process, served on /metrics
+request_metrics = metrics.Metrics()
+
+# Access log written by a background thread, so logging doesn't hold up requests
+access_log = metrics.access_logger()
+
+def current_route():
+    """
+    Returns the route pattern of the current request, e.g. /api/course/<course_id>, used as the route of its metrics.
+    """
+    rule = flask.request.url_rule
+    return rule.rule if rule is not None else "unmatched"
+
+def stage(name):
+    """
+    Context manager timing a stage of the current request, such as index, lookup, render or serialize.
+    """
+    return request_metrics.timer(current_route(), name)
+
+@app.server.before_request
+def start_request_timer():
+    flask.g.request_start = time.perf_counter()
+
+@app.server.after_request
+def record_request(response):
+    route = current_route()
+    request_metrics.count(route, response.status_code)
+    start = flask.g.get("request_start")
+    if start is not None:
+        request_metrics.observe(route, "total", time.perf_counter() - start)
+    return response
+
+@app.server.route("/metrics")
+def get_metrics():
+    """
+    Flask route exposing the request metrics of this worker, together with the counters of the course index and the
+    response caches, in the Prometheus text format.
+    :return: Plain text response with the metrics.
+    """
+    index_stats = kd.get_index_stats()
+    gauges = [
+        ("index_courses", "Courses in the served snapshot.", index_stats['courses']),
+        ("index_hits", "Lookups answered by the course index in memory.", index_stats['hits']),
+        ("index_reloads", "Rebuilds of the course index from the snapshot.", index_stats['reloads']),
+        ("index_fetches", "Refreshes of the snapshot from the Kuali API.", index_stats['fetches'])
+    ]
+    for cache_name, cache in (("render_cache", render_cache), ("api_cache", api_cache)):
+        cache_stats = cache.stats()
+        gauges += [(f"{cache_name}_{counter}", f"{counter.capitalize()} of the {cache_name}.", cache_stats[counter])
+                   for counter in ("size", "hits", "misses", "evictions")]
+    return flask.Response(request_metrics.render(gauges), mimetype="text/plain; version=0.0.4")
 
 @app.callback(
     Output("output_div", "children"),
@@ -222,6 +372,10 @@ def update_output(n_clicks, n_submit, pathname, course_id):
     :return: HTML content to display the course alternatives or an error message.
     """
     if pathname and pathname != "/":
+        # /cert/<pid> and /provider/<name> browse a certification or a provider instead of a course
+        view, _, value = pathname.lstrip("/").partition("/")
+        if view in BROWSE_VIEWS and value:
+            return render_browse(view, unquote(value))
         course_id = pathname.lstrip("/")
         n_clicks = 1  # Simulate a submit
 
@@ -230,9 +384,8 @@ def update_output(n_clicks, n_submit, pathname, course_id):
     # Sanitize the course_id input
     course_id = kd.sanitize_input(course_id)
 
-    # Log the request with timestamp and course ID. Print statements go to Passenger log.
-    print(f"[INFO - {time.strftime('%Y-%m-%d %H:%M:%S')}] {flask.request.remote_addr} called: "
-          f"course_id={'Homepage' if not course_id else course_id} by UI")
+    # Log the request with course ID. The access log goes to the Passenger log.
+    access_log.info(f"{flask.request.remote_addr} called: course_id={'Homepage' if not course_id else course_id} by UI")
 
     # If no button has been clicked or submitted, return a default message
     if trigger and trigger > 0:
@@ -240,79 +393,376 @@ def update_output(n_clicks, n_submit, pathname, course_id):
         if not course_id:
             return html.Div("Please enter a valid course ID.", style={'color': 'red', 'textAlign': 'center'})
 
-        # Fetch alternatives for the given course ID
-        alternatives_root = kd.load_courses()
+        # Fetch alternatives for the given course ID. Rendered results are reused until a new snapshot is loaded.
+        with stage("index"):
+            alternatives_root = kd.get_course_index()
+        rendered = render_cache.get(course_id, alternatives_root.version)
+        if rendered is None:
+            rendered = render_alternatives(course_id, alternatives_root)
+            render_cache.put(course_id, alternatives_root.version, rendered)
+        return rendered
+
+    # If no button has been clicked or submitted, return a default message
+    return html.Div("Enter a course ID and click Submit to see alternatives.", style={'textAlign': 'center'})
+
+def render_alternatives(course_id, alternatives_root):
+    """
+    Render the result components for a sanitized course ID.
+    :param course_id: The sanitized course ID to look up.
+    :param alternatives_root: The course index to look the course ID up in.
+    :return: HTML content to display the course alternatives or an error message.
+    """
+    with stage("lookup"):
         alternatives = alternatives_root.get(course_id)
+        # If the course_id is not found in the loaded courses, look it up as a partial match. The matching keys
+        # are returned by the substring index already sorted by alphanum_key.
+        matches = None if alternatives else alternatives_root.search(course_id)
+        # If nothing matches either, the course_id is probably mistyped, suggest the closest course codes
+        suggestions = None if alternatives or matches else alternatives_root.suggest(course_id)
+
+    with stage("render"):
+        return build_alternatives(course_id, alternatives_root, alternatives, matches, suggestions)
+
+def build_alternatives(course_id, alternatives_root, alternatives, matches, suggestions=None):
+    """
+    Build the result components of a course ID from its lookup.
+    :param course_id: The sanitized course ID that was looked up.
+    :param alternatives_root: The course index the course ID was looked up in.
+    :param alternatives: The Course found for the course ID, or None.
+    :param matches: The course codes partially matching the course ID if no course was found.
+    :param suggestions: The course codes closest to the course ID if nothing matched it.
+    :return: HTML content to display the course alternatives or an error message.
+    """
+    if not alternatives:
+        if matches:
+            # This assumes that the course_id is a partial match such as a department code or a course number.
+            # Return a data table with Course ID, Title, and Provider. Only the first page is sent, the table requests
+            # the other pages and sort orders from update_partial_page.
+            rows = partial_rows(course_id, alternatives_root, matches=matches)
+            return html.Div([
+                html.H3(f"Certifications for {course_id}"),
+                dcc.Store(id="partial_query", data=course_id),
+                dash_table.DataTable(
+                    id="partial_table",
+                    columns=[
+                        {"name": "Course ID (Partial)", "id": "Course ID (Partial)"},
+                        {"name": "Provider", "id": "Provider"},
+                        {"name": "Title", "id": "Title"}
+                    ],
+                    data=[row for rank, row in rows[:PARTIAL_PAGE_SIZE]],
+                    page_action="custom",
+                    page_current=0,
+                    page_size=PARTIAL_PAGE_SIZE,
+                    page_count=max(1, math.ceil(len(rows) / PARTIAL_PAGE_SIZE)),
+                    sort_action="custom",
+                    sort_mode="single",
+                    sort_by=[],
+                    cell_selectable=False,
+                    style_table={'width': '100%', 'margin': 'auto', 'overflowX': 'auto'},
+                    style_cell={'textAlign': 'left', 'padding': '8px', 'minWidth': '100px', 'maxWidth': '300px',
+                                'whiteSpace': 'normal'},
+                    style_header={'fontWeight': 'bold'}
+                )
+            ], style={'textAlign': 'center'})
+
+        elif suggestions:
+            # Link every suggested course code to its own page, like a course ID typed into the URL
+            links = []
+            for code in suggestions:
+                if links:
+                    links.append(", ")
+                links.append(dcc.Link(code, href=f"/{code}"))
+            return html.Div([
+                html.Div(f"No certifications found for {course_id}.", style={'color': 'red'}),
+                html.Div(["Did you mean: "] + links + ["?"])
+            ], style={'textAlign': 'center'})
+
+        else:
+            return html.Div(f"No certifications found for {course_id}.",
+                            style={'color': 'red', 'textAlign': 'center'})
+
+    alternatives = alternatives.Certifications
+
+    if not isinstance(alternatives, list) or not alternatives:
+        return html.Div(f"No certifications found for {course_id}.", style={'color': 'red', 'textAlign': 'center'})
+
+    if not alternatives:
+        return html.Div(f"No certifications found for {course_id}.", style={'color': 'red'})
+
+    # Link every certification to the courses it satisfies and every provider to its certifications
+    data = [
+        {"Title": markdown_link(cert.title.strip(), f"/cert/{quote(cert.pid, safe='')}"),
+         "Provider": markdown_link(cert.provider.strip(), f"/provider/{quote(cert.provider.strip(), safe='')}")}
+        for cert in alternatives
+    ]
+
+    return html.Div([
+        html.H3(f"Certifications for {course_id}"),
+        dash_table.DataTable(
+            columns=[
+                {"name": "Provider", "id": "Provider", "presentation": "markdown"},
+                {"name": "Title", "id": "Title", "presentation": "markdown"}
+            ],
+            data=data,
+            markdown_options={"link_target": "_self"},
+            cell_selectable=False,
+            style_table={'width': '100%', 'margin': 'auto', 'overflowX': 'auto'},
+            style_cell={'textAlign': 'left', 'padding': '8px', 'minWidth': '100px', 'maxWidth': '300px', 'whiteSpace': 'normal'},
+            style_header={'fontWeight': 'bold'}
+        )
+    ], style={'textAlign': 'center'})
+
+def markdown_link(text, href):
+    """
+    Returns a markdown link for a cell of a DataTable column with markdown presentation.
+    """
+    for char in "\\`*_[]<>":
+        text = text.replace(char, "\\" + char)
+    return f"[{text}]({href})"
 
-        if not alternatives:
-            # If the course_id is not found in the loaded courses, return an error message
-            if any(course_id in key for key in alternatives_root.keys()):
-                # This assumes that the course_id is a partial match such as a department code or a course number.
-                # Return a data table with Course ID, Title, and Provider
-                data = []
-                # Iterate through the alternatives_root to find matching course objects
-                for key in alternatives_root.keys():
-                    # Check if the course_id is a substring of the key
-                    if course_id in key:
-                        # If it is, extract the certifications for that course
-                        for cert in alternatives_root[key].Certifications:
-                            # Append the relevant data to the list
-                            data.append({
-                                "Provider": cert.provider.strip(),
-                                "Title": cert.title.strip(),
-                                "Course ID (Partial)": key
-                            })
-                return html.Div([
-                    html.H3(f"Certifications for {course_id}"),
-                    dash_table.DataTable(
-                        columns=[
-                            {"name": "Course ID (Partial)", "id": "Course ID (Partial)"},
-                            {"name": "Provider", "id": "Provider"},
-                            {"name": "Title", "id": "Title"}
-                        ],
-                        data= sorted(data, key=lambda x: alphanum_key(x["Course ID (Partial)"])),
-                        cell_selectable=False,
-                        style_table={'width': '100%', 'margin': 'auto', 'overflowX': 'auto'},
-                        style_cell={'textAlign': 'left', 'padding': '8px', 'minWidth': '100px', 'maxWidth': '300px',
-                                    'whiteSpace': 'normal'},
-                        style_header={'fontWeight': 'bold'}
-                    )
-                ], style={'textAlign': 'center'})
+# Path prefixes of the browse views, /cert/<pid> and /provider/<name>
+BROWSE_VIEWS = ("cert", "provider")
 
+def render_browse(view, value):
+    """
+    Render the page of a certification or a provider, cached like the results of a course ID.
+    :param view: Either cert or provider.
+    :param value: The pid of the certification or the name of the provider.
+    :return: HTML content to display the certification or provider, or an error message.
+    """
+    access_log.info(f"{flask.request.remote_addr} called: {view}={value} by UI")
+    with stage("index"):
+        alternatives_root = kd.get_course_index()
+    key = (view, value if view == "cert" else kd.provider_key(value))
+    rendered = render_cache.get(key, alternatives_root.version)
+    if rendered is None:
+        with stage("lookup"):
+            if view == "cert":
+                found = alternatives_root.get_cert(value)
+            else:
+                found = alternatives_root.get_provider(value)
+        with stage("render"):
+            if found is None:
+                rendered = html.Div(f"No certifications found for {value}.",
+                                    style={'color': 'red', 'textAlign': 'center'})
+            elif view == "cert":
+                rendered = build_cert(found)
             else:
-                return html.Div(f"No certifications found for {course_id}.",
-                                style={'color': 'red', 'textAlign': 'center'})
-
-        alternatives = alternatives.Certifications
-
-        if not isinstance(alternatives, list) or not alternatives:
-            return html.Div(f"No certifications found for {course_id}.", style={'color': 'red', 'textAlign': 'center'})
-
-        if not alternatives:
-            return html.Div(f"No certifications found for {course_id}.", style={'color': 'red'})
-
-        data = [
-            {"Title": cert.title.strip(), "Provider": cert.provider.strip()}
-            for cert in alternatives
-        ]
-
-        return html.Div([
-            html.H3(f"Certifications for {course_id}"),
-            dash_table.DataTable(
-                columns=[
-                    {"name": "Provider", "id": "Provider"},
-                    {"name": "Title", "id": "Title"}
-                ],
-                data=data,
-                cell_selectable=False,
-                style_table={'width': '100%', 'margin': 'auto', 'overflowX': 'auto'},
-                style_cell={'textAlign': 'left', 'padding': '8px', 'minWidth': '100px', 'maxWidth': '300px', 'whiteSpace': 'normal'},
-                style_header={'fontWeight': 'bold'}
-            )
-        ], style={'textAlign': 'center'})
+                rendered = build_provider(found)
+        render_cache.put(key, alternatives_root.version, rendered)
+    return rendered
 
-    # If no button has been clicked or submitted, return a default message
-    return html.Div("Enter a course ID and click Submit to see alternatives.", style={'textAlign': 'center'})
+def build_cert(cert):
+    """
+    Build the page of a certification, listing every course it satisfies.
+    :param cert: The Cert with its courses.
+    :return: HTML content to display the certification.
+    """
+    provider = cert.provider.strip()
+    data = [{"Course ID": markdown_link(course.title, f"/{quote(course.title, safe='')}"), "Credits": course.credits}
+            for course in cert.courses]
+    return html.Div([
+        html.H3(f"Courses satisfied by {cert.title.strip()}"),
+        html.P(["Provider: ", dcc.Link(provider, href=f"/provider/{quote(provider, safe='')}")]),
+        dash_table.DataTable(
+            columns=[
+                {"name": "Course ID", "id": "Course ID", "presentation": "markdown"},
+                {"name": "Credits", "id": "Credits"}
+            ],
+            data=data,
+            markdown_options={"link_target": "_self"},
+            cell_selectable=False,
+            style_table={'width': '100%', 'margin': 'auto', 'overflowX': 'auto'},
+            style_cell={'textAlign': 'left', 'padding': '8px', 'minWidth': '100px', 'maxWidth': '300px',
+                        'whiteSpace': 'normal'},
+            style_header={'fontWeight': 'bold'}
+        )
+    ], style={'textAlign': 'center'})
+
+def build_provider(certs):
+    """
+    Build the page of a provider, listing every certification it offers.
+    :param certs: The Certs of the provider sorted by title.
+    :return: HTML content to display the provider.
+    """
+    data = [{"Title": markdown_link(cert.title.strip(), f"/cert/{quote(cert.pid, safe='')}")} for cert in certs]
+    return html.Div([
+        html.H3(f"Certifications from {certs[0].provider.strip()}"),
+        dash_table.DataTable(
+            columns=[{"name": "Title", "id": "Title", "presentation": "markdown"}],
+            data=data,
+            markdown_options={"link_target": "_self"},
+            cell_selectable=False,
+            style_table={'width': '100%', 'margin': 'auto', 'overflowX': 'auto'},
+            style_cell={'textAlign': 'left', 'padding': '8px', 'minWidth': '100px', 'maxWidth': '300px',
+                        'whiteSpace': 'normal'},
+            style_header={'fontWeight': 'bold'}
+        )
+    ], style={'textAlign': 'center'})
+
+def partial_rows(course_id, alternatives_root, sort_by=None, matches=None):
+    """
+    This function will return the rows of the partial match table of a course ID as (rank, row) pairs sorted by the
+    column of sort_by. The rank is the position of the course code in the alphanum_key order the index computed when
+    the snapshot was loaded, so the default order and the Course ID column sort never compare codes again. Rows are
+    cached per course ID, column and direction for the snapshot version.
+    :param course_id: The sanitized partial course ID.
+    :param alternatives_root: The course index to look the course ID up in.
+    :param sort_by: The sort_by property of the table, sorted by course code when empty.
+    :param matches: The course codes partially matching the course ID, if they were already looked up.
+    :return: A list of (rank, row) tuples.
+    """
+    column, direction = (sort_by[0]["column_id"], sort_by[0]["direction"]) if sort_by else (None, "asc")
+    if column not in ("Provider", "Title"):
+        column = None
+    rows = partial_rows_cache.get((course_id, column, direction), alternatives_root.version)
+    if rows is not None:
+        return rows
+
+    rows = partial_rows_cache.get((course_id, None, "asc"), alternatives_root.version)
+    if rows is None:
+        if matches is None:
+            matches = alternatives_root.search(course_id)
+        rows = []
+        # Iterate through the matching course objects
+        for rank, key in enumerate(matches):
+            # Extract the certifications for that course
+            for cert in alternatives_root.get(key).Certifications:
+                # Append the relevant data to the list
+                rows.append((rank, {
+                    "Provider": cert.provider.strip(),
+                    "Title": cert.title.strip(),
+                    "Course ID (Partial)": key
+                }))
+        partial_rows_cache.put((course_id, None, "asc"), alternatives_root.version, rows)
+
+    if column is not None or direction == "desc":
+        # sorted() is stable, so rows of the same course keep the order of its certifications either way
+        if column is None:
+            key = itemgetter(0)
+        else:
+            key = lambda item: item[1][column].casefold()
+        rows = sorted(rows, key=key, reverse=direction == "desc")
+        partial_rows_cache.put((course_id, column, direction), alternatives_root.version, rows)
+    return rows
+
+@app.callback(
+    Output("partial_table", "data"),
+    Input("partial_table", "page_current"),
+    Input("partial_table", "sort_by"),
+    State("partial_query", "data"),
+    prevent_initial_call=True
+)
+def update_partial_page(page_current, sort_by, course_id):
+    """
+    Callback sending the page of the partial match table that is shown, in the order the table is sorted by.
+    :param page_current: The page shown by the table, starting at 0.
+    :param sort_by: The column and direction the table is sorted by.
+    :param course_id: The partial course ID the table shows.
+    :return: The rows of the page.
+    """
+    if not course_id:
+        raise exceptions.PreventUpdate
+    with stage("index"):
+        alternatives_root = kd.get_course_index()
+    with stage("render"):
+        rows = partial_rows(course_id, alternatives_root, sort_by)
+        start = (page_current or 0) * PARTIAL_PAGE_SIZE
+        return [row for rank, row in rows[start:start + PARTIAL_PAGE_SIZE]]
+
+def api_max_age(index):
+    """
+    This function will return the Cache-Control max-age of a response built from a snapshot index, which is the time
+    left until the snapshot is due for a refresh or its catalog ends, unless API_MAX_AGE is set.
+    :param index: The course index the response was built from.
+    :return: The max-age in seconds.
+    """
+    if API_MAX_AGE is not None:
+        return int(API_MAX_AGE)
+    remaining = kd.SNAPSHOT_MAX_AGE - (time.time() - index.stamp[0] / 1e9)
+    if index.valid_until is not None:
+        remaining = min(remaining, index.valid_until - time.time())
+    return max(0, int(remaining))
+
+def accepted_encoding():
+    """
+    Returns the best content encoding accepted by the current request, 'br' (if brotli is installed), 'gzip' or None.
+    """
+    accept = flask.request.accept_encodings
+    if brotli is not None and accept['br']:
+        return 'br'
+    if accept['gzip']:
+        return 'gzip'
+    return None
+
+def encode_body(body, encoding):
+    """
+    Compresses a response body with the given content encoding. Small bodies are left as they are since compressing
+    them saves nothing.
+    :return: The encoded body and its encoding, None if it was left uncompressed.
+    """
+    if encoding is None or len(body) < API_COMPRESS_MIN_SIZE:
+        return body, None
+    if encoding == 'br':
+        return brotli.compress(body), 'br'
+    return gzip.compress(body, mtime=0), 'gzip'
+
+def is_not_modified(index):
+    """
+    Returns True if the validators of the current request still match the snapshot index, so it can be answered with
+    a 304.
+    """
+    request = flask.request
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(index.version)
+    return request.if_modified_since is not None and request.if_modified_since.timestamp() >= int(index.stamp[0] / 1e9)
+
+def set_cache_headers(response, index, immutable=False):
+    """
+    Sets the validators and Cache-Control of a response built from a snapshot index.
+    :param immutable: True for a response built from a recorded snapshot version, which is cached for VERSION_MAX_AGE
+                      instead of until the snapshot is due for a refresh.
+    :return: The response.
+    """
+    # The body depends on the accepted encodings, so does the ETag, which is weak for that reason
+    response.set_etag(index.version, weak=True)
+    response.last_modified = int(index.stamp[0] / 1e9)
+    response.cache_control.public = True
+    response.cache_control.max_age = VERSION_MAX_AGE if immutable else api_max_age(index)
+    response.cache_control.immutable = immutable
+    response.vary.add('Accept-Encoding')
+    return response
+
+def cached_json_response(key, index, build):
+    """
+    This function will return the JSON response of an API request with validators derived from the snapshot version.
+    A conditional request whose validators still match is answered with a 304 without building anything, otherwise the
+    encoded body is taken from api_cache or built once with build() and cached for the snapshot version.
+    :param key: The key of the requested resource, e.g. the sanitized course ID.
+    :param index: The course index the response is built from.
+    :param build: Function returning the data of the response.
+    :return: The flask response.
+    """
+    if is_not_modified(index):
+        return set_cache_headers(flask.Response(status=304), index)
+
+    encoding = accepted_encoding()
+    cached = api_cache.get((key, encoding), index.version)
+    if cached is None:
+        with stage("serialize"):
+            cached = encode_body(flask.jsonify(build()).get_data(), encoding)
+        api_cache.put((key, encoding), index.version, cached)
+    body, content_encoding = cached
+    response = flask.Response(body, mimetype='application/json')
+    if content_encoding:
+        response.headers['Content-Encoding'] = content_encoding
+    return set_cache_headers(response, index)
+
+def course_certifications(course):
+    """
+    Returns the certifications of a course as they are sent by the API.
+    """
+    return [{"Title": cert.title.strip(), "Provider": cert.provider.strip()} for cert in course.Certifications]
 
 @app.server.route("/api/course/<course_id>")
 def get_course_info(course_id):
@@ -324,30 +774,320 @@ def get_course_info(course_id):
     # Sanitize the course_id input
     course_id = kd.sanitize_input(course_id)
 
-    # Log the request with timestamp and course ID
-    print(f"[INFO - {time.strftime('%Y-%m-%d %H:%M:%S')}] {flask.request.remote_addr} called: course_id={course_id} by API")
+    # Log the request with course ID
+    access_log.info(f"{flask.request.remote_addr} called: course_id={course_id} by API")
 
-    alternatives = kd.load_courses().get(course_id)
-
-    if not alternatives:
-        print(f"[ERROR - {time.strftime('%Y-%m-%d %H:%M:%S')}] {flask.request.remote_addr} called: course_id={course_id}"
-              f" - No certifications found")
-        return flask.jsonify({"error": f"No certifications found for {course_id}."}), 404
-
-    alternatives = alternatives.Certifications
+    with stage("index"):
+        index = kd.get_course_index()
+    with stage("lookup"):
+        course = index.get(course_id)
+        alternatives = course.Certifications if course else None
 
     if not isinstance(alternatives, list) or not alternatives:
-        print(
-            f"[ERROR - {time.strftime('%Y-%m-%d %H:%M:%S')}] {flask.request.remote_addr} called: course_id={course_id}"
-            f" - No certifications found")
-        return flask.jsonify({"error": f"No certifications found for {course_id}."}), 404
+        access_log.error(f"{flask.request.remote_addr} called: course_id={course_id} - No certifications found")
+        with stage("suggest"):
+            suggestions = index.suggest(course_id)
+        return flask.jsonify({"error": f"No certifications found for {course_id}.", "suggestions": suggestions}), 404
 
-    data = [
+    return cached_json_response(course_id, index, lambda: [
         {"Title": cert.title.strip(), "Provider": cert.provider.strip()}
         for cert in alternatives
-    ]
+    ])
+
+@app.server.route("/api/cert/<pid>")
+def get_cert_info(pid):
+    """
+    Flask route to get a certification and every course it satisfies by its pid.
+    :param pid: The pid of the certification.
+    :return: JSON response with the certification and its courses or error message.
+    """
+    access_log.info(f"{flask.request.remote_addr} called: pid={pid} by API")
+
+    with stage("index"):
+        index = kd.get_course_index()
+    with stage("lookup"):
+        cert = index.get_cert(pid)
+
+    if cert is None:
+        access_log.error(f"{flask.request.remote_addr} called: pid={pid} - No certification found")
+        return flask.jsonify({"error": f"No certification found for {pid}."}), 404
+
+    return cached_json_response(("cert", pid), index, lambda: {
+        "pid": cert.pid,
+        "Title": cert.title.strip(),
+        "Provider": cert.provider.strip(),
+        "Courses": [{"Course": course.title, "Credits": course.credits} for course in cert.courses]
+    })
+
+@app.server.route("/api/provider/<path:name>")
+def get_provider_info(name):
+    """
+    Flask route to get every certification of a provider. Provider names are matched ignoring case and extra
+    whitespace.
+    :param name: The name of the provider.
+    :return: JSON response with the certifications of the provider or error message.
+    """
+    access_log.info(f"{flask.request.remote_addr} called: provider={name} by API")
 
-    return flask.jsonify(data)
+    with stage("index"):
+        index = kd.get_course_index()
+    with stage("lookup"):
+        certs = index.get_provider(name)
+
+    if not certs:
+        access_log.error(f"{flask.request.remote_addr} called: provider={name} - No certifications found")
+        return flask.jsonify({"error": f"No certifications found for {name}."}), 404
+
+    return cached_json_response(("provider", kd.provider_key(name)), index, lambda: {
+        "Provider": certs[0].provider.strip(),
+        "Certifications": [{"Title": cert.title.strip(), "pid": cert.pid} for cert in certs]
+    })
+
+@app.server.route("/api/versions")
+def get_versions():
+    """
+    Flask route listing the versions of the snapshot history, oldest first, with the served and the pinned version.
+    :return: JSON response with the versions.
+    """
+    access_log.info(f"{flask.request.remote_addr} called: versions by API")
+    manifest = kd.get_history().manifest()
+    return flask.jsonify({"serving": manifest["serving"], "pinned": manifest["pinned"],
+                          "versions": manifest["versions"]})
+
+@app.server.route("/api/versions/<version_id>/course/<course_id>")
+def get_version_course_info(version_id, course_id):
+    """
+    Flask route to get the certifications a course mapped to in an earlier version of the snapshot.
+    :param version_id: The id of the version, as listed by /api/versions.
+    :param course_id: The course ID to look up.
+    :return: JSON response with course information or error message.
+    """
+    course_id = kd.sanitize_input(course_id)
+    access_log.info(f"{flask.request.remote_addr} called: course_id={course_id} of version {version_id} by API")
+
+    with stage("index"):
+        try:
+            index = kd.get_version_index(version_id)
+        except ValueError as e:
+            return flask.jsonify({"error": str(e)}), 404
+        except FileNotFoundError:
+            # The version was pruned by a refresh between listing and loading it
+            return flask.jsonify({"error": f"Snapshot version {version_id} is no longer in the history."}), 410
+    if is_not_modified(index):
+        return set_cache_headers(flask.Response(status=304), index, immutable=True)
+    with stage("lookup"):
+        course = index.get(course_id)
+    if not course or not course.Certifications:
+        return flask.jsonify({"error": f"No certifications found for {course_id} in version {version_id}."}), 404
+    return set_cache_headers(flask.jsonify(course_certifications(course)), index, immutable=True)
+
+@app.server.route("/api/changes")
+def get_changes():
+    """
+    Flask route serving the feed of changes between snapshot versions, so a consumer can sync incrementally instead of
+    downloading the export again. Given since=<version> only the changes recorded after that version are returned.
+    :return: JSON response with the changes, oldest first, and the latest version, or 410 if since is no longer in the
+             history and the consumer has to download the export again.
+    """
+    since = flask.request.args.get("since") or None
+    access_log.info(f"{flask.request.remote_addr} called: changes since {since} by API")
+
+    history = kd.get_history()
+    with stage("lookup"):
+        versions = history.versions()
+        changes = history.changes(since)
+    if changes is None:
+        return flask.jsonify({"error": f"Snapshot version {since} is no longer in the history, download the export "
+                                       f"again."}), 410
+    # The latest version the feed covers, read from the feed itself since a refresh may have recorded another version
+    # in the meantime. It is the since of the next request.
+    if changes:
+        latest = changes[-1]["version"]
+    else:
+        latest = since or (versions[-1]["id"] if versions else None)
+    return flask.jsonify({"since": since, "latest": latest, "changes": changes})
+
+def is_admin():
+    """
+    Returns True if the current request carries the ADMIN_TOKEN as its bearer token.
+    """
+    authorization = flask.request.headers.get("Authorization", "")
+    return ADMIN_TOKEN is not None and hmac.compare_digest(authorization.encode(), f"Bearer {ADMIN_TOKEN}".encode())
+
+def change_served_version(change, error_status):
+    """
+    Applies a change of the served snapshot version for a request carrying the ADMIN_TOKEN.
+    :param change: Function making the change and returning the id of the served version.
+    :param error_status: Status of the response when the change raises a ValueError.
+    :return: JSON response with the served and the pinned version or error message, 409 while a refresh is running.
+    """
+    if not is_admin():
+        access_log.error(f"{flask.request.remote_addr} called: {flask.request.path} - Not authorized")
+        return flask.jsonify({"error": "Not authorized."}), 403
+
+    access_log.info(f"{flask.request.remote_addr} called: {flask.request.path} by API")
+    try:
+        serving = change()
+    except ValueError as e:
+        return flask.jsonify({"error": str(e)}), error_status
+    except BlockingIOError as e:
+        access_log.error(f"{flask.request.remote_addr} called: {flask.request.path} - {e}")
+        return flask.jsonify({"error": str(e)}), 409
+    return flask.jsonify({"serving": serving, "pinned": kd.get_history().pinned})
+
+@app.server.route("/api/versions/<version_id>/pin", methods=["POST"])
+def pin_version(version_id):
+    """
+    Flask route to serve a version of the snapshot history until it is unpinned.
+    """
+    def pin():
+        kd.pin_version(version_id)
+        return version_id
+    return change_served_version(pin, 404)
+
+@app.server.route("/api/versions/rollback", methods=["POST"])
+def rollback_version():
+    """
+    Flask route to pin the version of the snapshot history recorded before the served one.
+    """
+    return change_served_version(kd.rollback_version, 409)
+
+@app.server.route("/api/versions/unpin", methods=["POST"])
+def unpin_version():
+    """
+    Flask route to remove the pin and serve the newest version of the snapshot history again.
+    """
+    return change_served_version(kd.unpin_version, 409)
+
+@app.server.route("/api/courses", methods=["GET", "POST"])
+def get_courses_info():
+    """
+    Flask route to look up many course IDs in one request, e.g. a whole degree plan. The course IDs are either given as
+    a comma separated ids parameter (GET /api/courses?ids=IT145,MAT240) or as a JSON list, bare or under "ids", in the
+    body of a POST.
+    :return: JSON response with the certifications of every course found and the course IDs that were not found.
+    """
+    if flask.request.method == "POST":
+        payload = flask.request.get_json(silent=True)
+        if isinstance(payload, dict):
+            payload = payload.get("ids")
+        if not isinstance(payload, list) or not all(isinstance(course_id, str) for course_id in payload):
+            return flask.jsonify({"error": "Expected a JSON list of course IDs."}), 400
+        course_ids = payload
+    else:
+        course_ids = flask.request.args.get("ids", "").split(",")
+
+    # Sanitize every course ID, dropping empty ones and duplicates while keeping the order they were requested in
+    course_ids = list(dict.fromkeys(course_id for course_id in map(kd.sanitize_input, course_ids) if course_id))
+
+    access_log.info(f"{flask.request.remote_addr} called: {len(course_ids)} course_ids by batch API")
+
+    if not course_ids:
+        return flask.jsonify({"error": "No course IDs given."}), 400
+    if len(course_ids) > API_BATCH_LIMIT:
+        return flask.jsonify({"error": f"At most {API_BATCH_LIMIT} course IDs can be looked up at once."}), 400
+
+    with stage("index"):
+        index = kd.get_course_index()
+    with stage("lookup"):
+        found = [(course_id, index.get(course_id)) for course_id in course_ids]
+
+    def build():
+        courses = {}
+        not_found = []
+        for course_id, course in found:
+            if course and course.Certifications:
+                courses[course_id] = course_certifications(course)
+            else:
+                not_found.append(course_id)
+        return {"courses": courses, "not_found": not_found}
+
+    if flask.request.method == "POST":
+        return flask.jsonify(build())
+    return cached_json_response(("batch",) + tuple(course_ids), index, build)
+
+@app.server.route("/api/export.<export_format>")
+def export_courses(export_format):
+    """
+    Flask route streaming the full course to certification mapping as NDJSON (one course per line) or CSV (one course
+    and certification pair per row). Rows are generated from the served index while they are sent, so the export is
+    never held in memory as a whole.
+    :param export_format: Either ndjson or csv.
+    :return: Streaming response with the export.
+    """
+    if export_format not in ("ndjson", "csv"):
+        return flask.jsonify({"error": "Export format must be ndjson or csv."}), 404
+
+    access_log.info(f"{flask.request.remote_addr} called: export.{export_format}")
+
+    with stage("index"):
+        index = kd.get_course_index()
+    if is_not_modified(index):
+        return set_cache_headers(flask.Response(status=304), index)
+
+    if export_format == "ndjson":
+        rows, mimetype = export_ndjson(index), "application/x-ndjson"
+    else:
+        rows, mimetype = export_csv(index), "text/csv"
+    response = flask.Response(timed_stream(rows, current_route()), mimetype=mimetype)
+    response.headers["Content-Disposition"] = f"attachment; filename=snhu-shortcut-{index.version}.{export_format}"
+    return set_cache_headers(response, index)
+
+def timed_stream(chunks, route):
+    """
+    Passes the chunks of a streamed response through and records the time spent generating them as its serialize
+    stage, since a streamed body is only generated after the request handler has returned.
+    """
+    elapsed = 0.0
+    iterator = iter(chunks)
+    while True:
+        start = time.perf_counter()
+        chunk = next(iterator, None)
+        elapsed += time.perf_counter() - start
+        if chunk is None:
+            break
+        yield chunk
+    request_metrics.observe(route, "serialize", elapsed)
+
+def export_ndjson(index):
+    """
+    Generates the NDJSON export of a course index, a JSON object per course in alphanum_key order.
+    """
+    lines = []
+    for code in index.codes():
+        course = index.get(code)
+        lines.append(json.dumps({
+            "Course": code,
+            "Title": course.title,
+            "Credits": course.credits,
+            "Catalog": course.catalog,
+            "Certifications": [{"Title": cert.title.strip(), "Provider": cert.provider.strip(), "pid": cert.pid}
+                               for cert in course.Certifications]
+        }) + "\n")
+        # Send the rows in chunks rather than one write per course
+        if len(lines) >= EXPORT_CHUNK_ROWS:
+            yield "".join(lines)
+            lines = []
+    if lines:
+        yield "".join(lines)
+
+def export_csv(index):
+    """
+    Generates the CSV export of a course index, a row per course and certification in alphanum_key order.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["Course", "Course Title", "Credits", "Catalog", "pid", "Title", "Provider"])
+    for rows, code in enumerate(index.codes(), 1):
+        course = index.get(code)
+        for cert in course.Certifications:
+            writer.writerow([code, course.title, course.credits, course.catalog, cert.pid, cert.title.strip(),
+                             cert.provider.strip()])
+        if rows % EXPORT_CHUNK_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
 
 @app.callback(
     Output("course_id", "value"),
@@ -355,6 +1095,9 @@ def get_course_info(course_id):
 )
 def set_input_from_url(pathname):
     if pathname and pathname != "/":
+        # The browse views aren't a course ID
+        if pathname.lstrip("/").partition("/")[0] in BROWSE_VIEWS:
+            return ""
         return pathname.lstrip("/")
     return ""
 
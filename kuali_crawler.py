@@ -0,0 +1,704 @@
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from requests.adapters import HTTPAdapter
+from lxml import etree, html
+import threading
+import requests
+import hashlib
+import json
+import time
+import os
+
+# Base URL of the public Kuali catalog API. Can be pointed elsewhere with the KUALI_API_URL environment variable.
+API_URL = os.getenv('KUALI_API_URL', 'https://snhu.kuali.co/api/v1').rstrip('/')
+
+# Number of experiences fetched in parallel when no worker count is given.
+DEFAULT_WORKERS = int(os.getenv('KUALI_CRAWL_WORKERS', '8'))
+
+# Responses with these status codes are retried with an exponential backoff.
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+# Number of processes parsing rulesAchievementCriteria HTML. With 0 the experiences are parsed in the crawling process.
+DEFAULT_PARSE_PROCESSES = int(os.getenv('KUALI_PARSE_PROCESSES', '0'))
+
+# Cached experiences whose catalog summary didn't change are trusted for up to this many seconds without a request.
+# Kuali doesn't publish modification dates in the experience summaries, so an edit to the rules of an experience that
+# leaves its summary alone goes unnoticed for at most this long. The window of each experience is cut to between half
+# and all of it by its pid, so the revalidations are spread over the refreshes instead of all falling on the same one.
+# With 0 every cached experience is revalidated on every refresh.
+CACHE_REVALIDATE_AFTER = int(os.getenv('KUALI_CACHE_REVALIDATE', str(3 * 86400)))
+
+# The catalog list is reused for at most this many seconds when no upcoming catalog is published yet, so a newly
+# published catalog is noticed well before it starts.
+CATALOG_LIST_MAX_AGE = 7 * 86400
+
+# How many seconds before an upcoming catalog starts it is pre-crawled, see kuali_driver.precrawl_upcoming().
+PRECRAWL_LEAD = int(os.getenv('KUALI_PRECRAWL_LEAD', str(3 * 86400)))
+
+# Most seconds spent on one experience, retries included. An experience that takes longer is served from the
+# experience cache if it has an entry, otherwise the crawl fails once every other experience is done.
+PID_TIMEOUT = int(os.getenv('KUALI_PID_TIMEOUT', '120'))
+
+# A checkpoint left by a failed crawl is only resumed from for this many seconds.
+CHECKPOINT_MAX_AGE = 86400
+
+# The catalog list shared by every crawler of the process and the lock that guards refreshing it.
+_catalog_windows = None
+_catalog_lock = threading.Lock()
+
+# Counters of the most recent crawl_experiences() call, i.e. how many experiences were re-fetched or re-parsed.
+last_crawl_stats = {}
+
+# Number of the slowest experiences listed in a crawl report.
+SLOWEST_EXPERIENCES = 10
+
+
+def content_hash(value):
+    """
+    Returns a stable SHA-1 hex digest of a JSON serializable value.
+    """
+    return hashlib.sha1(json.dumps(value, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+# XPath expressions of parse_rules(), compiled once per process. smart_strings=False returns plain strings instead of
+# strings that keep a reference to the parsed document alive.
+_RULE_STATEMENTS = etree.XPath("//li[contains(@data-test, 'ruleView-')]")
+_COURSE_CODE = etree.XPath(".//a/text()", smart_strings=False)
+_CREDIT_COUNT = etree.XPath(".//span[1]/text()", smart_strings=False)
+
+
+def revalidate_after(pid):
+    """
+    Returns how many seconds the cached experience of a pid is trusted without a request, see CACHE_REVALIDATE_AFTER.
+    """
+    share = int(hashlib.sha1(pid.encode('utf-8')).hexdigest()[:8], 16) / 0x100000000
+    return CACHE_REVALIDATE_AFTER * (0.5 + share / 2)
+
+
+def parse_rules(rules_html):
+    """
+    Extract the (course code, credit count) pairs from the rulesAchievementCriteria HTML of an experience. This is not
+    the HTML of the course page, but the HTML found in the API returned object. Statements with neither a course code
+    nor a credit count are skipped, either value may be None.
+
+    :param rules_html: The rulesAchievementCriteria HTML
+    :return: A list of (course code, credit count) tuples in document order
+    """
+    rules = []
+    course_html = html.fromstring(rules_html)
+    # Iterate through each course in the certification based on the xpath of the HTML
+    for statement in _RULE_STATEMENTS(course_html):
+        # Extract course code
+        course_code = _COURSE_CODE(statement)
+        course_code = course_code[0] if course_code else None
+
+        # Extract credit count
+        credit_count = _CREDIT_COUNT(statement)
+        credit_count = credit_count[0] if credit_count else None
+
+        # Skip if the course code and credit count are not found
+        if not course_code and not credit_count:
+            continue
+        rules.append((course_code, credit_count))
+    return rules
+
+
+def parse_batch(rules_htmls, processes=0, chunksize=16):
+    """
+    Parse the rulesAchievementCriteria HTML of many experiences. With processes the batch is split in chunks that are
+    parsed in parallel by a process pool, since parsing is CPU bound and threads would only take turns on the GIL.
+
+    :param rules_htmls: A list of rulesAchievementCriteria HTML strings
+    :param processes: The number of parsing processes, 0 parses in this process
+    :param chunksize: The number of experiences sent to a parsing process at once
+    :return: A list of parse_rules() results in the order of rules_htmls
+    """
+    if not processes or len(rules_htmls) <= chunksize:
+        return [parse_rules(rules_html) for rules_html in rules_htmls]
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        return list(pool.map(parse_rules, rules_htmls, chunksize=chunksize))
+
+
+class CatalogWindows:
+    """
+    This class holds the list of Kuali catalogs together with their startDate/endDate windows and the time the list was
+    fetched. It answers which catalog is active and which one comes next, and knows when the list has to be fetched
+    again: when the active catalog ends, ahead of the next catalog's start date and at least every
+    CATALOG_LIST_MAX_AGE seconds while no next catalog is published.
+    """
+    def __init__(self, catalogs, fetched):
+        self.catalogs = sorted(catalogs, key=self.start)
+        self.fetched = fetched
+
+    @staticmethod
+    def start(catalog):
+        return datetime.fromisoformat(catalog['startDate'])
+
+    @staticmethod
+    def end(catalog):
+        return datetime.fromisoformat(catalog['endDate'])
+
+    def find(self, catalog_id):
+        for catalog in self.catalogs:
+            if catalog['_id'] == catalog_id:
+                return catalog
+        return None
+
+    def active(self, date=None):
+        """
+        Returns the catalog whose start and end dates contain date, the current date by default, or None.
+        """
+        date = date or datetime.now()
+        for catalog in self.catalogs:
+            # check if date is between start and end date
+            if self.start(catalog) < date < self.end(catalog):
+                return catalog
+        return None
+
+    def upcoming(self, date=None):
+        """
+        Returns the first catalog that starts after date, the current date by default, or None.
+        """
+        date = date or datetime.now()
+        for catalog in self.catalogs:
+            if self.start(catalog) > date:
+                return catalog
+        return None
+
+    def expires(self):
+        """
+        Returns the timestamp after which the catalog list has to be fetched again.
+        """
+        expires = self.fetched + CATALOG_LIST_MAX_AGE
+        active = self.active()
+        if active:
+            expires = min(expires, self.end(active).timestamp())
+        upcoming = self.upcoming()
+        if upcoming:
+            # Fetch once more when the pre-crawl window opens, then again when the catalog starts
+            refresh_at = self.start(upcoming).timestamp() - PRECRAWL_LEAD
+            if refresh_at <= self.fetched:
+                refresh_at = self.start(upcoming).timestamp()
+            expires = min(expires, refresh_at)
+        return expires
+
+    @classmethod
+    def load(cls, path):
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        return cls(data['catalogs'], data['fetched'])
+
+    def save(self, path):
+        with open(path + '.tmp', 'w') as f:
+            json.dump({'fetched': self.fetched, 'catalogs': self.catalogs}, f)
+        os.replace(path + '.tmp', path)
+
+
+def catalog_windows():
+    """
+    Returns the CatalogWindows last resolved by any crawler in this process, or None.
+    """
+    return _catalog_windows
+
+
+class CrawlTrace:
+    """
+    This class records where the time of a crawl goes: the wall time of every stage (catalog resolution, experience
+    list, fetch, parse and whatever the caller adds, like writing the snapshot), the latency, status and size of every
+    request, the retries and the time spent on each experience. report() summarizes it for crawl_report.json.
+
+    A crawler records into its trace from every fetch thread, so every method is thread safe.
+    """
+    def __init__(self):
+        self.started = time.time()
+        self.stages = {}
+        self.latencies = []
+        self.statuses = {}
+        self.bytes = 0
+        self.retries = {}
+        self.experiences = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Context manager adding the wall time of its block to a stage.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.stages[name] = self.stages.get(name, 0.0) + elapsed
+
+    def request(self, seconds, status, size):
+        with self._lock:
+            self.latencies.append(seconds)
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+            self.bytes += size
+
+    def retry(self, reason):
+        with self._lock:
+            self.retries[reason] = self.retries.get(reason, 0) + 1
+
+    def experience(self, pid, seconds):
+        with self._lock:
+            self.experiences[pid] = seconds
+
+    @staticmethod
+    def percentile(ordered, share):
+        """
+        Returns the nearest-rank percentile of an ascending list.
+        """
+        if not ordered:
+            return None
+        return ordered[min(len(ordered) - 1, max(0, int(round(share * len(ordered))) - 1))]
+
+    def report(self, **extra):
+        """
+        This function will summarize the trace as a JSON serializable dictionary.
+
+        :param extra: Additional keys of the report, i.e. the catalog or the crawl counters
+        :return: The report
+        """
+        with self._lock:
+            latencies = sorted(self.latencies)
+            slowest = sorted(self.experiences.items(), key=lambda item: item[1], reverse=True)[:SLOWEST_EXPERIENCES]
+            report = {
+                'started': self.started,
+                'finished': time.time(),
+                'duration': round(time.time() - self.started, 3),
+                'stages': {name: round(seconds, 3) for name, seconds in self.stages.items()},
+                'requests': {
+                    'count': len(latencies),
+                    'bytes': self.bytes,
+                    'statuses': {str(status): count for status, count in sorted(self.statuses.items())},
+                    'retries': sum(self.retries.values()),
+                    'retry_reasons': dict(self.retries),
+                    'latency_ms': {
+                        'mean': round(sum(latencies) / len(latencies) * 1000, 1) if latencies else None,
+                        **{name: None if value is None else round(value * 1000, 1) for name, value in (
+                            ('p50', self.percentile(latencies, 0.5)),
+                            ('p90', self.percentile(latencies, 0.9)),
+                            ('p99', self.percentile(latencies, 0.99)),
+                            ('max', latencies[-1] if latencies else None))}
+                    }
+                },
+                'slowest': [{'pid': pid, 'seconds': round(seconds, 3)} for pid, seconds in slowest]
+            }
+        report.update(extra)
+        return report
+
+    def save(self, path, **extra):
+        """
+        Writes the report of the trace to path, replacing the previous report at once, and returns it.
+        """
+        report = self.report(**extra)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(report, f, indent=2)
+        os.replace(path + '.tmp', path)
+        return report
+
+
+class ExperienceCache:
+    """
+    This class is an on disk cache of the raw Kuali response of every experience, one JSON file per catalog and pid.
+    Next to the raw response each entry keeps the hash of the experience summary it was fetched for, the hash of the
+    response content, any ETag/Last-Modified validators Kuali sent and the parsed course rules. A refresh uses these to
+    skip the request, or at least the parse, of every experience that didn't change.
+    """
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+
+    def _catalog_dir(self, catalog):
+        return os.path.join(self.cache_dir, catalog)
+
+    def _path(self, catalog, pid):
+        return os.path.join(self._catalog_dir(catalog), pid + '.json')
+
+    def get(self, catalog, pid):
+        try:
+            with open(self._path(catalog, pid), 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def put(self, catalog, pid, entry):
+        # Write to a temporary file first so an interrupted crawl never leaves a truncated entry behind
+        os.makedirs(self._catalog_dir(catalog), exist_ok=True)
+        path = self._path(catalog, pid)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(entry, f)
+        os.replace(path + '.tmp', path)
+
+    def prune(self, catalog, pids):
+        """
+        Remove the entries of a catalog whose pid isn't in pids anymore.
+
+        :return: The number of entries removed
+        """
+        removed = 0
+        catalog_dir = self._catalog_dir(catalog)
+        if not os.path.isdir(catalog_dir):
+            return removed
+        for name in os.listdir(catalog_dir):
+            if name.endswith('.json') and name[:-5] not in pids:
+                os.remove(os.path.join(catalog_dir, name))
+                removed += 1
+        return removed
+
+
+class CrawlCheckpoint:
+    """
+    This class is the checkpoint of a crawl of one catalog, a JSON Lines file with one line per experience the crawl
+    fetched. Lines are appended and flushed as the experiences come in, so a crawl that fails part way leaves all of
+    its progress behind. The next crawl of the catalog resumes from it: experiences whose summary didn't change since
+    are taken from the checkpoint instead of being fetched again. The checkpoint is discarded once a crawl completes.
+    """
+    def __init__(self, checkpoint_dir, catalog):
+        self.path = os.path.join(checkpoint_dir, catalog + '.jsonl')
+        self._file = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        """
+        Returns the entries of the checkpoint indexed by pid. A checkpoint older than CHECKPOINT_MAX_AGE is ignored,
+        and so is a last line that was cut off when the crawl died.
+        """
+        entries = {}
+        try:
+            if time.time() - os.path.getmtime(self.path) > CHECKPOINT_MAX_AGE:
+                return entries
+            with open(self.path, 'r') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    entries[record['pid']] = record['entry']
+        except FileNotFoundError:
+            pass
+        return entries
+
+    def add(self, pid, entry):
+        line = json.dumps({'pid': pid, 'entry': entry}) + '\n'
+        with self._lock:
+            if self._file is None:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                self._file = open(self.path, 'a')
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def discard(self):
+        self.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class KualiCrawler:
+    """
+    This class is the crawl engine used to pull catalogs and experiences from the Kuali API. Every request goes through
+    one pooled requests.Session so connections are reused, and experiences are fetched in parallel by a thread pool
+    that never runs more than the configured number of workers at once.
+
+    Requests that fail with a connection error or a 429/5xx status are retried with an exponential backoff. The
+    Retry-After header is honored when Kuali sends one.
+
+    Fetching and parsing are separate stages: the thread pool only fetches, then every experience that changed is
+    parsed in one batch by parse_batch(), on a process pool when parse_processes is set. The time of every stage and
+    request is recorded in the CrawlTrace of the crawler.
+
+    The catalog list is shared by every crawler of the process and, when catalogs_path is given, kept on disk between
+    runs. It is only fetched again when its CatalogWindows expire.
+
+    The crawler should be used as a context manager so the session and thread pool are closed when the crawl ends.
+    """
+    def __init__(self, workers=None, retries=5, backoff=0.5, timeout=30, catalogs_path=None, parse_processes=None,
+                 trace=None, pid_timeout=None):
+        self.trace = trace or CrawlTrace()
+        self.workers = max(1, workers or DEFAULT_WORKERS)
+        self.parse_processes = DEFAULT_PARSE_PROCESSES if parse_processes is None else parse_processes
+        self.catalogs_path = catalogs_path
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.pid_timeout = PID_TIMEOUT if pid_timeout is None else pid_timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.workers)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='kuali-crawl')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        self.session.close()
+
+    def fetch_json(self, path):
+        """
+        Fetch a path of the Kuali API and return the decoded JSON body. Connection errors and 429/5xx responses are
+        retried up to self.retries times before the last error is raised.
+
+        :param path: The API path to fetch, i.e. '/catalog/public/catalogs/'
+        :return: The decoded JSON body
+        """
+        return self.fetch(path).json()
+
+    def fetch(self, path, headers=None, deadline=None):
+        """
+        Fetch a path of the Kuali API with the same retries as fetch_json() and return the response. A 304 response
+        to a conditional request is returned as is.
+
+        :param path: The API path to fetch
+        :param headers: Optional extra request headers, i.e. If-None-Match
+        :param deadline: Optional time.monotonic() after which no further attempt is made and requests.Timeout is
+                         raised. The timeout of each attempt is shortened to the time left.
+        :return: The requests.Response
+        """
+        url = API_URL + path
+        for attempt in range(self.retries + 1):
+            timeout = self.timeout
+            if deadline is not None:
+                timeout = min(timeout, deadline - time.monotonic())
+                if timeout <= 0:
+                    raise requests.Timeout(f"{path} took longer than its deadline")
+            start = time.perf_counter()
+            try:
+                response = self.session.get(url, headers=headers, timeout=timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.retries:
+                    raise
+                self.trace.retry(type(e).__name__)
+                self._sleep(self.backoff * 2 ** attempt, deadline, path)
+                continue
+            # The body is read by get() already, so this is the full time of the request
+            self.trace.request(time.perf_counter() - start, response.status_code, len(response.content))
+
+            if response.status_code in RETRY_STATUSES and attempt < self.retries:
+                self.trace.retry(str(response.status_code))
+                self._sleep(self._retry_delay(response, attempt), deadline, path)
+                continue
+
+            response.raise_for_status()
+            return response
+
+    @staticmethod
+    def _sleep(delay, deadline, path):
+        # Don't wait for a retry that would start after the deadline
+        if deadline is not None and time.monotonic() + delay >= deadline:
+            raise requests.Timeout(f"{path} took longer than its deadline")
+        time.sleep(delay)
+
+    def _retry_delay(self, response, attempt):
+        retry_after = response.headers.get('Retry-After')
+        if retry_after and retry_after.isdigit():
+            return float(retry_after)
+        return self.backoff * 2 ** attempt
+
+    def get_catalogs(self):
+        """
+        Returns the CatalogWindows of the Kuali catalogs. The cached list is used until it expires, only then the
+        full catalog list is requested again.
+
+        :return: A CatalogWindows
+        """
+        global _catalog_windows
+        with _catalog_lock:
+            windows = _catalog_windows
+            if windows is None and self.catalogs_path:
+                windows = CatalogWindows.load(self.catalogs_path)
+            if windows is None or time.time() >= windows.expires():
+                windows = CatalogWindows(self.fetch_json('/catalog/public/catalogs/'), time.time())
+                if self.catalogs_path:
+                    windows.save(self.catalogs_path)
+            _catalog_windows = windows
+        return windows
+
+    def get_catalog(self):
+        """
+        Returns the ID of the catalog whose start and end dates contain the current date.
+
+        :return: The ID of the current catalog as a string
+        """
+        catalog = self.get_catalogs().active()
+        return catalog['_id'] if catalog else None
+
+    def get_experiences(self, catalog):
+        """
+        Returns the list of experiences (certifications) published in a catalog.
+
+        :param catalog: The catalog ID
+        :return: A list of experience summaries as returned by Kuali
+        """
+        return self.fetch_json('/catalog/experiences/' + catalog)
+
+    def get_experience(self, catalog, pid):
+        """
+        Returns the full experience of one pid, including groupFilter2 and rulesAchievementCriteria.
+
+        :param catalog: The catalog ID
+        :param pid: The pid of the experience
+        :return: The experience as returned by Kuali
+        """
+        return self.fetch_json('/catalog/experience/' + catalog + '/' + pid)
+
+    def map_experiences(self, catalog, pids):
+        """
+        Fetch the experiences of every pid in parallel. The results are yielded in the same order as the pids, so
+        consumers build exactly the same structures as a sequential crawl would.
+
+        :param catalog: The catalog ID
+        :param pids: An iterable of experience pids
+        :return: A generator of experiences in pid order
+        """
+        return self.executor.map(lambda pid: self.get_experience(catalog, pid), pids)
+
+    def crawl_experiences(self, catalog, cache=None, checkpoint_dir=None):
+        """
+        Fetch and parse every titled experience of a catalog. The returned records are in catalog order and hold the
+        title, provider, pid and parsed (course code, credit count) rules of each experience.
+
+        When an ExperienceCache is given the crawl is incremental. Experiences whose summary is unchanged and whose
+        entry was validated within revalidate_after() are taken from the cache without a request. Every other cached
+        experience is requested conditionally with its ETag/Last-Modified validators, and a response is only parsed
+        again when its content hash changed. Entries of experiences that left the catalog are removed.
+
+        When a checkpoint_dir is given every fetched experience is also written to the CrawlCheckpoint of the catalog,
+        and a crawl of the catalog that failed before is resumed from its checkpoint.
+
+        An experience that takes longer than pid_timeout seconds is taken from the cache when it has an entry, as a
+        'stale' experience. Otherwise the crawl raises the timeout, but only after every other experience was fetched
+        and checkpointed.
+
+        :param catalog: The catalog ID
+        :param cache: An optional ExperienceCache
+        :param checkpoint_dir: Optional directory of the crawl checkpoints
+        :return: A list of experience records as dictionaries
+        """
+        with self.trace.stage('experience_list'):
+            data = [crt for crt in self.get_experiences(catalog) if crt['title']]
+        stats = {'experiences': len(data), 'cached': 0, 'resumed': 0, 'not_modified': 0, 'unchanged': 0,
+                 'parsed': 0, 'stale': 0, 'removed': 0}
+        checkpoint = CrawlCheckpoint(checkpoint_dir, catalog) if checkpoint_dir else None
+        resumed = checkpoint.load() if checkpoint else {}
+
+        def load(crt):
+            pid = crt['pid']
+            summary_hash = content_hash(crt)
+            entry = cache.get(catalog, pid) if cache else None
+
+            if entry and entry['summary_hash'] == summary_hash \
+                    and time.time() - entry['checked'] < revalidate_after(pid):
+                return entry, 'cached'
+
+            checkpointed = resumed.get(pid)
+            if checkpointed and checkpointed['summary_hash'] == summary_hash:
+                return checkpointed, 'resumed'
+
+            headers = {}
+            if entry and entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry and entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+
+            start = time.perf_counter()
+            try:
+                response = self.fetch('/catalog/experience/' + catalog + '/' + pid, headers=headers,
+                                      deadline=time.monotonic() + self.pid_timeout if self.pid_timeout else None)
+            except requests.Timeout:
+                if entry and entry.get('rules') is not None:
+                    return entry, 'stale'
+                raise
+            finally:
+                self.trace.experience(pid, time.perf_counter() - start)
+            if entry and response.status_code == 304:
+                outcome = 'not_modified'
+            else:
+                experience = response.json()
+                raw = {
+                    'groupFilter2': experience['groupFilter2'],
+                    'rulesAchievementCriteria': experience['rulesAchievementCriteria']
+                }
+                raw_hash = content_hash(raw)
+                if entry and entry['content_hash'] == raw_hash:
+                    outcome = 'unchanged'
+                else:
+                    # The rules are filled in by the parsing stage once every experience is fetched
+                    outcome = 'parsed'
+                    entry = {
+                        'content_hash': raw_hash,
+                        'provider': experience['groupFilter2']['name'],
+                        'rules': None,
+                        'raw': raw
+                    }
+                entry['etag'] = response.headers.get('ETag')
+                entry['last_modified'] = response.headers.get('Last-Modified')
+
+            entry['summary_hash'] = summary_hash
+            entry['checked'] = time.time()
+            # Every other outcome is in the cache already, only new and changed experiences need the checkpoint
+            if checkpoint and outcome == 'parsed':
+                checkpoint.add(pid, entry)
+            if cache and outcome != 'parsed':
+                cache.put(catalog, pid, entry)
+            return entry, outcome
+
+        # Fetch stage. Every experience is waited for before an error is raised, so the checkpoint holds all of them.
+        with self.trace.stage('fetch'):
+            futures = [self.executor.submit(load, crt) for crt in data]
+            errors = [future.exception() for future in futures]
+            if checkpoint:
+                checkpoint.close()
+            for error in errors:
+                if error is not None:
+                    raise error
+            loaded = [future.result() for future in futures]
+
+        # Parse stage. Experiences resumed from a checkpoint may not be parsed yet either.
+        with self.trace.stage('parse'):
+            pending = [(crt, entry) for crt, (entry, outcome) in zip(data, loaded) if entry['rules'] is None]
+            parsed = parse_batch([entry['raw']['rulesAchievementCriteria'] for crt, entry in pending],
+                                 self.parse_processes)
+            for (crt, entry), rules in zip(pending, parsed):
+                entry['rules'] = rules
+                if cache:
+                    cache.put(catalog, crt['pid'], entry)
+
+        records = []
+        for crt, (entry, outcome) in zip(data, loaded):
+            stats[outcome] += 1
+            records.append({
+                'title': crt['title'],
+                'provider': entry['provider'],
+                'pid': crt['pid'],
+                'rules': [tuple(rule) for rule in entry['rules']]
+            })
+
+        if cache:
+            stats['removed'] = cache.prune(catalog, {crt['pid'] for crt in data})
+
+        # Every experience made it, the next crawl of the catalog starts over
+        if checkpoint:
+            checkpoint.discard()
+
+        last_crawl_stats.clear()
+        last_crawl_stats.update(stats)
+        return records
@@ -1,8 +1,22 @@
-from datetime import datetime
-from lxml import html
-import requests
+from collections import OrderedDict
+from contextlib import contextmanager
+from array import array
+import threading
+import tempfile
+import sqlite3
+import shutil
 import json
+import time
+import sys
 import os.path
+import re
+
+try:
+    import fcntl
+except ImportError:
+    # Windows doesn't have fcntl, RefreshLock falls back to msvcrt
+    fcntl = None
+    import msvcrt
 
 
 class Course:
@@ -13,12 +27,19 @@ class Course:
 
     The primary purpose of this class is to store information about a course and the certifications that the course is
     associated with. This class will be used to store course information that is returned from the Kuali API.
+
+    To keep snapshots small the certifications aren't stored on the course itself. The course keeps an array of
+    positions in a CertTable that is shared by every course of the snapshot, and Certifications builds the list of
+    Cert objects from it when read. Use add_certification() to add a certification.
     """
-    def __init__(self, title, crdts, catalog):
+    __slots__ = ('title', 'credits', 'catalog', '_certs', '_cert_ids')
+
+    def __init__(self, title, crdts, catalog, certs=None):
         self.title = title
         self.credits = crdts
-        self.catalog = catalog
-        self.Certifications = []
+        self.catalog = sys.intern(catalog) if isinstance(catalog, str) else catalog
+        self._certs = certs
+        self._cert_ids = array('i')
 
     def __str__(self):
         return self.title
@@ -26,8 +47,17 @@ class Course:
     def __repr__(self):
         return self.title
 
+    @property
+    def Certifications(self):
+        if self._certs is None:
+            return []
+        certs = self._certs.certs
+        return [certs[cert_id] for cert_id in self._cert_ids]
+
     def add_certification(self, crt):
-        self.Certifications.append(crt)
+        if self._certs is None:
+            self._certs = CertTable()
+        self._cert_ids.append(self._certs.add(crt))
 
 
 class Cert:
@@ -35,6 +65,8 @@ class Cert:
     This class is used to store information about a certification. The certification will have a title, a list of Course
     objects, a provider, and a pid. The Course objects will contain a title, credit count, and catalog ID.
     """
+    __slots__ = ('title', 'courses', 'provider', 'pid')
+
     def __init__(self, title, courses, provider, pid):
         self.title = title
         self.courses = courses  # Expecting list of course objects
@@ -48,6 +80,48 @@ class Cert:
         return self.title
 
 
+class CertTable:
+    """
+    This class holds exactly one Cert object per pid for a whole snapshot. Courses refer to certifications by their
+    position in the table, so a certification that satisfies many courses is only stored once. Title and provider
+    strings are interned as they are added since the same providers repeat across thousands of certifications.
+    """
+    __slots__ = ('certs', 'positions')
+
+    def __init__(self):
+        self.certs = []
+        self.positions = {}
+
+    def __len__(self):
+        return len(self.certs)
+
+    def add(self, crt) -> int:
+        """
+        Add a Cert to the table unless a Cert with the same pid is already in it.
+
+        :param crt: The Cert to add
+        :return: The position of the Cert with this pid in the table
+        """
+        position = self.positions.get(crt.pid)
+        if position is None:
+            if isinstance(crt.title, str):
+                crt.title = sys.intern(crt.title)
+            if isinstance(crt.provider, str):
+                crt.provider = sys.intern(crt.provider)
+            position = self.positions[crt.pid] = len(self.certs)
+            self.certs.append(crt)
+        return position
+
+    def get(self, title, provider, pid) -> Cert:
+        """
+        Returns the shared Cert of a pid, creating it if the pid isn't in the table yet.
+        """
+        position = self.positions.get(pid)
+        if position is None:
+            position = self.add(Cert(title, None, provider, pid))
+        return self.certs[position]
+
+
 ############################################################################################################
 # Class independent functions past this point
 ############################################################################################################
@@ -60,116 +134,205 @@ def get_catalog():
 
     :return: The ID of the current catalog as a string
     """
-    response = requests.get('https://snhu.kuali.co/api/v1/catalog/public/catalogs/')
-    #current date
-    date = datetime.now()
-    for catalog in response.json():
-        # check if date is between start and end date
-        if datetime.fromisoformat(catalog['startDate']) < date < datetime.fromisoformat(catalog['endDate']):
-            return catalog['_id']
+    # kuali_crawler pulls in requests and lxml, it is only imported once a crawl is needed so the web application
+    # doesn't load them while it only serves the snapshot
+    from kuali_crawler import KualiCrawler
+    with KualiCrawler(workers=1) as crawler:
+        return crawler.get_catalog()
+
+
+def crawl(workers=None, cache_dir=None, catalogs_path=None, trace=None, checkpoint_dir=None):
+    """
+    This function will crawl the current catalog once and return both views of it: the dictionary of Course objects
+    indexed by course code and the dictionary of Cert objects indexed by pid. Every experience is fetched and parsed a
+    single time, the two views share the same Course and Cert objects.
+
+    :param workers: The number of experiences fetched in parallel, defaults to kuali_crawler.DEFAULT_WORKERS
+    :param cache_dir: Optional directory of an ExperienceCache to only re-fetch experiences that changed
+    :param catalogs_path: Optional path where the catalog list is cached between runs
+    :param trace: Optional CrawlTrace recording the time of every stage and request of the crawl
+    :param checkpoint_dir: Optional directory where the progress of the crawl is checkpointed, so a crawl that fails
+                           part way is resumed by the next one instead of starting over
+    :return: A tuple of the courses dictionary and the certs dictionary
+    """
+    from kuali_crawler import KualiCrawler, ExperienceCache
+    with KualiCrawler(workers, catalogs_path=catalogs_path, trace=trace) as crawler:
+        # Get current catalog. This will check the start and end dates of each catalog and return the ID of the
+        # current one.
+        with crawler.trace.stage('catalog'):
+            catalog = crawler.get_catalog()
+        # Get the parsed certifications associated with catalog
+        records = crawler.crawl_experiences(catalog, ExperienceCache(cache_dir) if cache_dir else None,
+                                            checkpoint_dir)
 
+    with crawler.trace.stage('build'):
+        return build_snapshot(catalog, records)
 
-def get_certs():
+
+def precrawl_upcoming(terminal=False, workers=None):
+    """
+    This function will crawl the catalog that starts next once it is less than kuali_crawler.PRECRAWL_LEAD seconds
+    away, and stage its snapshot in the staged directory of the data directory. When the catalog rolls over, the
+    refresh that switches the snapshot to the new catalog moves the staged snapshot in place instead of crawling, see
+    _swap_staged(). Every run of the pre-crawl stages the catalog again, so the staged snapshot is at most a day old.
+
+    :param terminal: True when running from the terminal instead of the web application
+    :param workers: The number of experiences fetched in parallel, defaults to kuali_crawler.DEFAULT_WORKERS
+    :return: The ID of the pre-crawled catalog, or None if no catalog starts within the lead time
+    """
+    from kuali_crawler import KualiCrawler, ExperienceCache, PRECRAWL_LEAD
+    data_path = get_data_path(terminal)
+    # The pre-crawl writes the same catalog list, experience cache and checkpoints as a refresh does
+    with RefreshLock(_lock_path(_snapshot_file(terminal))):
+        with KualiCrawler(workers, catalogs_path=os.path.join(data_path, 'catalogs.json')) as crawler:
+            windows = crawler.get_catalogs()
+            upcoming = windows.upcoming()
+            if upcoming is None or windows.start(upcoming).timestamp() - time.time() > PRECRAWL_LEAD:
+                return None
+            records = crawler.crawl_experiences(upcoming['_id'],
+                                                ExperienceCache(os.path.join(data_path, 'experience_cache')),
+                                                os.path.join(data_path, 'checkpoints'))
+        courses, certs = build_snapshot(upcoming['_id'], records)
+        _stage_snapshot(data_path, upcoming['_id'], courses, certs, windows.end(upcoming).timestamp())
+    return upcoming['_id']
+
+
+def get_certs(workers=None, cache_dir=None):
     """
     This function will return a list of Cert objects. Each Cert object will contain a title, a list of Course objects,
     a provider, and a pid. The Course objects will contain a title, credit count, and catalog ID.
 
+    :param workers: The number of experiences fetched in parallel, defaults to kuali_crawler.DEFAULT_WORKERS
+    :param cache_dir: Optional directory of an ExperienceCache to only re-fetch experiences that changed
     :return: A list of Cert objects
     """
-    catalog = get_catalog()
-    response = requests.get('https://snhu.kuali.co/api/v1/catalog/experiences/' + catalog)
-    data = response.json()
-    certs = []
-    for crt in data:
-        if crt['title']:
-            courses = []
-            response = requests.get('https://snhu.kuali.co/api/v1/catalog/experience/' + catalog + '/' + crt['pid'])
-            provider = response.json()['groupFilter2']['name']
-            course_html = html.fromstring(response.json()['rulesAchievementCriteria'])
-            for statement in course_html.xpath("//li[contains(@data-test, 'ruleView-')]"):
-                # Extract course code
-                course_code = statement.xpath(".//a/text()")[0] if statement.xpath(".//a/text()") else None
-
-                # Extract credit count
-                credit_count = statement.xpath(".//span[1]/text()")[0] if statement.xpath(".//span[1]/text()") else None
-                if course_code and credit_count:
-                    courses.append(Course(course_code, credit_count, catalog))
-            certs.append(Cert(crt['title'], courses, provider, crt['pid']))
-    return certs
+    return list(crawl(workers, cache_dir)[1].values())
 
 
-def get_courses():
+def get_courses(workers=None, cache_dir=None):
     """
     This function will return a dictionary of Course objects. Each Course object will contain a title, credit count,
     and catalog ID. The dictionary will be indexed by the course code.
 
+    The experiences are fetched in parallel by a KualiCrawler, but they are processed in catalog order so the
+    dictionary is the same as a sequential crawl would build. When cache_dir is given, only experiences that are new or
+    changed since the last crawl are fetched and parsed again.
+
+    :param workers: The number of experiences fetched in parallel, defaults to kuali_crawler.DEFAULT_WORKERS
+    :param cache_dir: Optional directory of an ExperienceCache to only re-fetch experiences that changed
     :return: A dictionary of Course objects
     """
+    return crawl(workers, cache_dir)[0]
+
 
-    # Get current catalog. This will check the start and end dates of each catalog and return the ID of the current one.
-    catalog = get_catalog()
-    # Get certifications associated with catalog
-    response = requests.get('https://snhu.kuali.co/api/v1/catalog/experiences/' + catalog)
-    data = response.json()
+def build_snapshot(catalog, records):
+    """
+    This function will build both views of a catalog from the experience records of a crawl. The records are processed
+    in catalog order, so the certifications of every course keep the order of the catalog and the courses of every
+    certification keep the order of its rules.
+
+    :param catalog: The catalog ID the records were crawled from
+    :param records: The experience records returned by KualiCrawler.crawl_experiences()
+    :return: A tuple of the courses dictionary indexed by course code and the certs dictionary indexed by pid
+    """
     courses = {}
+    certs = {}
+    table = CertTable()
 
     # Iterate through each certification found in the catalog
-    for crt in data:
-        if crt['title']:
+    for record in records:
+        certification_to_add = table.get(record['title'], record['provider'], record['pid'])
+        if certification_to_add.courses is None:
+            certification_to_add.courses = []
+            certs[record['pid']] = certification_to_add
+        for course_code, credit_count in record['rules']:
+            # Check if course already exists
+            if course_code in courses:
+                # Add courses associated with certification
+                course = courses[course_code]
+            else:
+                # Course wasn't found, create a new course object
+                course = courses[course_code] = Course(course_code, credit_count, catalog, table)
+            course.add_certification(certification_to_add)
+            # Statements without a course code only carry credits, they aren't a course the cert can list
+            if course_code:
+                certification_to_add.courses.append(course)
 
-            # Get courses associated with certification in raw API return
-            response = requests.get('https://snhu.kuali.co/api/v1/catalog/experience/' + catalog + '/' + crt['pid'])
+    return courses, certs
 
-            # Get provider of the certification
-            provider = response.json()['groupFilter2']['name']
 
-            # Extract course information from HTML. This is not the HTML of the course page, but the HTML found in the
-            # API returned object rulesAchievementCriteria.
-            course_html = html.fromstring(response.json()['rulesAchievementCriteria'])
+def link_certs(courses) -> dict:
+    """
+    This function will build the dictionary of Cert objects indexed by pid from a dictionary of Course objects, filling
+    in the courses of every Cert. It is used for snapshots that only stored the course view.
 
-            # Iterate through each course in the certification based on the xpath of the HTML
-            for statement in course_html.xpath("//li[contains(@data-test, 'ruleView-')]"):
-                # Extract course code
-                course_code = statement.xpath(".//a/text()")[0] if statement.xpath(".//a/text()") else None
+    :param courses: A dictionary of Course objects indexed by course code
+    :return: A dictionary of Cert objects indexed by pid
+    """
+    certs = {}
+    for course_code, course in courses.items():
+        for certificate in course.Certifications:
+            if certificate.pid not in certs:
+                certificate.courses = []
+                certs[certificate.pid] = certificate
+            if course_code:
+                certificate.courses.append(course)
+    return certs
 
-                # Extract credit count
-                credit_count = statement.xpath(".//span[1]/text()")[0] if statement.xpath(".//span[1]/text()") else None
 
-                # Skip if the course code and credit count are not found
-                if not course_code and not credit_count:
-                    continue
+def provider_key(name):
+    """
+    Returns the key a provider is looked up by, its name with runs of whitespace collapsed and case folded, so
+    /api/provider/comptia finds the certifications of CompTIA.
+    """
+    return ' '.join(name.split()).casefold() if name else ''
+
 
-                # Check if course already exists
-                if course_code in courses:
-                    # Add courses associated with certification
-                    certification_to_add = Cert(crt['title'], None, provider, crt['pid'])
-                    courses[course_code].add_certification(certification_to_add)
-                else:
-                    # Course wasn't found, create a new course object
-                    course = Course(course_code, credit_count, catalog)
-                    certification_to_add = Cert(crt['title'], None, provider, crt['pid'])
-                    course.add_certification(certification_to_add)
-                    courses[course_code] = course
+def cert_order(certificate):
+    """
+    Returns the sort key of a Cert in the list of its provider, its title in alphanum_key order and then its pid.
+    """
+    return alphanum_key(certificate.title or ''), certificate.pid
 
-    return courses
 
-def load_courses(force=False, terminal=False) -> dict:
+def link_providers(certs, providers=None) -> dict:
     """
-    This function will check if there is a json file in the appdata directory called courses.json. If the file exists,
-    the function will load the file and return a dictionary of Course objects. If the file does not exist, the function
-    will call the get_courses() function to get the courses from the Kuali API and save them to a json file. It will
-    also check if the file is older than 24 hours. If the file is older than 24 hours, the function will call the
-    get_courses() function to get the courses from the Kuali API and overwrite/write them to the json file.
+    This function will build the dictionary of Cert lists indexed by provider_key() from a dictionary of Cert objects.
+    The certifications of every provider are sorted by title.
 
-    :return: A dictionary of Course objects
+    :param certs: A dictionary of Cert objects indexed by pid
+    :param providers: The providers section of a snapshot, lists of pids indexed by provider key, if it has one
+    :return: A dictionary of Cert lists indexed by provider key
+    """
+    if providers is not None:
+        return {key: [certs[pid] for pid in pids] for key, pids in providers.items()}
+    linked = {}
+    for certificate in certs.values():
+        linked.setdefault(provider_key(certificate.provider), []).append(certificate)
+    for provider_certs in linked.values():
+        provider_certs.sort(key=cert_order)
+    return linked
+
+
+def get_data_path(terminal=False):
     """
+    This function will return the directory that holds courses.json. When DATA_DIR is set (the SNHU_SHORTCUT_DATA
+    environment variable or the --data-dir option of the command line) that directory is used as it is. Otherwise, if
+    terminal is True, the SNHU-Shortcut folder in APPDATA is used, or in XDG_CACHE_HOME (~/.cache by default) where
+    APPDATA isn't set, and the current directory executed from is used for the web application. The folder is created
+    if it doesn't exist yet.
+
+    :param terminal: True when running from the terminal instead of the web application
+    :return: The path of the SNHU-Shortcut data directory as a string
+    """
+    if DATA_DIR:
+        os.makedirs(DATA_DIR, exist_ok=True)
+        return DATA_DIR
 
     # Get the APPDATA environment variable
     if terminal:
-        # If terminal is True, use the APPDATA environment variable
-        app_data_dir = os.getenv('APPDATA')
-        if not app_data_dir:
-            raise EnvironmentError("The 'APPDATA' environment variable is not set.")
+        # If terminal is True, use the APPDATA environment variable, or the cache directory outside of Windows
+        app_data_dir = os.getenv('APPDATA') or os.getenv('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
     else:
         # If terminal is False, the current directory executed from.
         app_data_dir = os.getcwd()
@@ -179,57 +342,983 @@ def load_courses(force=False, terminal=False) -> dict:
     if not os.path.exists(app_data_path):
         os.makedirs(app_data_path)
 
-    # Check if the file exists
-    json_path = os.path.join(app_data_path, 'courses.json')
-    if os.path.exists(json_path) or force:
+    return app_data_path
+
+
+# Directory of courses.json and the other data files, see get_data_path()
+DATA_DIR = os.getenv('SNHU_SHORTCUT_DATA')
+
+
+# Version of the courses.json layout written by write_snapshot(). The original layout, a plain dictionary of courses
+# that repeats every certification under each of its courses, is still read.
+SNAPSHOT_FORMAT = 2
+
+
+def read_snapshot(json_path):
+    """
+    This function will read a courses.json snapshot and return both views of it, the dictionary of Course objects
+    indexed by course code and the dictionary of Cert objects indexed by pid.
+
+    :param json_path: The path of the courses.json file
+    :return: A tuple of the courses dictionary and the certs dictionary
+    """
+    with open(json_path, 'r') as f:
+        return parse_snapshot(json.load(f))
+
+
+def parse_snapshot(data):
+    """
+    This function will build both views of a catalog from the decoded JSON of a courses.json snapshot.
+
+    :param data: The decoded snapshot
+    :return: A tuple of the courses dictionary and the certs dictionary
+    """
+    courses = {}
+    table = CertTable()
+    if data.get('format') != SNAPSHOT_FORMAT:
+        # Original layout with the certifications repeated under every course
+        for course_code, course_data in data.items():
+            course = Course(course_data['title'], course_data['credits'], course_data['catalog'], table)
+            for cert_data in course_data['Certifications']:
+                course.add_certification(table.get(cert_data['title'], cert_data['provider'], cert_data['pid']))
+            courses[course_code] = course
+        return courses, link_certs(courses)
+
+    certs = {}
+    for pid, cert_data in data['certs'].items():
+        certs[pid] = table.get(cert_data['title'], cert_data['provider'], pid)
+    for course_code, course_data in data['courses'].items():
+        course = Course(course_data['title'], course_data['credits'], course_data['catalog'], table)
+        for pid in course_data['Certifications']:
+            course.add_certification(certs[pid])
+        courses[course_code] = course
+    for pid, cert_data in data['certs'].items():
+        certs[pid].courses = [courses[course_code] for course_code in cert_data['courses']]
+    return courses, certs
+
+
+def write_snapshot(json_path, courses, certs=None, valid_until=None):
+    """
+    This function will write both views of a catalog to a courses.json snapshot. Every certification is stored once
+    under certs with the codes of its courses, every course lists the pids of its certifications and providers lists
+    the pids of every provider in the order link_providers() sorts them. The snapshot is
+    written to a temporary file in the same directory that then replaces courses.json, so readers never see a
+    half-written file.
+
+    :param json_path: The path of the courses.json file
+    :param courses: A dictionary of Course objects indexed by course code
+    :param certs: A dictionary of Cert objects indexed by pid, built from courses when not given
+    :param valid_until: Timestamp at which the catalog of the snapshot ends, if known
+    """
+    if certs is None:
+        certs = link_certs(courses)
+    with replace_file(json_path) as tmp_path:
+        with open(tmp_path, 'w') as f:
+            _dump_snapshot(f, courses, certs, valid_until)
+
+
+@contextmanager
+def replace_file(path, prefix='.courses-'):
+    """
+    This function will yield the path of a temporary file in the directory of path, which replaces path once the block
+    completes. Every snapshot and history file is written this way, so readers never see a half-written file. The
+    temporary file is removed when the block raises.
+
+    :param path: The path of the file to write
+    :param prefix: The prefix of the temporary file name
+    :return: A context manager yielding the path of the temporary file
+    """
+    fd, tmp_path = tempfile.mkstemp(prefix=prefix, suffix='.tmp', dir=os.path.dirname(path))
+    os.close(fd)
+    try:
+        yield tmp_path
+        # mkstemp creates the file readable by its owner only
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def write_file(path, content, prefix='.courses-'):
+    """
+    Writes bytes to path through replace_file().
+    """
+    with replace_file(path, prefix) as tmp_path:
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+
 
-        if not force:
-            # Check when courses.json was last modified
-            last_modified = datetime.fromtimestamp(os.path.getmtime(json_path))
+def stored_courses(courses):
+    """
+    Returns the courses of a snapshot indexed by the course code the snapshot stores keep them under. The JSON snapshot
+    turns a missing course code into the string 'null', the SQLite and binary stores store it the same way.
+    """
+    return {('null' if code is None else code): course for code, course in courses.items()}
+
+
+def snapshot_catalog(courses):
+    """
+    Returns the catalog ID shared by every course of a snapshot, or None if the courses come from several catalogs.
+    """
+    catalogs = {course.catalog for course in courses.values()}
+    return catalogs.pop() if len(catalogs) == 1 else None
+
+
+def _dump_snapshot(f, courses, certs, valid_until):
+    json.dump(snapshot_data(courses, certs, valid_until), f)
+
+
+def snapshot_data(courses, certs, valid_until=None):
+    """
+    This function will return both views of a catalog in the layout write_snapshot() writes to courses.json, ready to
+    be encoded as JSON.
+
+    :param courses: A dictionary of Course objects indexed by course code
+    :param certs: A dictionary of Cert objects indexed by pid
+    :param valid_until: Timestamp at which the catalog of the snapshot ends, if known
+    :return: The snapshot as a dictionary
+    """
+    data = {
+        'format': SNAPSHOT_FORMAT,
+        'catalog': snapshot_catalog(courses),
+        'created': time.time(),
+        'valid_until': valid_until,
+        'courses': {},
+        'certs': {}
+    }
+    for course_code, course in courses.items():
+        data['courses'][course_code] = {
+            'title': course.title,
+            'credits': course.credits,
+            'catalog': course.catalog,
+            'Certifications': [certificate.pid for certificate in course.Certifications]
+        }
+    codes = {id(course): course_code for course_code, course in courses.items()}
+    for pid, certificate in certs.items():
+        data['certs'][pid] = {
+            'title': certificate.title,
+            'provider': certificate.provider,
+            'courses': [codes[id(course)] for course in certificate.courses]
+        }
+    data['providers'] = {key: [certificate.pid for certificate in provider_certs]
+                         for key, provider_certs in link_providers(certs).items()}
+    return data
+
+
+class RefreshLock:
+    """
+    This class is an exclusive lock on a file that is shared by every process using the same data directory. It makes
+    sure only one process, whether a web worker or the cron job, crawls the Kuali API at a time.
+
+    The lock is held through flock() on POSIX and msvcrt.locking() on Windows, so it is released by the operating
+    system if the process holding it dies. Used as a context manager with blocking False, entering raises a
+    BlockingIOError straight away if another process holds the lock.
+    """
+    def __init__(self, path, blocking=True):
+        self.path = path
+        self.blocking = blocking
+        self._file = None
+
+    def __enter__(self):
+        if not self.acquire(self.blocking):
+            raise BlockingIOError("A refresh of the snapshot is running, try again once it is done")
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+    def acquire(self, blocking=True) -> bool:
+        """
+        Acquire the lock. When blocking is False the call returns straight away if another process holds the lock.
+
+        :param blocking: Whether to wait for the lock
+        :return: True if the lock was acquired
+        """
+        self._file = open(self.path, 'a+')
+        try:
+            if fcntl:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            else:
+                self._file.seek(0)
+                while True:
+                    try:
+                        msvcrt.locking(self._file.fileno(), msvcrt.LK_NBLCK, 1)
+                        break
+                    except OSError:
+                        if not blocking:
+                            raise
+                        time.sleep(1)
+        except OSError:
+            self._file.close()
+            self._file = None
+            return False
+        return True
+
+    def release(self):
+        if self._file is None:
+            return
+        if fcntl:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
         else:
-            # If force is True, we will not check the last modified time
-            last_modified = datetime.min
-
-        # If the file was modified in the last 24 hours, load the file
-        if (datetime.now() - last_modified).total_seconds() < 86400 and not force:
-            # Load the file reading the json file
-            try:
-                with open(json_path, 'r') as f:
-                    data = json.load(f)
-                    courses = {}
-                    for course_code, course_data in data.items():
-                        course = Course(course_data['title'], course_data['credits'], course_data['catalog'])
-                        for cert_data in course_data['Certifications']:
-                            certificate = Cert(cert_data['title'], None, cert_data['provider'], cert_data['pid'])
-                            course.add_certification(certificate)
-                        courses[course_code] = course
-                return courses
-            except json.JSONDecodeError as e:
-                print(f"Error decoding JSON: {e}. Re-fetching data from Kuali API.")
-                os.remove(json_path)
-
-    # Get the courses from the Kuali API
-    courses = get_courses()
-
-    # Save the courses to a json file
-    with open(json_path, 'w') as f:
-        data = {}
-        for course_code, course in courses.items():
-            data[course_code] = {
-                'title': course.title,
-                'credits': course.credits,
-                'catalog': course.catalog,
-                'Certifications': []
-            }
-            for certificate in course.Certifications:
-                data[course_code]['Certifications'].append({
-                    'title': certificate.title,
-                    'provider': certificate.provider,
-                    'pid': certificate.pid
-                })
-        json.dump(data, f)
-
-    return courses
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        self._file.close()
+        self._file = None
+
+
+############################################################################################################
+# In-process course index
+############################################################################################################
+
+# Snapshots older than this many seconds are re-fetched from the Kuali API.
+SNAPSHOT_MAX_AGE = 86400
+
+# Storage backend of the snapshot. 'json' keeps courses.json parsed in memory, 'sqlite' serves courses.db with indexed
+# queries (see sqlite_store) so the dataset is never loaded as a whole, and 'mmap' maps the binary courses.bin (see
+# mmap_store) so every worker process shares the same pages of it.
+SNAPSHOT_STORE = os.getenv('SNHU_SHORTCUT_STORE', 'json').lower()
+
+# Snapshot file of each SNAPSHOT_STORE, courses.json for any other value
+SNAPSHOT_FILES = {'sqlite': 'courses.db', 'mmap': 'courses.bin'}
+
+# A failed background refresh is retried after this many seconds.
+REFRESH_RETRY_INTERVAL = 600
+
+# When set, every refresh is profiled with cProfile into crawl_profile.prof next to the snapshot. Only the refreshing
+# thread is profiled, the fetch threads of the crawler are covered by the timings of crawl_report.json instead.
+CRAWL_PROFILE = os.getenv('KUALI_CRAWL_PROFILE', '') not in ('', '0')
+
+# The report of the most recent refresh of this process, also written to crawl_report.json next to the snapshot.
+last_crawl_report = {}
+
+# The index currently being served by this process and the lock that guards rebuilding it.
+_course_index = None
+_index_lock = threading.Lock()
+
+# The background thread refreshing a stale snapshot, if any, and when the last refresh was started.
+_refresh_thread = None
+_last_refresh_attempt = 0.0
+_refresh_guard = threading.Lock()
+
+# Indices of earlier snapshot versions loaded by get_version_index(), the least recently used is dropped first.
+VERSION_INDICES = 4
+_version_indices = OrderedDict()
+_version_lock = threading.Lock()
+
+# Counters used to confirm the index is being served from memory. Read them with get_index_stats().
+_index_stats = {'hits': 0, 'reloads': 0, 'fetches': 0}
+_stats_lock = threading.Lock()
+
+
+def alphanum_key(s):
+    # Split string into list of strings and integers
+    return [int(text) if text.isdigit() else text.lower() for text in re.split('([0-9]+)', s)]
+
+
+class SubstringIndex:
+    """
+    This class is an n-gram index over course codes used for partial searches such as ELE, IT2 or GEN1. Every code is
+    stored once in alphanum_key order and every 1 to 3 character gram of a code points at the positions of the codes
+    that contain it.
+
+    A query of up to three characters is answered straight from its posting list. A longer query only verifies the
+    codes of its rarest trigram. Both return the matches already in alphanum_key order without sorting them.
+    """
+    GRAM = 3
+
+    def __init__(self, codes):
+        # Course codes that failed to parse can't be searched for, skip them. A courses.json snapshot stores them as
+        # the string 'null'.
+        self.codes = sorted((code for code in codes if isinstance(code, str) and code != 'null'), key=alphanum_key)
+        self.postings = {}
+        for position, code in enumerate(self.codes):
+            grams = {code[i:i + n] for n in range(1, self.GRAM + 1) for i in range(len(code) - n + 1)}
+            for gram in grams:
+                self.postings.setdefault(gram, []).append(position)
+
+    def search(self, fragment):
+        """
+        Returns every course code that contains fragment, in alphanum_key order.
+
+        :param fragment: The partial course code to search for
+        :return: A list of course codes
+        """
+        if not fragment:
+            return []
+        if len(fragment) <= self.GRAM:
+            return [self.codes[position] for position in self.postings.get(fragment, ())]
+
+        # Every match contains all trigrams of the fragment, so only the shortest posting list has to be verified
+        candidates = min((self.postings.get(fragment[i:i + self.GRAM], ())
+                          for i in range(len(fragment) - self.GRAM + 1)), key=len)
+        return [self.codes[position] for position in candidates if fragment in self.codes[position]]
+
+
+def edit_distance(first, second, limit=None):
+    """
+    Returns the optimal string alignment distance of two strings, the number of inserted, deleted or substituted
+    characters and swapped adjacent characters that turns one into the other. With a limit the comparison stops as
+    soon as the distance is known to exceed it and returns limit + 1.
+    """
+    if limit is not None and abs(len(first) - len(second)) > limit:
+        return limit + 1
+    previous = None
+    current = list(range(len(second) + 1))
+    for i, char in enumerate(first, 1):
+        before, previous = previous, current
+        current = [i]
+        for j, other in enumerate(second, 1):
+            distance = min(previous[j] + 1, current[-1] + 1, previous[j - 1] + (char != other))
+            if i > 1 and j > 1 and char == second[j - 2] and first[i - 2] == other and before[j - 2] + 1 < distance:
+                distance = before[j - 2] + 1
+            current.append(distance)
+        if limit is not None and min(current) > limit:
+            return limit + 1
+    return current[-1] if limit is None else min(current[-1], limit + 1)
+
+
+class FuzzyIndex:
+    """
+    This class suggests course codes for a code that isn't in the snapshot, e.g. IT145 for IT415 or MAT240 for MAT24O.
+    It is a symmetric delete index: every variant of a code with up to MAX_EDITS characters deleted points at the
+    code. A query looks up its own delete variants, which finds every code within MAX_EDITS edits of it without
+    comparing it to each code, and only those candidates are ranked by their edit_distance().
+    """
+    MAX_EDITS = 2
+
+    # Longer queries aren't course codes, and their number of variants grows quickly
+    MAX_QUERY = 24
+
+    def __init__(self, codes):
+        # Course codes that failed to parse can't be suggested, skip them
+        self.codes = [code for code in codes if isinstance(code, str)]
+        self.deletes = {}
+        for position, code in enumerate(self.codes):
+            for variant in self.variants(code):
+                self.deletes.setdefault(variant, []).append(position)
+
+    @classmethod
+    def variants(cls, code):
+        """
+        Returns the code and every string made by deleting up to MAX_EDITS of its characters.
+        """
+        variants = {code}
+        edge = {code}
+        for _ in range(cls.MAX_EDITS):
+            edge = {word[:i] + word[i + 1:] for word in edge for i in range(len(word))}
+            variants |= edge
+        return variants
+
+    def suggest(self, query, limit=5):
+        """
+        Returns up to limit course codes within MAX_EDITS edits of query, closest first. Codes at the same distance
+        are ranked by how close their length is and then in the order of codes, alphanum_key order for an index.
+
+        :param query: The sanitized course code that wasn't found
+        :param limit: The maximum number of suggestions
+        :return: A list of course codes
+        """
+        if not query or len(query) > self.MAX_QUERY:
+            return []
+        candidates = set()
+        for variant in self.variants(query):
+            candidates.update(self.deletes.get(variant, ()))
+        ranked = []
+        for position in candidates:
+            code = self.codes[position]
+            distance = edit_distance(query, code, self.MAX_EDITS)
+            if 0 < distance <= self.MAX_EDITS:
+                ranked.append((distance, abs(len(code) - len(query)), position))
+        ranked.sort()
+        return [self.codes[position] for _, _, position in ranked[:limit]]
+
+
+class SnapshotIndex:
+    """
+    This class holds what the index of every SNAPSHOT_STORE shares. A subclass sets courses, the Course objects
+    indexed by course code as a dictionary or a read only dictionary view, and implements codes(), search(),
+    get_cert() and get_provider(). The FuzzyIndex answering "did you mean" suggestions is only built by the first
+    suggest() of a process, so a worker serving a SQLite or binary snapshot doesn't hold it until it needs it.
+
+    The stamp is the (mtime, size) of the snapshot file the index was built from. When the file on disk no longer
+    matches the stamp the index is rebuilt and swapped in as a whole, so readers never see a half-built index.
+    valid_until is the end of the snapshot's catalog window, after it the snapshot is refreshed for the next catalog.
+    """
+    def __init__(self, path, stamp, valid_until=None):
+        self.path = path
+        self.stamp = stamp
+        self.valid_until = valid_until
+        self.version = '%x-%x' % stamp
+        self.loaded_at = time.time()
+        self._fuzzy = None
+        self._fuzzy_lock = threading.Lock()
+
+    def __contains__(self, course_code):
+        return course_code in self.courses
+
+    def __len__(self):
+        return len(self.courses)
+
+    def get(self, course_code):
+        return self.courses.get(course_code)
+
+    def rolled_over(self):
+        return self.valid_until is not None and time.time() >= self.valid_until
+
+    def suggest(self, course_code, limit=5):
+        """
+        Returns the course codes closest to a course code that isn't in the snapshot, closest first.
+        """
+        fuzzy = self._fuzzy
+        if fuzzy is None:
+            with self._fuzzy_lock:
+                # Another thread may have built it while this one waited for the lock
+                if self._fuzzy is None:
+                    self._fuzzy = FuzzyIndex(self.codes())
+                fuzzy = self._fuzzy
+        return fuzzy.suggest(course_code, limit)
+
+
+class CourseIndex(SnapshotIndex):
+    """
+    This class holds every Course of one courses.json snapshot in memory. An index is built once per snapshot and
+    then shared by every request in the process, so a lookup is a plain dictionary hit instead of a full JSON parse.
+    Partial searches are answered by a SubstringIndex that is built together with the index. certs holds the opposite
+    view of the snapshot, every Cert indexed by pid with the courses it satisfies, and providers the certs of every
+    provider indexed by provider_key().
+    """
+    def __init__(self, courses, path, stamp, certs=None, valid_until=None, providers=None):
+        self.courses = courses
+        self.certs = certs if certs is not None else link_certs(courses)
+        self.providers = providers if providers is not None else link_providers(self.certs)
+        self.substrings = SubstringIndex(courses)
+        super().__init__(path, stamp, valid_until)
+
+    def search(self, fragment):
+        """
+        Returns the course codes that contain fragment in alphanum_key order.
+        """
+        return self.substrings.search(fragment)
+
+    def codes(self):
+        """
+        Returns every searchable course code in alphanum_key order.
+        """
+        return iter(self.substrings.codes)
+
+    def get_cert(self, pid):
+        """
+        Returns the Cert of a pid with the courses it satisfies in alphanum_key order, like the other snapshot stores,
+        or None if the pid isn't in the snapshot. The Cert of the snapshot keeps its courses in the order of its rules.
+        """
+        cert = self.certs.get(pid)
+        if cert is None:
+            return None
+        codes = sorted({course.title for course in cert.courses}, key=alphanum_key)
+        return Cert(cert.title, [self.courses[code] for code in codes], cert.provider, pid)
+
+    def get_provider(self, name):
+        """
+        Returns the Certs of a provider sorted by title, or None if the provider isn't in the snapshot.
+        """
+        return self.providers.get(provider_key(name))
+
+
+def _count(counter):
+    with _stats_lock:
+        _index_stats[counter] += 1
+
+
+def get_index_stats() -> dict:
+    """
+    This function will return a copy of the course index counters. Hits are lookups answered from memory, reloads are
+    rebuilds of the index from courses.json and fetches are full refreshes from the Kuali API.
+
+    :return: A dictionary of counter names to counts
+    """
+    with _stats_lock:
+        stats = dict(_index_stats)
+    index = _course_index
+    stats['version'] = index.version if index else None
+    stats['courses'] = len(index) if index else 0
+    return stats
+
+
+def _snapshot_file(terminal=False):
+    """
+    Returns the path of the snapshot served by the configured SNAPSHOT_STORE.
+    """
+    return os.path.join(get_data_path(terminal), SNAPSHOT_FILES.get(SNAPSHOT_STORE, 'courses.json'))
+
+
+def _save_snapshot(snapshot_path, courses, certs, valid_until):
+    if SNAPSHOT_STORE == 'sqlite':
+        from sqlite_store import write_sqlite_snapshot
+        write_sqlite_snapshot(snapshot_path, courses, certs, valid_until)
+    elif SNAPSHOT_STORE == 'mmap':
+        from mmap_store import write_mmap_snapshot
+        write_mmap_snapshot(snapshot_path, courses, certs, valid_until)
+    else:
+        write_snapshot(snapshot_path, courses, certs, valid_until)
+
+
+def _open_index(snapshot_path, stamp, snapshot=None, valid_until=None):
+    """
+    Builds the index of a snapshot of the configured SNAPSHOT_STORE. The (courses, certs) of a snapshot that was just
+    written are passed in so a JSON snapshot doesn't have to be parsed again.
+    """
+    if SNAPSHOT_STORE == 'sqlite':
+        from sqlite_store import SqliteCourseIndex
+        return SqliteCourseIndex(snapshot_path, stamp)
+    if SNAPSHOT_STORE == 'mmap':
+        from mmap_store import MmapCourseIndex
+        return MmapCourseIndex(snapshot_path, stamp)
+    providers = None
+    if snapshot is None:
+        with open(snapshot_path, 'r') as f:
+            data = json.load(f)
+        snapshot = parse_snapshot(data)
+        valid_until = data.get('valid_until')
+        if data.get('format') == SNAPSHOT_FORMAT and 'providers' in data:
+            providers = link_providers(snapshot[1], data['providers'])
+    courses, certs = snapshot
+    return CourseIndex(courses, snapshot_path, stamp, certs, valid_until, providers)
+
+
+def _catalog_end(catalog):
+    """
+    Returns the timestamp at which a catalog ends according to the catalog list of the last crawl, or None.
+    """
+    from kuali_crawler import catalog_windows
+    windows = catalog_windows()
+    catalog = windows.find(catalog) if windows and catalog else None
+    return windows.end(catalog).timestamp() if catalog else None
+
+
+def _snapshot_stamp(snapshot_path):
+    """
+    Returns the (mtime, size) stamp of the snapshot file or None if it doesn't exist.
+    """
+    try:
+        st = os.stat(snapshot_path)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def _is_fresh(stamp):
+    return stamp is not None and time.time() - stamp[0] / 1e9 < SNAPSHOT_MAX_AGE
+
+
+def _stage_snapshot(data_path, catalog, courses, certs, valid_until):
+    """
+    Writes the snapshot of an upcoming catalog to its directory under the staged directory of the data directory. The
+    courses.json snapshot is always staged since the history is recorded from it, and the snapshot file of the
+    configured SNAPSHOT_STORE next to it.
+    """
+    staged_dir = os.path.join(data_path, 'staged', catalog)
+    os.makedirs(staged_dir, exist_ok=True)
+    write_snapshot(os.path.join(staged_dir, 'courses.json'), courses, certs, valid_until)
+    if SNAPSHOT_STORE in SNAPSHOT_FILES:
+        _save_snapshot(os.path.join(staged_dir, SNAPSHOT_FILES[SNAPSHOT_STORE]), courses, certs, valid_until)
+
+
+def _swap_staged(snapshot_path):
+    """
+    Serves the snapshot staged by precrawl_upcoming() once its catalog is the active one, by moving the staged file in
+    place of the snapshot and recording it in the history. No request is made, the start of the catalog is read from
+    the catalog list on disk. A staged snapshot older than SNAPSHOT_MAX_AGE is left for the refresh to crawl again.
+    Must be called while holding the RefreshLock of the data directory.
+
+    :return: The index of the swapped in snapshot, or None if there is no staged snapshot to serve
+    """
+    global _course_index
+    from kuali_crawler import CatalogWindows, CrawlTrace
+    data_path = os.path.dirname(snapshot_path)
+    windows = CatalogWindows.load(os.path.join(data_path, 'catalogs.json'))
+    active = windows.active() if windows else None
+    if active is None:
+        return None
+    staged_dir = os.path.join(data_path, 'staged', active['_id'])
+    staged_json = os.path.join(staged_dir, 'courses.json')
+    staged_path = os.path.join(staged_dir, os.path.basename(snapshot_path))
+    if not _is_fresh(_snapshot_stamp(staged_json)) or not os.path.exists(staged_path):
+        return None
+    try:
+        with open(staged_json, 'r') as f:
+            data = json.load(f)
+    except ValueError:
+        return None
+
+    courses, certs = parse_snapshot(data)
+    valid_until = data.get('valid_until')
+    version, changes, pinned = _record_history(data_path, courses, certs, valid_until)
+    served = (courses, certs), valid_until
+    if pinned is not None:
+        # A pinned version keeps being served, the staged snapshot was only added to the history
+        served = parse_snapshot(pinned), None
+        _save_snapshot(snapshot_path, *served[0], served[1])
+    else:
+        os.replace(staged_path, snapshot_path)
+    # Snapshots staged for any other catalog are outdated too
+    shutil.rmtree(os.path.dirname(staged_dir), ignore_errors=True)
+    _save_crawl_report(data_path, CrawlTrace(), catalog=active['_id'], courses=len(courses), certs=len(certs),
+                       staged=True, version=version, changes=changes)
+    _count('fetches')
+    index = _open_index(snapshot_path, _snapshot_stamp(snapshot_path), *served)
+    with _index_lock:
+        _course_index = index
+    return index
+
+
+def _refresh_snapshot(snapshot_path, workers=None, full=False):
+    """
+    Fetches the courses from the Kuali API, writes them to the snapshot and installs them as the served index. Only
+    experiences that changed since the last refresh are fetched again, unless full is True. When the catalog rolled
+    over to one that precrawl_upcoming() staged, the staged snapshot is served instead of crawling, unless full is True.
+    Must be called while holding the RefreshLock of the data directory.
+    """
+    global _course_index
+    from kuali_crawler import CrawlTrace, last_crawl_stats
+    data_path = os.path.dirname(snapshot_path)
+    if not full:
+        index = _swap_staged(snapshot_path)
+        if index is not None:
+            return index
+    cache_dir = os.path.join(data_path, 'experience_cache')
+    checkpoint_dir = os.path.join(data_path, 'checkpoints')
+    if full:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        shutil.rmtree(checkpoint_dir, ignore_errors=True)
+
+    trace = CrawlTrace()
+    profiler = None
+    if CRAWL_PROFILE:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        # The snapshot is only written once the crawl completed, a failed crawl only leaves its checkpoint behind
+        courses, certs = crawl(workers, cache_dir, os.path.join(data_path, 'catalogs.json'), trace, checkpoint_dir)
+        valid_until = _catalog_end(snapshot_catalog(courses))
+        with trace.stage('history'):
+            version, changes, pinned = _record_history(data_path, courses, certs, valid_until)
+        served = (courses, certs), valid_until
+        if pinned is not None:
+            # A pinned version keeps being served, the crawl was only added to the history
+            served = parse_snapshot(pinned), None
+        with trace.stage('write'):
+            _save_snapshot(snapshot_path, *served[0], served[1])
+    except Exception as e:
+        # A failed crawl still leaves a report of how far it got
+        _save_crawl_report(data_path, trace, error=f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(os.path.join(data_path, 'crawl_profile.prof'))
+    # A staged snapshot of the catalog that was just crawled is older than the served one now
+    if snapshot_catalog(courses):
+        shutil.rmtree(os.path.join(data_path, 'staged', snapshot_catalog(courses)), ignore_errors=True)
+    _save_crawl_report(data_path, trace, catalog=snapshot_catalog(courses), courses=len(courses), certs=len(certs),
+                       full=full, crawl=dict(last_crawl_stats), version=version, changes=changes)
+    _count('fetches')
+    index = _open_index(snapshot_path, _snapshot_stamp(snapshot_path), *served)
+    with _index_lock:
+        _course_index = index
+    return index
+
+
+def get_history(terminal=False):
+    """
+    Returns the SnapshotHistory of the data directory, see snapshot_history.py.
+    """
+    from snapshot_history import SnapshotHistory
+    return SnapshotHistory(os.path.join(get_data_path(terminal), 'history'))
+
+
+def _record_history(data_path, courses, certs, valid_until):
+    """
+    Adds a crawled snapshot to the history of the data directory, which also records what changed since the previous
+    version. Returns the id of the version, the number of changes of every kind if it is a new version (None if the
+    crawl matched the newest version) and the decoded snapshot of the pinned version if one is pinned. Like the crawl
+    report, a history that can't be written is only logged and (None, None, None) is returned.
+    """
+    from snapshot_history import SnapshotHistory
+    history = SnapshotHistory(os.path.join(data_path, 'history'))
+    try:
+        versions = history.versions()
+        version = history.record(snapshot_data(courses, certs, valid_until))
+        changes = version.get('changes') if not versions or version['id'] != versions[-1]['id'] else None
+        pinned = history.pinned
+        return version['id'], changes, history.load(pinned) if pinned is not None else None
+    except (OSError, ValueError) as e:
+        print(f"[ERROR - {time.strftime('%Y-%m-%d %H:%M:%S')}] Could not record the snapshot history: {e}")
+        return None, None, None
+
+
+def _serve_version(history, version_id, terminal=False):
+    """
+    Writes a version of the history to the served snapshot and installs it as the served index. A pinned version is
+    written without the end of its catalog, so it isn't refreshed away when its catalog ends.
+    """
+    global _course_index
+    snapshot_path = _snapshot_file(terminal)
+    data = history.load(version_id)
+    courses, certs = parse_snapshot(data)
+    valid_until = None if history.pinned else data.get('valid_until')
+    _save_snapshot(snapshot_path, courses, certs, valid_until)
+    index = _open_index(snapshot_path, _snapshot_stamp(snapshot_path), (courses, certs), valid_until)
+    with _index_lock:
+        _course_index = index
+    return index
+
+
+def pin_version(version_id, terminal=False):
+    """
+    This function will pin a version of the snapshot history and serve it until unpin_version() is called. Refreshes
+    are still added to the history while a version is pinned. Raises a BlockingIOError if a refresh is running.
+
+    :param version_id: The id of the version, as listed by get_history().versions()
+    :param terminal: True when running from the terminal instead of the web application
+    :return: The index of the pinned version
+    """
+    history = get_history(terminal)
+    with RefreshLock(_lock_path(_snapshot_file(terminal)), blocking=False):
+        history.pin(version_id)
+        return _serve_version(history, version_id, terminal)
+
+
+def unpin_version(terminal=False):
+    """
+    This function will remove the pin of the snapshot history and serve its newest version again. Raises a
+    BlockingIOError if a refresh is running.
+
+    :param terminal: True when running from the terminal instead of the web application
+    :return: The id of the served version, None if the history is empty
+    """
+    history = get_history(terminal)
+    with RefreshLock(_lock_path(_snapshot_file(terminal)), blocking=False):
+        version_id = history.unpin()
+        if version_id is not None:
+            _serve_version(history, version_id, terminal)
+    return version_id
+
+
+def rollback_version(terminal=False):
+    """
+    This function will pin the version of the snapshot history recorded before the served one, e.g. to undo a bad
+    crawl. Call unpin_version() once a good crawl was recorded. Raises a BlockingIOError if a refresh is running.
+
+    :param terminal: True when running from the terminal instead of the web application
+    :return: The id of the pinned version
+    """
+    history = get_history(terminal)
+    with RefreshLock(_lock_path(_snapshot_file(terminal)), blocking=False):
+        version_id = history.previous()
+        history.pin(version_id)
+        _serve_version(history, version_id, terminal)
+    return version_id
+
+
+def get_version_index(version_id, terminal=False) -> CourseIndex:
+    """
+    This function will return a CourseIndex of any version of the snapshot history, e.g. to look up what a course
+    mapped to last term. The indices of the most recently requested versions are kept in memory.
+
+    :param version_id: The id of the version
+    :param terminal: True when running from the terminal instead of the web application
+    :return: The CourseIndex of the version
+    """
+    history = get_history(terminal)
+    entry = history.version(version_id)
+    with _version_lock:
+        index = _version_indices.get(version_id)
+        if index is not None:
+            _version_indices.move_to_end(version_id)
+            return index
+    data = history.load(version_id)
+    courses, certs = parse_snapshot(data)
+    index = CourseIndex(courses, history.history_dir, (int(entry['created'] * 1e9), entry['size']), certs,
+                        data.get('valid_until'), link_providers(certs, data.get('providers')))
+    # Versions never change once recorded, so the id identifies the index like a snapshot stamp does
+    index.version = version_id
+    with _version_lock:
+        _version_indices[version_id] = index
+        while len(_version_indices) > VERSION_INDICES:
+            _version_indices.popitem(last=False)
+    return index
+
+
+def _save_crawl_report(data_path, trace, **extra):
+    """
+    Writes the report of a refresh to crawl_report.json in the data directory. A report that can't be written is only
+    logged, it must never fail the refresh itself.
+    """
+    try:
+        report = trace.save(os.path.join(data_path, 'crawl_report.json'), **extra)
+    except OSError as e:
+        report = trace.report(**extra)
+        print(f"[ERROR - {time.strftime('%Y-%m-%d %H:%M:%S')}] Could not write the crawl report: {e}")
+    last_crawl_report.clear()
+    last_crawl_report.update(report)
+
+
+def _lock_path(snapshot_path):
+    return os.path.join(os.path.dirname(snapshot_path), 'refresh.lock')
+
+
+def _schedule_refresh(snapshot_path):
+    """
+    Starts a background refresh of a stale snapshot unless one is already running in this process or the last attempt
+    was less than REFRESH_RETRY_INTERVAL seconds ago.
+    """
+    global _refresh_thread, _last_refresh_attempt
+    with _refresh_guard:
+        if _refresh_thread is not None and _refresh_thread.is_alive():
+            return
+        if time.time() - _last_refresh_attempt < REFRESH_RETRY_INTERVAL:
+            return
+        _last_refresh_attempt = time.time()
+        _refresh_thread = threading.Thread(target=_background_refresh, args=(snapshot_path,), name='snapshot-refresh',
+                                           daemon=True)
+        _refresh_thread.start()
+
+
+def _background_refresh(snapshot_path):
+    """
+    Refreshes a stale or rolled over snapshot while requests keep being served from the current index. If another
+    process already holds the refresh lock it is doing the same crawl, so this one gives up and picks up the new
+    snapshot once its mtime changes.
+    """
+    lock = RefreshLock(_lock_path(snapshot_path))
+    if not lock.acquire(blocking=False):
+        return
+    try:
+        # Another process may have finished a refresh since this one was scheduled
+        index = _course_index
+        stamp = _snapshot_stamp(snapshot_path)
+        if _is_fresh(stamp) and not (index is not None and index.stamp == stamp and index.rolled_over()):
+            return
+        _refresh_snapshot(snapshot_path)
+        print(f"[INFO - {time.strftime('%Y-%m-%d %H:%M:%S')}] Kuali courses refreshed in the background.")
+    except Exception as e:
+        print(f"[ERROR - {time.strftime('%Y-%m-%d %H:%M:%S')}] An error occurred while refreshing Kuali courses in "
+              f"the background:\n{e}")
+    finally:
+        lock.release()
+
+
+def get_course_index(terminal=False) -> CourseIndex:
+    """
+    This function will return the in-memory CourseIndex for courses.json. The index is only rebuilt when the snapshot
+    file changed on disk since the index was built, otherwise the index already in memory is returned. With the sqlite
+    SNAPSHOT_STORE a SqliteCourseIndex over courses.db is returned instead, and with the mmap SNAPSHOT_STORE a
+    MmapCourseIndex over courses.bin, which have the same interface.
+
+    If the snapshot is older than 24 hours, or its catalog has ended, the current index keeps being served while a single background thread
+    refreshes it from the Kuali API. Only when there is no snapshot at all does the caller wait for the crawl, and
+    even then only one process crawls while the others wait for its snapshot.
+
+    :param terminal: True when running from the terminal instead of the web application
+    :return: The CourseIndex for the current snapshot
+    """
+    global _course_index
+    snapshot_path = _snapshot_file(terminal)
+    stamp = _snapshot_stamp(snapshot_path)
+
+    if stamp is not None:
+        index = _course_index
+        if index is None or index.path != snapshot_path or index.stamp != stamp:
+            with _index_lock:
+                # Another thread may have rebuilt the index while this one waited for the lock
+                index = _course_index
+                stamp = _snapshot_stamp(snapshot_path)
+                if index is None or index.path != snapshot_path or index.stamp != stamp:
+                    index = None
+                    try:
+                        index = _open_index(snapshot_path, stamp)
+                    except (ValueError, sqlite3.DatabaseError) as e:
+                        # A corrupt JSON (json.JSONDecodeError) or binary snapshot raises a ValueError
+                        print(f"Error decoding snapshot: {e}. Re-fetching data from Kuali API.")
+                        os.remove(snapshot_path)
+                    else:
+                        _count('reloads')
+                        _course_index = index
+                else:
+                    _count('hits')
+        else:
+            _count('hits')
+
+        if index is not None:
+            if not _is_fresh(stamp) or index.rolled_over():
+                # Serve the stale index while it is refreshed
+                _schedule_refresh(snapshot_path)
+            return index
+
+    # There is no snapshot to serve, wait for the process that crawls or crawl in this one
+    with RefreshLock(_lock_path(snapshot_path)):
+        if _snapshot_stamp(snapshot_path) is None:
+            return _refresh_snapshot(snapshot_path)
+    return get_course_index(terminal)
+
+
+def preload_index(terminal=False):
+    """
+    This function will load the index of the current snapshot ahead of the first request. Passenger imports the
+    application once and forks its workers from that process, so an index loaded here is shared by every worker
+    copy-on-write instead of being parsed again by each worker on its first request.
+
+    Unlike get_course_index() it never starts a background refresh of a stale snapshot. A thread running while the
+    workers are forked would leave them with locks held by a thread that doesn't exist in them, so the first request
+    of a worker schedules the refresh instead. It doesn't crawl the catalog when there is no snapshot either, a crawl
+    takes far longer than Passenger waits for the application to start. cron_update.py or the first request fetches
+    it instead.
+
+    The SQLite connection a sqlite index opens while loading is closed again, so no worker inherits it.
+
+    :param terminal: True when running from the terminal instead of the web application
+    :return: The loaded index, or None if there is no snapshot yet
+    """
+    global _course_index
+    snapshot_path = _snapshot_file(terminal)
+    stamp = _snapshot_stamp(snapshot_path)
+    if stamp is None:
+        print(f"[INFO - {time.strftime('%Y-%m-%d %H:%M:%S')}] There is no snapshot to preload yet.")
+        return None
+    with _index_lock:
+        _course_index = _open_index(snapshot_path, stamp)
+        _count('reloads')
+        if SNAPSHOT_STORE == 'sqlite':
+            _course_index.close()
+    return _course_index
+
+
+def load_courses(force=False, terminal=False, workers=None, full=False) -> dict:
+    """
+    This function will check if there is a json file in the appdata directory called courses.json. If the file exists,
+    the function will load the file and return a dictionary of Course objects. If the file does not exist, the function
+    will call the get_courses() function to get the courses from the Kuali API and save them to a json file. It will
+    also check if the file is older than 24 hours. If the file is older than 24 hours, the function will call the
+    get_courses() function in the background to get the courses from the Kuali API and overwrite/write them to the
+    json file, while the current courses keep being returned.
+
+    The loaded courses are kept in memory by get_course_index(), so the file is only parsed again once it changes.
+
+    :param force: True to re-fetch the courses from the Kuali API even if courses.json is fresh
+    :param terminal: True when running from the terminal instead of the web application
+    :param workers: The number of experiences fetched in parallel when the courses are re-fetched
+    :param full: True to discard the experience cache and re-fetch every experience instead of only the changed ones
+    :return: A dictionary of Course objects
+    """
+    if force:
+        snapshot_path = _snapshot_file(terminal)
+        with RefreshLock(_lock_path(snapshot_path)):
+            return _refresh_snapshot(snapshot_path, workers, full).courses
+
+    return get_course_index(terminal).courses
+
 
 def sanitize_input(input_value):
     """
@@ -246,7 +1335,94 @@ def sanitize_input(input_value):
     return input_value.strip().upper() # Strip leading and trailing whitespace of all kinds
 
 
-if __name__ == "__main__":
+def read_course_codes(codes, files=()):
+    """
+    This function will return the sanitized course codes given on the command line and in files, in the order they
+    were given and without duplicates. Codes in a file are separated by lines, commas, semicolons or tabs, so a
+    transcript copied from a spreadsheet can be passed as it is. The file - is stdin.
+
+    :param codes: Course codes given as arguments, each may hold several separated by commas
+    :param files: Paths of files with course codes
+    :return: A list of sanitized course codes
+    """
+    values = list(codes)
+    for path in files:
+        if path == '-':
+            values.append(sys.stdin.read())
+        else:
+            with open(path, 'r') as f:
+                values.append(f.read())
+    found = {}
+    for value in values:
+        for code in re.split(r'[,;\t\r\n]+', value):
+            code = sanitize_input(code)
+            if code:
+                found[code] = None
+    return list(found)
+
+
+def lookup_records(index, course_codes):
+    """
+    Generates the result of every course code looked up in an index as a dictionary, with the closest course codes as
+    suggestions when a course code isn't found.
+    """
+    for course_code in course_codes:
+        course = index.get(course_code)
+        certs = course.Certifications if course else []
+        record = {
+            'course': course_code,
+            'found': bool(certs),
+            'credits': course.credits if course else None,
+            'certifications': [{'title': cert.title.strip(), 'provider': cert.provider.strip(), 'pid': cert.pid}
+                               for cert in certs]
+        }
+        if not certs:
+            record['suggestions'] = index.suggest(course_code)
+        yield record
+
+
+def export_records(index):
+    """
+    Generates every course of an index as a dictionary in alphanum_key order.
+    """
+    for course_code in index.codes():
+        course = index.get(course_code)
+        yield {
+            'course': course_code,
+            'credits': course.credits,
+            'catalog': course.catalog,
+            'certifications': [{'title': cert.title.strip(), 'provider': cert.provider.strip(), 'pid': cert.pid}
+                               for cert in course.Certifications]
+        }
+
+
+def write_records(records, output_format, out):
+    """
+    This function will write records from lookup_records() or export_records() as they are generated, one JSON object
+    per line or one CSV row per course and certification. A course without certifications gets a row with empty
+    certification columns.
+
+    :param records: The records to write
+    :param output_format: Either jsonl or csv
+    :param out: The text stream written to
+    """
+    if output_format == 'jsonl':
+        for record in records:
+            out.write(json.dumps(record) + '\n')
+        return
+    import csv
+    writer = csv.writer(out)
+    writer.writerow(['course', 'credits', 'pid', 'title', 'provider'])
+    for record in records:
+        for cert in record['certifications'] or [{'pid': '', 'title': '', 'provider': ''}]:
+            writer.writerow([record['course'], record['credits'], cert['pid'], cert['title'], cert['provider']])
+
+
+def interactive():
+    """
+    This function will answer course codes typed at a prompt until 'exit' is entered, the behavior of the terminal
+    application when it is started without a command.
+    """
     print("Acquiring course information... Please wait.")
     crses = load_courses(terminal=True)
     while True:
@@ -262,3 +1438,88 @@ if __name__ == "__main__":
                 print(f"\tProvider: {str.strip(cert.provider)} | Certification: {str.strip(cert.title)}")
         else:
             print(f"No certifications found for course {course_to_match}")
+
+
+def main(argv=None):
+    """
+    This function will run the command line of the terminal application. Without a command it starts the interactive
+    prompt, otherwise:
+
+    refresh   fetches the catalog from the Kuali API into the data directory
+    lookup    looks up every course code given as an argument, in --file or on stdin in one run
+    export    writes every course with its certifications
+
+    lookup and export write JSON lines or CSV to stdout or --output as the records are generated.
+
+    :param argv: The arguments, sys.argv[1:] by default
+    """
+    import argparse
+    global DATA_DIR
+    parser = argparse.ArgumentParser(prog='kuali_driver', description="Find the certifications that satisfy SNHU "
+                                                                      "courses. Runs interactively without a command.")
+    parser.add_argument('--data-dir', help="Directory of courses.json and the experience cache, defaults to "
+                                           "SNHU_SHORTCUT_DATA or SNHU-Shortcut in APPDATA or ~/.cache")
+    commands = parser.add_subparsers(dest='command')
+
+    refresh_parser = commands.add_parser('refresh', help='Fetch the catalog from the Kuali API')
+    refresh_parser.add_argument('--workers', type=int, default=None, help='Experiences fetched in parallel')
+    refresh_parser.add_argument('--full', action='store_true', help='Re-fetch every experience, not only changed ones')
+
+    lookup_parser = commands.add_parser('lookup', help='Look up many course codes at once')
+    lookup_parser.add_argument('codes', nargs='*', help='Course codes, read from stdin when none and no --file given')
+    lookup_parser.add_argument('-f', '--file', action='append', default=[],
+                               help='File of course codes, one per line or comma separated, - for stdin')
+
+    export_parser = commands.add_parser('export', help='Write every course with its certifications')
+
+    for command_parser in (lookup_parser, export_parser):
+        command_parser.add_argument('--format', choices=('jsonl', 'csv'), default='jsonl', help='Output format')
+        command_parser.add_argument('-o', '--output', help='File written instead of stdout')
+    args = parser.parse_args(argv)
+
+    if args.data_dir:
+        DATA_DIR = os.path.abspath(args.data_dir)
+
+    if args.command is None:
+        interactive()
+        return
+    if args.command == 'refresh':
+        load_courses(force=True, terminal=True, workers=args.workers, full=args.full)
+        print(f"Refreshed {last_crawl_report.get('courses')} courses of catalog {last_crawl_report.get('catalog')} "
+              f"in {last_crawl_report.get('duration')}s into {get_data_path(True)}")
+        return
+
+    if args.command == 'lookup':
+        files = args.file or ([] if args.codes else ['-'])
+        course_codes = read_course_codes(args.codes, files)
+        if not course_codes:
+            parser.exit(2, "No course codes given.\n")
+    # The index of the snapshot is loaded once and never refreshed in the background, a stale snapshot is updated
+    # with the refresh command. The catalog is only crawled when there is no snapshot yet.
+    try:
+        index = preload_index(terminal=True) or get_course_index(terminal=True)
+    except (ValueError, sqlite3.DatabaseError) as e:
+        # A corrupt or truncated JSON (json.JSONDecodeError) or binary snapshot raises a ValueError
+        print(f"[ERROR - {time.strftime('%Y-%m-%d %H:%M:%S')}] The snapshot in {get_data_path(True)} can't be read: "
+              f"{e}. Run 'python kuali_driver.py refresh' to fetch it again.", file=sys.stderr)
+        parser.exit(1)
+    if not _is_fresh(index.stamp) or index.rolled_over():
+        reason = "its catalog has ended" if index.rolled_over() else \
+            f"it is from {time.strftime('%Y-%m-%d %H:%M', time.localtime(index.stamp[0] / 1e9))}"
+        print(f"[WARNING - {time.strftime('%Y-%m-%d %H:%M:%S')}] The snapshot in {get_data_path(True)} is stale, "
+              f"{reason}. Run 'python kuali_driver.py refresh' to update it.", file=sys.stderr)
+    records = lookup_records(index, course_codes) if args.command == 'lookup' else export_records(index)
+
+    out = open(args.output, 'w', newline='') if args.output else sys.stdout
+    try:
+        write_records(records, args.format, out)
+    except BrokenPipeError:
+        # The reader stopped early, e.g. head. Point stdout at devnull so flushing it at exit doesn't fail again.
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
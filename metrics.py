@@ -0,0 +1,174 @@
+from logging.handlers import QueueHandler, QueueListener
+from contextlib import contextmanager
+from bisect import bisect_left
+import threading
+import logging
+import atexit
+import queue
+import time
+import sys
+import os
+
+# Upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """
+    This class is a fixed bucket latency histogram. Every observation increments the first bucket whose bound is
+    greater than or equal to it, buckets are only made cumulative when rendered.
+    """
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        # The last count is the +Inf bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """
+        Returns (bound, count) pairs of the cumulative buckets, the last bound being '+Inf'.
+        """
+        total = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            yield bound, total
+
+
+class Metrics:
+    """
+    This class collects the request metrics of a process: a counter of requests per route and status, and a latency
+    histogram per route and stage (e.g. index, lookup, render, serialize or total). render() writes them in the
+    Prometheus text exposition format.
+
+    Every Passenger worker has its own Metrics, so a scrape only reflects the worker that answered it.
+    """
+    def __init__(self, prefix='snhu_shortcut', buckets=LATENCY_BUCKETS):
+        self.prefix = prefix
+        self.buckets = buckets
+        self._requests = {}
+        self._latency = {}
+        self._lock = threading.Lock()
+
+    def count(self, route, status):
+        """
+        Counts a request of route answered with status.
+        """
+        key = (route, str(status))
+        with self._lock:
+            self._requests[key] = self._requests.get(key, 0) + 1
+
+    def observe(self, route, stage, seconds):
+        """
+        Records the time a stage of a request of route took.
+        """
+        key = (route, stage)
+        with self._lock:
+            histogram = self._latency.get(key)
+            if histogram is None:
+                histogram = self._latency[key] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, route, stage):
+        """
+        Context manager recording the time spent in its block as a stage of a request of route.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(route, stage, time.perf_counter() - start)
+
+    def render(self, gauges=None):
+        """
+        This function will render the metrics in the Prometheus text exposition format.
+
+        :param gauges: Optional list of (name, help, value) tuples added as gauges, e.g. cache sizes
+        :return: The metrics as text
+        """
+        lines = []
+        with self._lock:
+            name = self.prefix + '_requests_total'
+            lines += [f"# HELP {name} Requests answered per route and status.", f"# TYPE {name} counter"]
+            for (route, status), count in sorted(self._requests.items()):
+                lines.append(f'{name}{{route="{_escape(route)}",status="{status}"}} {count}')
+
+            name = self.prefix + '_stage_seconds'
+            lines += [f"# HELP {name} Time spent per route and request stage.", f"# TYPE {name} histogram"]
+            for (route, stage), histogram in sorted(self._latency.items()):
+                labels = f'route="{_escape(route)}",stage="{_escape(stage)}"'
+                for bound, count in histogram.cumulative():
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f'{name}_sum{{{labels}}} {histogram.sum:.6f}')
+                lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+
+        for gauge, description, value in gauges or ():
+            name = f"{self.prefix}_{gauge}"
+            lines += [f"# HELP {name} {description}", f"# TYPE {name} gauge", f"{name} {value}"]
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(label):
+    return str(label).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+####################
+# Access logging
+####################
+
+class _ListenerQueueHandler(QueueHandler):
+    """
+    This class queues log records for a QueueListener thread that writes them to the wrapped handler, so a request
+    only pays for putting a record on a queue. The listener is started lazily by the first record of each process,
+    because a thread started before Passenger forks its workers doesn't exist in them.
+    """
+    def __init__(self, handler):
+        super().__init__(queue.SimpleQueue())
+        self.handler = handler
+        self._pid = None
+        self._listener = None
+        self._start_lock = threading.Lock()
+
+    def enqueue(self, record):
+        if self._pid != os.getpid():
+            self._start()
+        self.queue.put_nowait(record)
+
+    def _start(self):
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            # Records queued in the parent process belong to its listener
+            self.queue = queue.SimpleQueue()
+            self._listener = QueueListener(self.queue, self.handler)
+            self._listener.start()
+            self._pid = os.getpid()
+            # Write out the records still queued when the process exits
+            atexit.register(self._listener.stop)
+
+
+def access_logger(name='snhu_shortcut.access', stream=None):
+    """
+    This function will return a logger whose records are written by a background thread instead of the request
+    thread, in the same [LEVEL - timestamp] format the print statements used. Passenger writes stdout to its log.
+
+    :param name: The name of the logger
+    :param stream: The stream written to, stdout by default
+    :return: The logger
+    """
+    logger = logging.getLogger(name)
+    if not logger.handlers:
+        handler = logging.StreamHandler(stream or sys.stdout)
+        handler.setFormatter(logging.Formatter('[%(levelname)s - %(asctime)s] %(message)s', '%Y-%m-%d %H:%M:%S'))
+        logger.addHandler(_ListenerQueueHandler(handler))
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+    return logger
@@ -0,0 +1,339 @@
+from collections.abc import Mapping
+from kuali_driver import Course, Cert, SnapshotIndex, alphanum_key, link_providers, provider_key, stored_courses, \
+    write_file
+from array import array
+import struct
+import math
+import mmap
+import time
+import sys
+
+# Layout of a binary snapshot. Every number is little endian and every section starts 8 byte aligned.
+#
+#   header       magic, format, course count, cert count, string count, provider count, created, valid_until (NaN
+#                when unknown) and the offsets of the sections below
+#   offsets      string count + 1 uint32, string i is pool[offsets[i]:offsets[i + 1]]
+#   pool         every distinct string of the snapshot once, UTF-8 encoded
+#   courses      6 uint32 per course sorted by the bytes of its code: code, title, credits, catalog (string ids),
+#                first link and link count of its certifications
+#   certs        5 uint32 per cert sorted by the bytes of its pid: title, provider, pid (string ids), first link and
+#                link count of its courses. Every cert of the snapshot is stored, also the ones no course links to.
+#   providers    3 uint32 per provider key sorted by its bytes: key (string id), first link and link count of its certs
+#   links        uint32 cert positions of the courses, uint32 course positions of the certs and uint32 cert positions
+#                of the providers in the order link_providers() sorts them
+#   codes        the searchable course codes in alphanum_key order, each one preceded and followed by a newline
+MAGIC = b'SNHUBIN1'
+FORMAT = 3
+HEADER = struct.Struct('<8sIIIIIdd7Q')
+COURSE_FIELDS = 6
+CERT_FIELDS = 5
+PROVIDER_FIELDS = 3
+
+# String id of a missing value, i.e. a course without credits
+NO_STRING = 0xFFFFFFFF
+
+# uint32 arrays are mapped in place, which needs a little endian machine
+_NATIVE = sys.byteorder == 'little' and array('I').itemsize == 4
+
+
+def write_mmap_snapshot(path, courses, certs=None, valid_until=None):
+    """
+    This function will write both views of a catalog to a binary snapshot that MmapCourseIndex maps in place. Like
+    write_snapshot() the file is built in a temporary file that then replaces path, so a process that still maps the
+    previous snapshot keeps reading it unchanged.
+
+    :param path: The path of the courses.bin file
+    :param courses: A dictionary of Course objects indexed by course code
+    :param certs: A dictionary of Cert objects indexed by pid, the certs of courses when not given
+    :param valid_until: Timestamp at which the catalog of the snapshot ends, if known
+    """
+    write_file(path, _pack(courses, certs, valid_until))
+
+
+def _pack(courses, certs, valid_until):
+    strings = {}
+
+    def string_id(value):
+        if value is None:
+            return NO_STRING
+        if value not in strings:
+            strings[value] = len(strings)
+        return strings[value]
+
+    codes = stored_courses(courses)
+    if certs is None:
+        certs = {}
+        for course in codes.values():
+            for certificate in course.Certifications:
+                certs.setdefault(certificate.pid, certificate)
+
+    by_code = sorted(codes, key=lambda code: code.encode('utf-8'))
+    by_pid = sorted(certs, key=lambda pid: pid.encode('utf-8'))
+    course_positions = {code: position for position, code in enumerate(by_code)}
+    cert_positions = {pid: position for position, pid in enumerate(by_pid)}
+    searchable = sorted((code for code in codes if code != 'null'), key=alphanum_key)
+
+    links = array('I')
+    course_table = array('I')
+    for code in by_code:
+        course = codes[code]
+        first = len(links)
+        links.extend(cert_positions[certificate.pid] for certificate in course.Certifications)
+        course_table.extend((string_id(code), string_id(course.title), string_id(course.credits),
+                             string_id(course.catalog), first, len(links) - first))
+
+    # The courses of every cert in alphanum_key order, the order every snapshot store returns them in
+    cert_courses = {pid: {} for pid in by_pid}
+    for code in searchable:
+        for certificate in codes[code].Certifications:
+            cert_courses[certificate.pid][course_positions[code]] = None
+    cert_table = array('I')
+    for pid in by_pid:
+        certificate = certs[pid]
+        first = len(links)
+        links.extend(cert_courses[pid])
+        cert_table.extend((string_id(certificate.title), string_id(certificate.provider), string_id(pid), first,
+                           len(links) - first))
+
+    providers = link_providers(certs)
+    provider_table = array('I')
+    for key in sorted(providers, key=lambda key: key.encode('utf-8')):
+        first = len(links)
+        links.extend(cert_positions[certificate.pid] for certificate in providers[key])
+        provider_table.extend((string_id(key), first, len(links) - first))
+
+    encoded = [value.encode('utf-8') for value in strings]
+    offsets = array('I', [0])
+    for value in encoded:
+        offsets.append(offsets[-1] + len(value))
+    if not _NATIVE:
+        for table in (offsets, course_table, cert_table, provider_table, links):
+            table.byteswap()
+    sections = [offsets.tobytes(), b''.join(encoded), course_table.tobytes(), cert_table.tobytes(),
+                provider_table.tobytes(), links.tobytes(),
+                b'\n' + b''.join(code.encode('utf-8') + b'\n' for code in searchable)]
+
+    # offsets, pool, courses, certs, providers, links and codes, each padded to 8 bytes
+    body = bytearray()
+    starts = []
+    for section in sections:
+        body += b'\0' * (-(HEADER.size + len(body)) % 8)
+        starts.append(HEADER.size + len(body))
+        body += section
+    header = HEADER.pack(MAGIC, FORMAT, len(by_code), len(by_pid), len(strings), len(providers), time.time(),
+                         math.nan if valid_until is None else float(valid_until), *starts)
+    return header + bytes(body)
+
+
+class MmapSnapshot:
+    """
+    This class maps a binary snapshot read only and answers lookups straight from the mapped pages. Every Passenger
+    worker mapping the same file shares its pages through the page cache, so a worker only holds the objects of the
+    lookups it is answering. Replacing the file doesn't affect a mapping that is still in use, a new snapshot is picked
+    up by mapping the new file.
+    """
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            try:
+                self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise ValueError(f"{path} is empty, not a binary course snapshot")
+        if len(self.map) < HEADER.size:
+            raise ValueError(f"{path} is not a binary course snapshot")
+        (magic, version, self.course_count, self.cert_count, string_count, self.provider_count, self.created,
+         valid_until, offsets_start, self.pool_start, courses_start, certs_start, providers_start, links_start,
+         self.codes_start) = HEADER.unpack_from(self.map)
+        if magic != MAGIC or version != FORMAT or self.codes_start > len(self.map):
+            raise ValueError(f"{path} is not a binary course snapshot of format {FORMAT}")
+        self.valid_until = None if math.isnan(valid_until) else valid_until
+
+        self._view = memoryview(self.map)
+        self.offsets = self._table(offsets_start, string_count + 1)
+        self.courses = self._table(courses_start, self.course_count * COURSE_FIELDS)
+        self.certs = self._table(certs_start, self.cert_count * CERT_FIELDS)
+        self.providers = self._table(providers_start, self.provider_count * PROVIDER_FIELDS)
+        self.links = self._table(links_start, (self.codes_start - links_start) // 4)
+
+    def _table(self, start, count):
+        if _NATIVE:
+            return self._view[start:start + count * 4].cast('I')
+        # Big endian machines read a swapped copy instead
+        table = array('I', self.map[start:start + count * 4])
+        table.byteswap()
+        return table
+
+    def close(self):
+        for table in (self.offsets, self.courses, self.certs, self.providers, self.links, self._view):
+            if isinstance(table, memoryview):
+                table.release()
+        self.map.close()
+
+    def _bytes(self, string_id):
+        return self.map[self.pool_start + self.offsets[string_id]:self.pool_start + self.offsets[string_id + 1]]
+
+    def string(self, string_id):
+        return None if string_id == NO_STRING else self._bytes(string_id).decode('utf-8')
+
+    def _bisect(self, table, fields, key_field, count, key):
+        # Binary search of a table whose rows are sorted by the bytes of their key_field string
+        key = key.encode('utf-8')
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            if self._bytes(table[middle * fields + key_field]) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < count and self._bytes(table[low * fields + key_field]) == key:
+            return low
+        return None
+
+    def find_course(self, code):
+        """
+        Returns the position of a course code in the course table, or None.
+        """
+        if not isinstance(code, str):
+            return None
+        return self._bisect(self.courses, COURSE_FIELDS, 0, self.course_count, code)
+
+    def find_cert(self, pid):
+        """
+        Returns the position of a pid in the cert table, or None.
+        """
+        if not isinstance(pid, str):
+            return None
+        return self._bisect(self.certs, CERT_FIELDS, 2, self.cert_count, pid)
+
+    def find_provider(self, key):
+        """
+        Returns the position of a provider key in the provider table, or None.
+        """
+        return self._bisect(self.providers, PROVIDER_FIELDS, 0, self.provider_count, key)
+
+    def provider_certs(self, position):
+        """
+        Builds the Certs of the provider at a position of the provider table, without their courses.
+        """
+        key, first, count = self.providers[position * PROVIDER_FIELDS:(position + 1) * PROVIDER_FIELDS]
+        return [self.cert(cert_position, with_courses=False) for cert_position in self.links[first:first + count]]
+
+    def course_code(self, position):
+        return self.string(self.courses[position * COURSE_FIELDS])
+
+    def course(self, position):
+        """
+        Builds the Course at a position of the course table together with its certifications.
+        """
+        code, title, credits, catalog, first, count = self.courses[position * COURSE_FIELDS:
+                                                                   (position + 1) * COURSE_FIELDS]
+        course = Course(self.string(title), self.string(credits), self.string(catalog))
+        for cert_position in self.links[first:first + count]:
+            course.add_certification(self.cert(cert_position, with_courses=False))
+        return course
+
+    def cert(self, position, with_courses=True):
+        """
+        Builds the Cert at a position of the cert table, with the Course objects it satisfies if with_courses is set.
+        """
+        title, provider, pid, first, count = self.certs[position * CERT_FIELDS:(position + 1) * CERT_FIELDS]
+        courses = [self.course(course) for course in self.links[first:first + count]] if with_courses else None
+        return Cert(self.string(title), courses, self.string(provider), self.string(pid))
+
+    def codes(self):
+        """
+        Yields the searchable course codes in alphanum_key order.
+        """
+        start = self.codes_start + 1
+        end = len(self.map)
+        while start < end:
+            stop = self.map.find(b'\n', start, end)
+            yield self.map[start:stop].decode('utf-8')
+            start = stop + 1
+
+    def search(self, fragment):
+        """
+        Returns the course codes that contain fragment in alphanum_key order, found by scanning the code section of
+        the mapped file.
+        """
+        needle = fragment.encode('utf-8')
+        if not needle or b'\n' in needle:
+            return []
+        matches = []
+        position = self.codes_start
+        end = len(self.map)
+        while True:
+            hit = self.map.find(needle, position, end)
+            if hit < 0:
+                return matches
+            start = self.map.rfind(b'\n', self.codes_start, hit) + 1
+            stop = self.map.find(b'\n', hit, end)
+            matches.append(self.map[start:stop].decode('utf-8'))
+            position = stop
+
+
+class MmapCourses(Mapping):
+    """
+    This class is a read only dictionary view of the courses of a binary snapshot. A Course is only built when it is
+    looked up.
+    """
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+
+    def __getitem__(self, course_code):
+        course = self.get(course_code)
+        if course is None:
+            raise KeyError(course_code)
+        return course
+
+    def get(self, course_code, default=None):
+        position = self.snapshot.find_course(course_code)
+        return default if position is None else self.snapshot.course(position)
+
+    def __contains__(self, course_code):
+        return self.snapshot.find_course(course_code) is not None
+
+    def __iter__(self):
+        for position in range(self.snapshot.course_count):
+            yield self.snapshot.course_code(position)
+
+    def __len__(self):
+        return self.snapshot.course_count
+
+
+class MmapCourseIndex(SnapshotIndex):
+    """
+    This class serves a binary snapshot with the same interface as kuali_driver.CourseIndex. Exact lookups are binary
+    searches of the mapped course table and partial searches scan the mapped code section, so nothing but the looked
+    up courses is ever copied into the worker.
+    """
+    def __init__(self, path, stamp):
+        self.snapshot = MmapSnapshot(path)
+        self.courses = MmapCourses(self.snapshot)
+        super().__init__(path, stamp, self.snapshot.valid_until)
+
+    def search(self, fragment):
+        """
+        Returns the course codes that contain fragment in alphanum_key order.
+        """
+        return self.snapshot.search(fragment) if fragment else []
+
+    def codes(self):
+        """
+        Returns every searchable course code in alphanum_key order.
+        """
+        return self.snapshot.codes()
+
+    def get_cert(self, pid):
+        """
+        Returns the Cert of a pid with the courses it satisfies, or None if the pid isn't in the snapshot.
+        """
+        position = self.snapshot.find_cert(pid)
+        return None if position is None else self.snapshot.cert(position)
+
+    def get_provider(self, name):
+        """
+        Returns the Certs of a provider sorted by title, without their courses, or None if the provider isn't in the
+        snapshot.
+        """
+        position = self.snapshot.find_provider(provider_key(name))
+        return None if position is None else self.snapshot.provider_certs(position)
@@ -1,8 +1,11 @@
 import importlib.machinery
 import importlib.util
+import gc
 import os
 import sys
+import time
 from dash_app import app
+import kuali_driver as kd
 
 sys.path.insert(0, os.path.dirname(__file__))
 
@@ -16,4 +19,15 @@ def load_source(modname, filename):
 
 wsgi = load_source('wsgi', 'dash_app.py')
 """
+# Load the course index before Passenger forks the workers from this process, so they share it instead of each
+# parsing the snapshot on its first request. gc.freeze() moves everything loaded so far out of the collected
+# generations, so garbage collections in the workers don't write to (and copy) the shared pages.
+try:
+    kd.preload_index()
+except Exception as e:
+    # Start serving anyway, the first request loads the index like it would without the preload
+    print(f"[ERROR - {time.strftime('%Y-%m-%d %H:%M:%S')}] Could not preload the course index:\n{e}")
+gc.collect()
+gc.freeze()
+
 application = app.server
\ No newline at end of file
@@ -1 +1 @@
-pyinstaller --onefile 'kuali_driver.py' --icon ".\.images\icon.ico" --hidden-import=lxml --name="SNHU Shortcut"
\ No newline at end of file
+pyinstaller --onefile 'kuali_driver.py' --icon ".\.images\icon.ico" --hidden-import=lxml --hidden-import=kuali_crawler --hidden-import=snapshot_history --hidden-import=sqlite_store --hidden-import=mmap_store --hidden-import=metrics --name="SNHU Shortcut"
\ No newline at end of file
@@ -0,0 +1,366 @@
+from kuali_driver import write_file
+import argparse
+import gzip
+import json
+import time
+import os
+
+# Versions kept in the history, older ones are pruned unless they are pinned or the base of a kept version
+HISTORY_KEEP = int(os.getenv('SNHU_SHORTCUT_HISTORY_KEEP', '30'))
+
+# A delta whose encoded size exceeds this share of its base is stored as a new base instead
+DELTA_MAX_RATIO = 0.5
+
+# Sections of a snapshot that are stored as deltas, every other key of a version is stored as it is
+SECTIONS = ('courses', 'certs', 'providers')
+
+
+def make_delta(base, data):
+    """
+    This function will return the changes that turn the decoded snapshot base into data. For every section the entries
+    that were added or changed are stored under set and the keys that were removed under removed.
+
+    :param base: The decoded base snapshot
+    :param data: The decoded snapshot stored as a delta
+    :return: The delta
+    """
+    delta = {key: value for key, value in data.items() if key not in SECTIONS}
+    for section in SECTIONS:
+        old = base.get(section) or {}
+        new = data.get(section) or {}
+        delta[section] = {
+            'set': {key: value for key, value in new.items() if old.get(key) != value},
+            'removed': [key for key in old if key not in new]
+        }
+    return delta
+
+
+def apply_delta(base, delta):
+    """
+    This function will rebuild a decoded snapshot from its base and the delta make_delta() returned for it.
+
+    :param base: The decoded base snapshot
+    :param delta: The delta of the snapshot
+    :return: The decoded snapshot
+    """
+    data = {key: value for key, value in delta.items() if key not in SECTIONS}
+    for section in SECTIONS:
+        entries = dict(base.get(section) or {})
+        for key in delta[section]['removed']:
+            del entries[key]
+        entries.update(delta[section]['set'])
+        data[section] = entries
+    return data
+
+
+def diff_snapshots(old, new):
+    """
+    This function will return what changed between two decoded snapshots: the (course, cert) mappings that were added
+    and removed, the courses that were added and removed, the certs whose title was renamed and the providers that
+    were renamed. A provider only counts as renamed when every cert it had that is still in the new snapshot moved to
+    the same new name, that name wasn't used before and no cert of the new snapshot has the old name. Every other cert
+    whose provider changed is listed under changed_providers. Entries that are equal in both snapshots are skipped by
+    a single comparison, so only the changed ones are looked at.
+
+    :param old: The decoded snapshot of the previous version
+    :param new: The decoded snapshot of the new version
+    :return: The changes, every list sorted
+    """
+    old_courses, new_courses = old.get('courses') or {}, new.get('courses') or {}
+    old_certs, new_certs = old.get('certs') or {}, new.get('certs') or {}
+
+    def cert(certs, pid, course=None):
+        change = {'pid': pid, 'title': certs[pid]['title'], 'provider': certs[pid]['provider']}
+        return change if course is None else dict(change, course=course)
+
+    added, removed = [], []
+    for code in old_courses.keys() | new_courses.keys():
+        before, after = old_courses.get(code), new_courses.get(code)
+        if before == after:
+            continue
+        before_pids = set(before['Certifications']) if before else set()
+        after_pids = set(after['Certifications']) if after else set()
+        added += [cert(new_certs, pid, code) for pid in after_pids - before_pids]
+        removed += [cert(old_certs, pid, code) for pid in before_pids - after_pids]
+
+    renamed_certs = []
+    # The providers every kept cert of an old provider has now, and the certs that changed provider
+    moves, moved = {}, []
+    for pid in old_certs.keys() & new_certs.keys():
+        before, after = old_certs[pid], new_certs[pid]
+        if before['title'] != after['title']:
+            renamed_certs.append({'pid': pid, 'from': before['title'], 'to': after['title']})
+        moves.setdefault(before['provider'], set()).add(after['provider'])
+        if before['provider'] != after['provider']:
+            moved.append({'pid': pid, 'title': after['title'], 'from': before['provider'], 'to': after['provider']})
+
+    # A provider whose certs moved to a name that was already in use was merged into it, not renamed
+    old_providers = {certificate['provider'] for certificate in old_certs.values()}
+    new_providers = {certificate['provider'] for certificate in new_certs.values()}
+    renamed_providers = {provider: next(iter(targets)) for provider, targets in moves.items()
+                         if len(targets) == 1 and provider not in new_providers and not targets & old_providers}
+    changed_providers = [change for change in moved if change['from'] not in renamed_providers]
+
+    by_mapping = lambda change: (change['course'], change['pid'])
+    return {
+        'added': sorted(added, key=by_mapping),
+        'removed': sorted(removed, key=by_mapping),
+        'added_courses': sorted(new_courses.keys() - old_courses.keys()),
+        'removed_courses': sorted(old_courses.keys() - new_courses.keys()),
+        'added_certs': [cert(new_certs, pid) for pid in sorted(new_certs.keys() - old_certs.keys())],
+        'removed_certs': [cert(old_certs, pid) for pid in sorted(old_certs.keys() - new_certs.keys())],
+        'renamed_certs': sorted(renamed_certs, key=lambda change: change['pid']),
+        'renamed_providers': [{'from': before, 'to': after} for before, after in sorted(renamed_providers.items())],
+        'changed_providers': sorted(changed_providers, key=lambda change: change['pid'])
+    }
+
+
+class SnapshotHistory:
+    """
+    This class keeps every refresh of the snapshot as a version in a history directory, so an earlier crawl can be
+    looked up or served again. The first version of a catalog is stored in full as a base, later versions of the same
+    catalog as a delta against that base, and a version is loaded from at most two files. A new base is started when
+    the catalog changes or a delta grows past DELTA_MAX_RATIO of its base.
+
+    manifest.json lists the versions oldest first, the version that is served and the pinned version. While a version
+    is pinned refreshes are still recorded, but the pinned version keeps being served. Every version but the first
+    also has a change file with the diff_snapshots() of the version before it, which changes() serves as a feed.
+    Changes to the history must be made while holding the RefreshLock of the data directory.
+    """
+    def __init__(self, history_dir, keep=HISTORY_KEEP):
+        self.history_dir = history_dir
+        self.keep = keep
+        self.manifest_path = os.path.join(history_dir, 'manifest.json')
+        self._bases = {}
+
+    def manifest(self):
+        """
+        Returns the decoded manifest, an empty one if there is no history yet.
+        """
+        try:
+            with open(self.manifest_path, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'versions': [], 'serving': None, 'pinned': None, 'sequence': 0}
+
+    def _save_manifest(self, manifest):
+        write_file(self.manifest_path, json.dumps(manifest, indent=2).encode('utf-8'), '.history-')
+
+    def versions(self):
+        """
+        Returns the entries of every version oldest first, with their id, catalog, created, base, size and courses.
+        """
+        return self.manifest()['versions']
+
+    def version(self, version_id):
+        """
+        Returns the entry of a version or raises a ValueError if it isn't in the history.
+        """
+        for entry in self.versions():
+            if entry['id'] == version_id:
+                return entry
+        raise ValueError(f"Unknown snapshot version {version_id}")
+
+    @property
+    def pinned(self):
+        return self.manifest()['pinned']
+
+    @property
+    def serving(self):
+        return self.manifest()['serving']
+
+    def _read(self, file_name):
+        with gzip.open(os.path.join(self.history_dir, file_name), 'rb') as f:
+            return json.load(f)
+
+    def _base(self, entry):
+        # Bases never change once written, keep the last one decoded since most loads share it
+        if entry['id'] not in self._bases:
+            self._bases.clear()
+            self._bases[entry['id']] = self._read(entry['file'])
+        return self._bases[entry['id']]
+
+    def load(self, version_id):
+        """
+        This function will return the decoded snapshot of a version, in the layout write_snapshot() writes.
+
+        :param version_id: The id of the version
+        :return: The decoded snapshot
+        """
+        entry = self.version(version_id)
+        if entry['base'] is None:
+            return self._read(entry['file'])
+        return apply_delta(self._base(self.version(entry['base'])), self._read(entry['file']))
+
+    def record(self, data):
+        """
+        This function will add a decoded snapshot to the history as its newest version, unless it only differs from
+        the newest version by its created time. The version becomes the served one unless another version is pinned.
+
+        :param data: The decoded snapshot, in the layout write_snapshot() writes
+        :return: The entry of the version holding data
+        """
+        os.makedirs(self.history_dir, exist_ok=True)
+        # Compare and store the snapshot as it reads back, e.g. the course code None becomes 'null'
+        encoded = json.dumps(data).encode('utf-8')
+        data = json.loads(encoded)
+        manifest = self.manifest()
+        catalog = data.get('catalog') or 'mixed'
+        latest = manifest['versions'][-1] if manifest['versions'] else None
+
+        previous = None
+        if latest is not None:
+            previous = self.load(latest['id'])
+            if {key: value for key, value in previous.items() if key != 'created'} == \
+                    {key: value for key, value in data.items() if key != 'created'}:
+                return latest
+
+        base_entry = None
+        if latest is not None and latest['catalog'] == catalog:
+            base_entry = latest if latest['base'] is None else self.version(latest['base'])
+
+        content = None
+        if base_entry is not None:
+            content = gzip.compress(json.dumps(make_delta(self._base(base_entry), data)).encode('utf-8'), mtime=0)
+            if len(content) > base_entry['size'] * DELTA_MAX_RATIO:
+                base_entry = content = None
+        if content is None:
+            content = gzip.compress(encoded, mtime=0)
+
+        manifest['sequence'] += 1
+        version_id = f"{catalog}-{manifest['sequence']}"
+        entry = {
+            'id': version_id,
+            'catalog': catalog,
+            'created': data.get('created', time.time()),
+            'base': None if base_entry is None else base_entry['id'],
+            'file': f"{version_id}.json.gz",
+            'size': len(content),
+            'courses': len(data.get('courses') or ()),
+            'previous': None if latest is None else latest['id'],
+            'changes': None
+        }
+        write_file(os.path.join(self.history_dir, entry['file']), content, '.history-')
+        if previous is not None:
+            changes = diff_snapshots(previous, data)
+            write_file(os.path.join(self.history_dir, f"{version_id}.changes.json"),
+                       json.dumps(changes).encode('utf-8'), '.history-')
+            entry['changes'] = {key: len(value) for key, value in changes.items()}
+        manifest['versions'].append(entry)
+        if manifest['pinned'] is None:
+            manifest['serving'] = version_id
+        self._prune(manifest)
+        self._save_manifest(manifest)
+        return entry
+
+    def changes(self, since=None):
+        """
+        This function will return the changes recorded after a version, oldest first, so a consumer that synced up to
+        since only has to apply them. Every item holds the version, the version it was compared to, when it was
+        created and its diff_snapshots().
+
+        :param since: The id of the last version the consumer has, every retained change when None
+        :return: The list of changes, or None if since or a version after it was pruned, in which case the consumer
+                 has to fetch the whole snapshot again
+        """
+        versions = self.versions()
+        ids = [entry['id'] for entry in versions]
+        if since is not None:
+            if since not in ids:
+                return None
+            versions = versions[ids.index(since) + 1:]
+        feed = []
+        contiguous = since is not None
+        for entry in versions:
+            if contiguous and entry.get('previous') != since:
+                # A version in between was pruned together with its changes
+                return None
+            if entry.get('changes') is not None:
+                with open(os.path.join(self.history_dir, f"{entry['id']}.changes.json"), 'r') as f:
+                    feed.append({'version': entry['id'], 'previous': entry['previous'], 'created': entry['created'],
+                                 **json.load(f)})
+            since = entry['id']
+        return feed
+
+    def pin(self, version_id):
+        """
+        Pins a version, which is served from then on until unpin() is called.
+        """
+        self.version(version_id)
+        manifest = self.manifest()
+        manifest['pinned'] = manifest['serving'] = version_id
+        self._save_manifest(manifest)
+
+    def unpin(self):
+        """
+        Removes the pin and returns the newest version, which is served again, or None if the history is empty.
+        """
+        manifest = self.manifest()
+        manifest['pinned'] = None
+        manifest['serving'] = manifest['versions'][-1]['id'] if manifest['versions'] else None
+        self._save_manifest(manifest)
+        return manifest['serving']
+
+    def previous(self):
+        """
+        Returns the id of the version recorded before the served one, or raises a ValueError if there is none.
+        """
+        manifest = self.manifest()
+        ids = [entry['id'] for entry in manifest['versions']]
+        if manifest['serving'] not in ids or ids.index(manifest['serving']) == 0:
+            raise ValueError("There is no earlier snapshot version to roll back to")
+        return ids[ids.index(manifest['serving']) - 1]
+
+    def _prune(self, manifest):
+        versions = manifest['versions']
+        kept = versions[-self.keep:] if self.keep > 0 else []
+        needed = {entry['id'] for entry in kept} | {manifest['pinned'], manifest['serving']}
+        needed |= {entry['base'] for entry in versions if entry['id'] in needed}
+        for entry in versions:
+            if entry['id'] not in needed:
+                for file_name in (entry['file'], f"{entry['id']}.changes.json"):
+                    try:
+                        os.remove(os.path.join(self.history_dir, file_name))
+                    except FileNotFoundError:
+                        pass
+        manifest['versions'] = [entry for entry in versions if entry['id'] in needed]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="List, pin or roll back the snapshot versions of SNHU Shortcut.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('list', help='List the snapshot versions, oldest first')
+    pin_parser = commands.add_parser('pin', help='Serve a version until it is unpinned')
+    pin_parser.add_argument('version')
+    commands.add_parser('unpin', help='Serve the newest version again')
+    commands.add_parser('rollback', help='Pin the version before the one that is served')
+    args = parser.parse_args()
+
+    try:
+        run(args)
+    except (ValueError, BlockingIOError) as e:
+        parser.exit(1, f"{e}\n")
+
+
+def run(args):
+    import kuali_driver as kd
+    if args.command == 'list':
+        history = kd.get_history()
+        manifest = history.manifest()
+        for entry in manifest['versions']:
+            flags = ''.join([' serving' if entry['id'] == manifest['serving'] else '',
+                             ' pinned' if entry['id'] == manifest['pinned'] else ''])
+            kind = 'base' if entry['base'] is None else f"delta of {entry['base']}"
+            print(f"{entry['id']}\t{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(entry['created']))}\t"
+                  f"{entry['courses']} courses\t{entry['size']} bytes\t{kind}{flags}")
+    elif args.command == 'pin':
+        kd.pin_version(args.version)
+        print(f"Pinned snapshot version {args.version}")
+    elif args.command == 'unpin':
+        print(f"Serving snapshot version {kd.unpin_version()}")
+    else:
+        print(f"Rolled back to snapshot version {kd.rollback_version()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,254 @@
+from collections.abc import Mapping
+from kuali_driver import Course, Cert, SnapshotIndex, alphanum_key, link_providers, provider_key, replace_file, \
+    stored_courses
+import threading
+import sqlite3
+import time
+import os
+
+# Version of the layout below, stored in the meta table. A snapshot of another version is rejected when it is opened,
+# which makes get_course_index() fetch it again.
+FORMAT = 3
+
+# Normalized layout of a snapshot. Providers and certs are stored once, every cert of the snapshot including the ones
+# no course links to, and courses reference certs through course_certs, whose position keeps the order certifications
+# had in the catalog. provider_certs lists the certs of every provider key in the order link_providers() sorts them.
+SCHEMA = """
+CREATE TABLE meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE providers (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE certs (
+    pid TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    provider_id INTEGER NOT NULL REFERENCES providers(id)
+);
+CREATE TABLE courses (
+    code TEXT PRIMARY KEY,
+    title TEXT,
+    credits TEXT,
+    catalog TEXT,
+    sort_order INTEGER NOT NULL
+);
+CREATE TABLE course_certs (
+    course_code TEXT NOT NULL REFERENCES courses(code),
+    position INTEGER NOT NULL,
+    pid TEXT NOT NULL REFERENCES certs(pid),
+    PRIMARY KEY (course_code, position)
+) WITHOUT ROWID;
+CREATE TABLE provider_certs (
+    provider_key TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    pid TEXT NOT NULL REFERENCES certs(pid),
+    PRIMARY KEY (provider_key, position)
+) WITHOUT ROWID;
+CREATE INDEX course_certs_pid ON course_certs(pid);
+CREATE INDEX courses_sort_order ON courses(sort_order);
+CREATE INDEX certs_provider ON certs(provider_id);
+"""
+
+# Trigram full text table used for partial searches. The trigram tokenizer needs SQLite 3.34 or newer, older builds
+# fall back to scanning the courses table.
+FTS_SCHEMA = "CREATE VIRTUAL TABLE course_search USING fts5(code, tokenize='trigram')"
+
+
+def write_sqlite_snapshot(db_path, courses, certs=None, valid_until=None):
+    """
+    This function will write both views of a catalog to a SQLite snapshot. Like write_snapshot() the database is built
+    in a temporary file that then replaces db_path, so readers never open a half-written database.
+
+    :param db_path: The path of the courses.db file
+    :param courses: A dictionary of Course objects indexed by course code
+    :param certs: A dictionary of Cert objects indexed by pid, the certs of courses when not given
+    :param valid_until: Timestamp at which the catalog of the snapshot ends, if known
+    """
+    with replace_file(db_path) as tmp_path:
+        connection = sqlite3.connect(tmp_path)
+        try:
+            _fill(connection, courses, certs, valid_until)
+            connection.commit()
+        finally:
+            connection.close()
+
+
+def _fill(connection, courses, certs, valid_until):
+    connection.executescript(SCHEMA)
+    try:
+        connection.execute(FTS_SCHEMA)
+        fts = True
+    except sqlite3.OperationalError:
+        fts = False
+
+    codes = stored_courses(courses)
+    if certs is None:
+        certs = {}
+        for course in codes.values():
+            for certificate in course.Certifications:
+                certs.setdefault(certificate.pid, certificate)
+    providers = {}
+    for pid, certificate in certs.items():
+        if certificate.provider not in providers:
+            providers[certificate.provider] = len(providers) + 1
+            connection.execute("INSERT INTO providers VALUES (?, ?)",
+                               (providers[certificate.provider], certificate.provider))
+        connection.execute("INSERT INTO certs VALUES (?, ?, ?)", (pid, certificate.title,
+                                                                  providers[certificate.provider]))
+
+    for sort_order, code in enumerate(sorted(codes, key=alphanum_key)):
+        course = codes[code]
+        connection.execute("INSERT INTO courses VALUES (?, ?, ?, ?, ?)",
+                           (code, course.title, course.credits, course.catalog, sort_order))
+        if fts:
+            connection.execute("INSERT INTO course_search (code) VALUES (?)", (code,))
+        connection.executemany("INSERT INTO course_certs VALUES (?, ?, ?)",
+                               [(code, position, certificate.pid)
+                                for position, certificate in enumerate(course.Certifications)])
+
+    for key, provider_certs in link_providers(certs).items():
+        connection.executemany("INSERT INTO provider_certs VALUES (?, ?, ?)",
+                               [(key, position, certificate.pid) for position, certificate in enumerate(provider_certs)])
+
+    connection.executemany("INSERT INTO meta VALUES (?, ?)", [
+        ('format', str(FORMAT)),
+        ('fts', '1' if fts else '0'),
+        ('created', str(time.time())),
+        ('valid_until', None if valid_until is None else str(valid_until))
+    ])
+
+
+class SqliteCourses(Mapping):
+    """
+    This class is a read only dictionary view of the courses in a SQLite snapshot. Every lookup is an indexed query,
+    so nothing but the requested course is ever loaded into memory. Each thread gets its own read only connection, and
+    so does each process: SQLite connections must not be used across fork(), so a worker forked from the process that
+    opened one opens its own.
+    """
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+
+    def connection(self):
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            local.connection = sqlite3.connect('file:' + self.db_path + '?mode=ro', uri=True, check_same_thread=False)
+            local.pid = os.getpid()
+        return local.connection
+
+    def close(self):
+        """
+        Closes the connection of the calling thread, the next lookup of the thread opens a new one.
+        """
+        local = self._local
+        if getattr(local, 'pid', None) == os.getpid():
+            local.connection.close()
+        local.connection = local.pid = None
+
+    def __getitem__(self, course_code):
+        course = self.get(course_code)
+        if course is None:
+            raise KeyError(course_code)
+        return course
+
+    def get(self, course_code, default=None):
+        connection = self.connection()
+        row = connection.execute("SELECT title, credits, catalog FROM courses WHERE code = ?",
+                                 (course_code,)).fetchone()
+        if row is None:
+            return default
+        course = Course(*row)
+        for title, provider, pid in connection.execute(
+                "SELECT certs.title, providers.name, certs.pid FROM course_certs "
+                "JOIN certs ON certs.pid = course_certs.pid "
+                "JOIN providers ON providers.id = certs.provider_id "
+                "WHERE course_certs.course_code = ? ORDER BY course_certs.position", (course_code,)):
+            course.add_certification(Cert(title, None, provider, pid))
+        return course
+
+    def __contains__(self, course_code):
+        return self.connection().execute("SELECT 1 FROM courses WHERE code = ?", (course_code,)).fetchone() is not None
+
+    def __iter__(self):
+        for (code,) in self.connection().execute("SELECT code FROM courses ORDER BY sort_order"):
+            yield code
+
+    def __len__(self):
+        return self.connection().execute("SELECT COUNT(*) FROM courses").fetchone()[0]
+
+
+class SqliteCourseIndex(SnapshotIndex):
+    """
+    This class serves a SQLite snapshot with the same interface as kuali_driver.CourseIndex. Exact lookups use the
+    courses primary key and partial searches use the course_search trigram table, so the dataset never has to be
+    loaded as a whole.
+    """
+    def __init__(self, path, stamp):
+        self.courses = SqliteCourses(path)
+        meta = dict(self.courses.connection().execute("SELECT key, value FROM meta"))
+        if meta.get('format') != str(FORMAT):
+            raise sqlite3.DatabaseError(f"{path} is not a SQLite course snapshot of format {FORMAT}")
+        self.fts = meta['fts'] == '1'
+        super().__init__(path, stamp, float(meta['valid_until']) if meta.get('valid_until') else None)
+
+    def close(self):
+        """
+        Closes the connection of the calling thread, see SqliteCourses.close().
+        """
+        self.courses.close()
+
+    def codes(self):
+        """
+        Returns every searchable course code in alphanum_key order.
+        """
+        for (code,) in self.courses.connection().execute("SELECT code FROM courses WHERE code != 'null' "
+                                                         "ORDER BY sort_order"):
+            yield code
+
+    def get_cert(self, pid):
+        """
+        Returns the Cert of a pid with the courses it satisfies, or None if the pid isn't in the snapshot.
+        """
+        connection = self.courses.connection()
+        row = connection.execute("SELECT certs.title, providers.name FROM certs "
+                                 "JOIN providers ON providers.id = certs.provider_id WHERE certs.pid = ?",
+                                 (pid,)).fetchone()
+        if row is None:
+            return None
+        codes = [code for (code,) in connection.execute(
+            "SELECT course_certs.course_code FROM course_certs JOIN courses ON courses.code = course_certs.course_code "
+            "WHERE course_certs.pid = ? AND courses.code != 'null' ORDER BY courses.sort_order", (pid,))]
+        return Cert(row[0], [self.courses[code] for code in codes], row[1], pid)
+
+    def get_provider(self, name):
+        """
+        Returns the Certs of a provider sorted by title, without their courses, or None if the provider isn't in the
+        snapshot.
+        """
+        rows = self.courses.connection().execute(
+            "SELECT certs.title, providers.name, certs.pid FROM provider_certs "
+            "JOIN certs ON certs.pid = provider_certs.pid JOIN providers ON providers.id = certs.provider_id "
+            "WHERE provider_certs.provider_key = ? ORDER BY provider_certs.position", (provider_key(name),))
+        certs = [Cert(title, None, provider, pid) for title, provider, pid in rows]
+        return certs or None
+
+    def search(self, fragment):
+        """
+        Returns the course codes that contain fragment in alphanum_key order.
+        """
+        if not fragment:
+            return []
+        connection = self.courses.connection()
+        if self.fts and len(fragment) >= 3:
+            # The trigram tokenizer matches any substring of three or more characters. It is case insensitive, so
+            # instr() keeps the match exact like the in-memory index.
+            rows = connection.execute(
+                "SELECT courses.code FROM course_search JOIN courses ON courses.code = course_search.code "
+                "WHERE course_search MATCH ? AND instr(courses.code, ?) > 0 ORDER BY courses.sort_order",
+                ('"' + fragment.replace('"', '""') + '"', fragment))
+        else:
+            rows = connection.execute("SELECT code FROM courses WHERE instr(code, ?) > 0 ORDER BY sort_order",
+                                      (fragment,))
+        return [code for (code,) in rows]
@@ -0,0 +1,117 @@
+"""
+Incremental crawls of KualiCrawler.crawl_experiences() against the benchmarks/kuali_stub.py stand-in of the Kuali API:
+experiences that didn't change since the last crawl must come out of the experience cache without a request, and
+experiences Kuali answers with a 304 must reuse their cached record without being parsed again. A crawl that failed
+part way must be resumed from its checkpoint without fetching the experiences it finished again.
+
+Run with python -m pytest tests or python -m unittest discover tests.
+"""
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+import kuali_crawler
+from kuali_crawler import KualiCrawler, ExperienceCache
+from kuali_stub import StubServer, synthesize
+from synthetic import make_catalog, make_records
+
+EXPERIENCES = 40
+
+
+class CrawlTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.fixtures = os.path.join(self.directory, 'fixtures')
+        synthesize(self.fixtures, EXPERIENCES)
+        self.catalog = make_catalog(EXPERIENCES)
+        self.cache = ExperienceCache(os.path.join(self.directory, 'cache'))
+        self.stub = StubServer(self.fixtures).start()
+        self.addCleanup(self.stub.stop)
+        patcher = mock.patch.object(kuali_crawler, 'API_URL', self.stub.url)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def crawl(self, cache=True, retries=5, **kwargs):
+        with KualiCrawler(workers=4, retries=retries, backoff=0) as crawler:
+            return crawler.crawl_experiences(self.catalog['catalog'], self.cache if cache else None, **kwargs)
+
+    def test_unchanged_experiences_are_not_fetched(self):
+        self.assertEqual(self.crawl(), make_records(self.catalog))
+        titled = len(make_records(self.catalog))
+        self.assertEqual(self.stub.requests, 1 + titled)
+
+        # Only the experience list is requested again
+        self.assertEqual(self.crawl(), make_records(self.catalog))
+        self.assertEqual(self.stub.requests, 2 + titled)
+        self.assertEqual(kuali_crawler.last_crawl_stats['cached'], titled)
+
+        # An experience whose summary changed is fetched again, the others still aren't
+        summaries = self.catalog['experiences']
+        changed = next(summary for summary in summaries if summary['title'])
+        changed['title'] += ' (updated)'
+        with open(os.path.join(self.fixtures, 'experiences', self.catalog['catalog'] + '.json'), 'w') as f:
+            json.dump(summaries, f)
+        self.stub._bodies.clear()
+        records = self.crawl()
+        self.assertEqual(records, make_records(self.catalog))
+        self.assertEqual(self.stub.requests, 4 + titled)
+        self.assertEqual(kuali_crawler.last_crawl_stats['cached'], titled - 1)
+
+    def test_revalidation_window(self):
+        self.crawl()
+        requests = self.stub.requests
+
+        # Once the window of every entry ran out each experience is requested again
+        with mock.patch.object(kuali_crawler, 'CACHE_REVALIDATE_AFTER', 0):
+            self.assertEqual(self.crawl(), make_records(self.catalog))
+        self.assertEqual(self.stub.requests - requests, 1 + len(make_records(self.catalog)))
+        self.assertEqual(kuali_crawler.last_crawl_stats['cached'], 0)
+
+    def test_not_modified_reuses_cached_record(self):
+        self.stub.etags = True
+        self.crawl()
+        cached = {pid: self.cache.get(self.catalog['catalog'], pid) for pid in self.catalog['details']}
+        expected = make_records(self.catalog)
+
+        with mock.patch.object(kuali_crawler, 'CACHE_REVALIDATE_AFTER', 0), \
+                mock.patch.object(kuali_crawler, 'parse_rules', side_effect=AssertionError('parsed again')):
+            self.assertEqual(self.crawl(), expected)
+        self.assertEqual(self.stub.not_modified, len(expected))
+        self.assertEqual(kuali_crawler.last_crawl_stats['not_modified'], len(expected))
+        self.assertEqual(kuali_crawler.last_crawl_stats['parsed'], 0)
+        for pid, entry in cached.items():
+            if entry is not None:
+                self.assertEqual(self.cache.get(self.catalog['catalog'], pid)['content_hash'], entry['content_hash'])
+
+    def test_interrupted_crawl_resumes_from_checkpoint(self):
+        checkpoint_dir = os.path.join(self.directory, 'checkpoints')
+        expected = make_records(self.catalog)
+
+        # Without retries every injected 503 fails its experience, the crawl fails once the others are checkpointed
+        self.stub.error_rate = 0.25
+        with self.assertRaises(kuali_crawler.requests.HTTPError):
+            self.crawl(cache=False, retries=0, checkpoint_dir=checkpoint_dir)
+        failed = self.stub.errors
+        self.assertTrue(0 < failed < len(expected))
+        self.assertTrue(os.path.exists(os.path.join(checkpoint_dir, self.catalog['catalog'] + '.jsonl')))
+
+        # Only the experience list and the failed experiences are requested again
+        self.stub.error_rate = 0
+        requests = self.stub.requests
+        self.assertEqual(self.crawl(cache=False, checkpoint_dir=checkpoint_dir), expected)
+        self.assertEqual(self.stub.requests - requests, 1 + failed)
+        self.assertEqual(kuali_crawler.last_crawl_stats['resumed'], len(expected) - failed)
+        self.assertFalse(os.path.exists(os.path.join(checkpoint_dir, self.catalog['catalog'] + '.jsonl')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+"""
+Round trip of the binary snapshot store: a snapshot written by write_mmap_snapshot() and served by MmapCourseIndex
+must answer every lookup like the CourseIndex of the courses.json snapshot of the same catalog.
+
+Run with python -m pytest tests or python -m unittest discover tests.
+"""
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import kuali_driver as kd
+import mmap_store
+from mmap_store import write_mmap_snapshot, MmapCourseIndex
+
+# Experience records as KualiCrawler.crawl_experiences() returns them. They cover a statement without a course code,
+# a course shared by several certs, providers that only differ in whitespace and case, and non ASCII strings.
+RECORDS = [
+    {'title': 'CompTIA Security+ ', 'provider': 'CompTIA', 'pid': 'b1',
+     'rules': [('IT253', '3'), ('CYB200', '3'), ('IT145', '3')]},
+    {'title': 'CompTIA Network+', 'provider': 'CompTIA ', 'pid': 'a2', 'rules': [('IT253', '3'), ('IT1ELE', '3')]},
+    {'title': 'Linux Essentials', 'provider': 'comptia', 'pid': 'c3', 'rules': [(None, '3'), ('IT2ELE', '3')]},
+    {'title': 'Gestión de Proyectos', 'provider': 'Project Management Institute', 'pid': 'd4',
+     'rules': [('QSO320', '3'), ('MAT240', None), ('QSO10', '3')]},
+    {'title': 'Python Programming', 'provider': 'Straighterline', 'pid': 'e5',
+     'rules': [('IT140', '3'), ('CS200', '3'), ('IT145', '3')]},
+]
+
+SEARCHES = ['', 'IT', 'IT1', 'ELE', '1', '45', 'QSO', 'IT145', 'NOPE', 'it', '\n']
+PROVIDERS = ['CompTIA', 'comptia', ' CompTIA ', 'Project Management Institute', 'Straighterline', 'Nobody', '']
+
+
+def dump_course(course):
+    if course is None:
+        return None
+    return (course.title, course.credits, course.catalog,
+            [(cert.title, cert.provider, cert.pid) for cert in course.Certifications])
+
+
+def dump_cert(cert):
+    if cert is None:
+        return None
+    return cert.title, cert.provider, cert.pid, [dump_course(course) for course in cert.courses]
+
+
+class MmapRoundTripTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.courses, self.certs = kd.build_snapshot('catalog', RECORDS)
+        json_path = os.path.join(self.directory, 'courses.json')
+        kd.write_snapshot(json_path, self.courses, self.certs, 2e9)
+        with mock.patch.object(kd, 'SNAPSHOT_STORE', 'json'):
+            self.expected = kd._open_index(json_path, kd._snapshot_stamp(json_path))
+
+    def open_snapshot(self):
+        path = os.path.join(self.directory, 'courses.bin')
+        write_mmap_snapshot(path, self.courses, self.certs, 2e9)
+        index = MmapCourseIndex(path, kd._snapshot_stamp(path))
+        self.addCleanup(index.snapshot.close)
+        return index
+
+    def assert_same_answers(self, index):
+        expected = self.expected
+        self.assertEqual(list(index.codes()), list(expected.codes()))
+        self.assertEqual(len(index), len(expected))
+        self.assertEqual(index.valid_until, expected.valid_until)
+        for code in list(expected.codes()) + ['null', 'NOPE', None]:
+            self.assertEqual(dump_course(index.get(code)), dump_course(expected.get(code)), code)
+            self.assertEqual(code in index, code in expected, code)
+        for fragment in SEARCHES:
+            self.assertEqual(index.search(fragment), expected.search(fragment), fragment)
+        for pid in list(expected.certs) + ['zz', '']:
+            self.assertEqual(dump_cert(index.get_cert(pid)), dump_cert(expected.get_cert(pid)), pid)
+        for name in PROVIDERS:
+            expected_certs = expected.get_provider(name)
+            certs = index.get_provider(name)
+            self.assertEqual(certs is None, expected_certs is None, name)
+            if certs is not None:
+                self.assertEqual([(cert.title, cert.provider, cert.pid) for cert in certs],
+                                 [(cert.title, cert.provider, cert.pid) for cert in expected_certs], name)
+        self.assertEqual(index.suggest('IT154'), expected.suggest('IT154'))
+
+    def test_round_trip(self):
+        self.assert_same_answers(self.open_snapshot())
+
+    def test_round_trip_swapped(self):
+        # With _NATIVE unset the writer swaps every table to the other byte order and the reader swaps it back, the
+        # path a big endian machine takes
+        with mock.patch.object(mmap_store, '_NATIVE', False):
+            index = self.open_snapshot()
+            self.assertNotIsInstance(index.snapshot.courses, memoryview)
+            self.assert_same_answers(index)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+"""
+SnapshotHistory: versions recorded as a base and deltas against it must load back exactly as they were recorded,
+also after older versions were pruned.
+
+Run with python -m pytest tests or python -m unittest discover tests.
+"""
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import kuali_driver as kd
+from snapshot_history import SnapshotHistory, diff_snapshots
+
+
+def make_records(changed=0, certs=40):
+    """
+    Experience records of a catalog. The first changed certs get a different set of rules, so every value of changed
+    is another version of the same catalog.
+    """
+    records = []
+    for i in range(certs):
+        rules = [(f"IT{100 + (i + j) % 60}", '3') for j in range(3)]
+        if i < changed:
+            rules = [(f"MAT{200 + i}", '3')] + rules[1:]
+        records.append({'title': f"Certification {i}", 'provider': f"Provider {i % 7}", 'pid': f"pid{i:03d}",
+                        'rules': rules})
+    return records
+
+
+def make_snapshot(catalog, records):
+    # Decoded the way the history stores it, e.g. with the course code None as 'null'
+    return json.loads(json.dumps(kd.snapshot_data(*kd.build_snapshot(catalog, records))))
+
+
+class SnapshotHistoryTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.history = SnapshotHistory(self.directory, keep=3)
+
+    def test_record_prune_load(self):
+        snapshots = {}
+        for changed in range(5):
+            snapshot = make_snapshot('fall', make_records(changed))
+            snapshots[self.history.record(snapshot)['id']] = snapshot
+        self.assertEqual(list(snapshots), ['fall-1', 'fall-2', 'fall-3', 'fall-4', 'fall-5'])
+
+        # fall-2 is pruned, fall-1 stays as the base of the kept deltas
+        versions = {entry['id']: entry for entry in self.history.versions()}
+        self.assertEqual(list(versions), ['fall-1', 'fall-3', 'fall-4', 'fall-5'])
+        self.assertIsNone(versions['fall-1']['base'])
+        self.assertEqual([versions[version_id]['base'] for version_id in ('fall-3', 'fall-4', 'fall-5')],
+                         ['fall-1'] * 3)
+        self.assertFalse(os.path.exists(os.path.join(self.directory, 'fall-2.json.gz')))
+        self.assertFalse(os.path.exists(os.path.join(self.directory, 'fall-2.changes.json')))
+        self.assertEqual(self.history.serving, 'fall-5')
+
+        # A new history object reads everything back from disk
+        history = SnapshotHistory(self.directory, keep=3)
+        for version_id in versions:
+            self.assertEqual(history.load(version_id), snapshots[version_id], version_id)
+        with self.assertRaises(ValueError):
+            history.load('fall-2')
+
+        # The feed of changes breaks at the pruned version
+        self.assertIsNone(history.changes('fall-2'))
+        self.assertEqual([change['version'] for change in history.changes('fall-3')], ['fall-4', 'fall-5'])
+
+    def test_identical_snapshot_is_not_recorded(self):
+        entry = self.history.record(make_snapshot('fall', make_records()))
+        snapshot = make_snapshot('fall', make_records())
+        snapshot['created'] += 60
+        self.assertEqual(self.history.record(snapshot), entry)
+        self.assertEqual(len(self.history.versions()), 1)
+
+    def test_new_catalog_and_pin(self):
+        fall = make_snapshot('fall', make_records())
+        self.history.record(fall)
+        self.history.pin('fall-1')
+        for changed in range(4):
+            self.history.record(make_snapshot('spring', make_records(changed)))
+
+        # The pinned version is kept and served past the retention, the new catalog starts its own base
+        versions = {entry['id']: entry for entry in self.history.versions()}
+        self.assertEqual(list(versions), ['fall-1', 'spring-2', 'spring-3', 'spring-4', 'spring-5'])
+        self.assertEqual(versions['spring-5']['base'], 'spring-2')
+        self.assertEqual(self.history.serving, 'fall-1')
+        self.assertEqual(self.history.load('fall-1'), fall)
+
+        # Once unpinned, the fall version is pruned like any other
+        self.assertEqual(self.history.unpin(), 'spring-5')
+        spring = make_snapshot('spring', make_records(5))
+        self.history.record(spring)
+        self.assertEqual([entry['id'] for entry in self.history.versions()],
+                         ['spring-2', 'spring-4', 'spring-5', 'spring-6'])
+        self.assertEqual(self.history.load('spring-6'), spring)
+
+
+class DiffSnapshotsTest(unittest.TestCase):
+    def test_provider_renames(self):
+        def snapshot(providers):
+            return {'courses': {}, 'certs': {pid: {'title': f"Certification {pid}", 'provider': provider, 'courses': []}
+                                             for pid, provider in providers.items()}}
+
+        # A is renamed to B. One of the two certs of C moves to D, E keeps a new cert and G moves to the existing H.
+        changes = diff_snapshots(snapshot({'1': 'A', '2': 'A', '3': 'C', '4': 'C', '5': 'E', '7': 'G', '8': 'H'}),
+                                 snapshot({'1': 'B', '2': 'B', '3': 'D', '4': 'C', '5': 'F', '6': 'E', '7': 'H'}))
+        self.assertEqual(changes['renamed_providers'], [{'from': 'A', 'to': 'B'}])
+        self.assertEqual([(change['pid'], change['from'], change['to']) for change in changes['changed_providers']],
+                         [('3', 'C', 'D'), ('5', 'E', 'F'), ('7', 'G', 'H')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+"""
+Parity of the snapshot stores: the SQLite and the binary snapshot of a catalog must answer every lookup like the
+CourseIndex of its courses.json snapshot, also for certs that no course links to.
+
+Run with python -m pytest tests or python -m unittest discover tests.
+"""
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import kuali_driver as kd
+
+# Experience records as KualiCrawler.crawl_experiences() returns them. Besides certs sharing courses they cover a cert
+# without any rules, one whose only statement has no course code and a provider that only has such certs.
+RECORDS = [
+    {'title': 'CompTIA Security+', 'provider': 'CompTIA', 'pid': 'b1', 'rules': [('IT253', '3'), ('CYB200', '3')]},
+    {'title': 'CompTIA Network+', 'provider': 'CompTIA', 'pid': 'a2', 'rules': [('IT253', '3'), ('IT1ELE', '3')]},
+    {'title': 'CompTIA Cloud+', 'provider': 'CompTIA', 'pid': 'c3', 'rules': []},
+    {'title': 'Portfolio Review', 'provider': 'SNHU', 'pid': 'd4', 'rules': [(None, '12')]},
+    {'title': 'Agile Foundations', 'provider': 'Scrum Alliance', 'pid': 'e5', 'rules': []},
+]
+
+PIDS = ['a2', 'b1', 'c3', 'd4', 'e5', 'zz']
+PROVIDERS = ['CompTIA', 'comptia', 'SNHU', 'Scrum Alliance', 'scrum  alliance', 'Nobody']
+
+
+def dump_course(course):
+    if course is None:
+        return None
+    return (course.title, course.credits, course.catalog,
+            [(cert.title, cert.provider, cert.pid) for cert in course.Certifications])
+
+
+def dump_cert(cert):
+    if cert is None:
+        return None
+    return cert.title, cert.provider, cert.pid, [dump_course(course) for course in cert.courses]
+
+
+def dump_provider(certs):
+    if certs is None:
+        return None
+    return [(cert.title, cert.provider, cert.pid) for cert in certs]
+
+
+class StoreParityTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.courses, self.certs = kd.build_snapshot('catalog', RECORDS)
+        self.expected = self.open_store('json')
+
+    def open_store(self, store):
+        path = os.path.join(self.directory, kd.SNAPSHOT_FILES.get(store, 'courses.json'))
+        with mock.patch.object(kd, 'SNAPSHOT_STORE', store):
+            kd._save_snapshot(path, self.courses, self.certs, 2e9)
+            index = kd._open_index(path, kd._snapshot_stamp(path))
+        if store == 'sqlite':
+            self.addCleanup(index.close)
+        elif store == 'mmap':
+            self.addCleanup(index.snapshot.close)
+        return index
+
+    def assert_same_answers(self, store):
+        index = self.open_store(store)
+        expected = self.expected
+        self.assertEqual(list(index.codes()), list(expected.codes()))
+        for code in list(expected.codes()) + ['null', 'NOPE']:
+            self.assertEqual(dump_course(index.get(code)), dump_course(expected.get(code)), code)
+        for pid in PIDS:
+            self.assertEqual(dump_cert(index.get_cert(pid)), dump_cert(expected.get_cert(pid)), pid)
+        for name in PROVIDERS:
+            self.assertEqual(dump_provider(index.get_provider(name)), dump_provider(expected.get_provider(name)), name)
+
+    def test_certs_without_courses(self):
+        expected = self.expected
+        self.assertEqual(dump_cert(expected.get_cert('c3')), ('CompTIA Cloud+', 'CompTIA', 'c3', []))
+        self.assertEqual(dump_provider(expected.get_provider('scrum alliance')),
+                         [('Agile Foundations', 'Scrum Alliance', 'e5')])
+
+    def test_sqlite(self):
+        self.assert_same_answers('sqlite')
+
+    def test_mmap(self):
+        self.assert_same_answers('mmap')
+
+
+if __name__ == '__main__':
+    unittest.main()